@@ -0,0 +1,29 @@
+"""Hidden flags for moderation
+
+Revision ID: 3d9b0c7e41a6
+Revises: e8a2f6c3b190
+Create Date: 2026-10-19 19:02:11.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9b0c7e41a6'
+down_revision: Union[str, None] = 'e8a2f6c3b190'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default does not rewrite the tables
+    op.add_column('pictures', sa.Column('hidden', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.add_column('comments', sa.Column('hidden', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('comments', 'hidden')
+    op.drop_column('pictures', 'hidden')
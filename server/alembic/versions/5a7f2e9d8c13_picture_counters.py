@@ -0,0 +1,39 @@
+"""View and like counters on pictures
+
+Revision ID: 5a7f2e9d8c13
+Revises: 3d9b0c7e41a6
+Create Date: 2026-10-19 21:36:52.084417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a7f2e9d8c13'
+down_revision: Union[str, None] = '3d9b0c7e41a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default does not rewrite the table
+    op.add_column('pictures', sa.Column('view_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('pictures', sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_table(
+        'picture_likes',
+        sa.Column('picture_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['picture_id'], ['pictures.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('picture_id', 'user_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('picture_likes')
+    op.drop_column('pictures', 'like_count')
+    op.drop_column('pictures', 'view_count')
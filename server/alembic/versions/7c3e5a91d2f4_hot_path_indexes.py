@@ -0,0 +1,53 @@
+"""Indexes for hot query predicates
+
+Revision ID: 7c3e5a91d2f4
+Revises: 0895ac8e730d
+Create Date: 2026-10-19 10:42:13.518204
+
+Indexes are built with CREATE INDEX CONCURRENTLY, so the tables stay writable while they build.
+Concurrent builds cannot run in a transaction, hence the autocommit blocks. A build that fails
+leaves an INVALID index behind; drop it before running the migration again.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3e5a91d2f4'
+down_revision: Union[str, None] = '0895ac8e730d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns, unique), matching the indexes declared on the models
+INDEXES = (
+    ('ix_users_email', 'users', ['email'], True),
+    ('ix_pictures_user_id_created_at', 'pictures', ['user_id', 'created_at'], False),
+    ('ix_pictures_created_at', 'pictures', ['created_at'], False),
+    ('ix_comments_picture_id_created_at_id', 'comments', ['picture_id', 'created_at', 'id'], False),
+    ('ix_comments_user_id', 'comments', ['user_id'], False),
+    ('ix_tags_pictures_tag_id_picture_id', 'tags_pictures', ['tag_id', 'picture_id'], False),
+)
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            op.create_index(name, table, columns, unique=unique, if_not_exists=True,
+                            postgresql_concurrently=True)
+        # Comments are never looked up by their text; the b-tree only slowed down writes
+        op.drop_index('ix_comments_text', table_name='comments', if_exists=True,
+                      postgresql_concurrently=True)
+    # ix_users_email enforces uniqueness now, the constraint from the initial migration is redundant
+    op.execute('ALTER TABLE users DROP CONSTRAINT IF EXISTS users_email_key')
+
+
+def downgrade() -> None:
+    op.create_unique_constraint('users_email_key', 'users', ['email'])
+    with op.get_context().autocommit_block():
+        op.create_index('ix_comments_text', 'comments', ['text'], unique=False, if_not_exists=True,
+                        postgresql_concurrently=True)
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,33 @@
+"""Denormalized comment count on pictures
+
+Revision ID: b41d07e9c5a2
+Revises: 7c3e5a91d2f4
+Create Date: 2026-10-19 14:05:37.902113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41d07e9c5a2'
+down_revision: Union[str, None] = '7c3e5a91d2f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default does not rewrite the table
+    op.add_column('pictures', sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+    # Only pictures with comments are touched; the grouped count reads ix_comments_picture_id_created_at_id
+    op.execute(
+        'UPDATE pictures SET comment_count = counts.total '
+        'FROM (SELECT picture_id, count(*) AS total FROM comments GROUP BY picture_id) AS counts '
+        'WHERE pictures.id = counts.picture_id'
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('pictures', 'comment_count')
@@ -0,0 +1,39 @@
+"""Threaded comments with materialized paths
+
+Revision ID: e8a2f6c3b190
+Revises: b41d07e9c5a2
+Create Date: 2026-10-19 17:21:48.330571
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8a2f6c3b190'
+down_revision: Union[str, None] = 'b41d07e9c5a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('comments', sa.Column('parent_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('comments_parent_id_fkey', 'comments', 'comments', ['parent_id'], ['id'],
+                          ondelete='CASCADE')
+    op.add_column('comments', sa.Column('path', sa.String(length=255, collation='C'), nullable=True))
+    # Existing comments become thread roots; the path is the zero-padded id
+    op.execute("UPDATE comments SET path = lpad(id::text, 10, '0')")
+    with op.get_context().autocommit_block():
+        op.create_index('ix_comments_picture_id_path', 'comments', ['picture_id', 'path'], unique=False,
+                        if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_comments_picture_id_path', table_name='comments', if_exists=True,
+                      postgresql_concurrently=True)
+    op.drop_column('comments', 'path')
+    op.drop_constraint('comments_parent_id_fkey', 'comments', type_='foreignkey')
+    op.drop_column('comments', 'parent_id')
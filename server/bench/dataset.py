@@ -0,0 +1,225 @@
+"""
+Seed a database with a reproducible synthetic dataset.
+
+Usage: ``python -m bench.dataset --db-url URL [--scale small|medium|large] [--seed N] [--reset]``
+
+The same seed and sizes always produce the same rows. Postgres is loaded with ``COPY``, other
+databases with batched ``executemany`` inserts. All users share the password ``BENCH_PASSWORD``;
+user ``n`` has the email ``user{n}@bench.local``.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Iterator
+
+import bcrypt
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from src.database.models import Base, Comment, Picture, Tag, User, tags_pictures
+
+BENCH_PASSWORD = "bench-password"
+PATH_SEGMENT_WIDTH = 10
+BATCH_SIZE = 10_000
+EPOCH = datetime(2024, 1, 1)
+
+WORDS = (
+    "sunset beach mountain city street portrait night river forest snow desert bridge market "
+    "harbor garden rain autumn spring summer winter cat dog bird flower coffee train road lake "
+    "skyline window light shadow festival concert family friends travel food architecture"
+).split()
+
+
+@dataclass(frozen=True)
+class DatasetSize:
+    users: int
+    pictures: int
+    tags: int
+    tag_links: int
+    comments: int
+
+
+SCALES = {
+    "tiny": DatasetSize(users=20, pictures=200, tags=20, tag_links=600, comments=1_000),
+    "small": DatasetSize(users=1_000, pictures=20_000, tags=200, tag_links=80_000, comments=200_000),
+    "medium": DatasetSize(users=10_000, pictures=500_000, tags=2_000, tag_links=2_000_000, comments=5_000_000),
+    "large": DatasetSize(users=100_000, pictures=5_000_000, tags=10_000, tag_links=20_000_000,
+                         comments=50_000_000),
+}
+
+
+def _timestamp(rng: random.Random) -> datetime:
+    return EPOCH + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def tag_name(n: int) -> str:
+    """
+    Name of tag ``n``; the first tags are plain words so searches by tag look realistic.
+    """
+    return WORDS[n - 1] if n <= len(WORDS) else f"{WORDS[n % len(WORDS)]}{n}"
+
+
+def generate(table: str, size: DatasetSize, seed: int) -> Iterator[dict]:
+    """
+    Generate the rows of one table.
+
+    Every table uses its own random stream, so a table can be regenerated independently.
+
+    :param table: Table name.
+    :param size: Dataset size.
+    :param seed: Random seed.
+    :return: Rows as dicts keyed by column name.
+    """
+    rng = random.Random(f"{seed}:{table}")
+    if table == "users":
+        password = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt(4)).decode()
+        for n in range(1, size.users + 1):
+            created = _timestamp(rng)
+            yield {"id": n, "username": f"user{n}", "email": f"user{n}@bench.local", "password": password,
+                   "role": "admin" if n == 1 else "user", "confirmed": True, "created_at": created,
+                   "updated_at": created}
+    elif table == "tags":
+        for n in range(1, size.tags + 1):
+            yield {"id": n, "name": tag_name(n)}
+    elif table == "pictures":
+        for n in range(1, size.pictures + 1):
+            created = _timestamp(rng)
+            yield {"id": n, "image_url": f"https://bench.local/pictures/{n}.jpg",
+                   "description": _sentence(rng, rng.randint(3, 12)), "user_id": rng.randint(1, size.users),
+                   "created_at": created, "updated_at": created}
+    elif table == "tags_pictures":
+        # Distinct (picture, tag) pairs: each picture gets consecutive tags from a random start.
+        per_picture, extra = divmod(size.tag_links, size.pictures)
+        for picture_id in range(1, size.pictures + 1):
+            count = min(size.tags, per_picture + (1 if picture_id <= extra else 0))
+            start = rng.randrange(size.tags)
+            for offset in range(count):
+                yield {"picture_id": picture_id, "tag_id": (start + offset) % size.tags + 1}
+    elif table == "comments":
+        for n in range(1, size.comments + 1):
+            created = _timestamp(rng)
+            # Skewed towards low picture ids so some pictures have long comment lists.
+            picture_id = min(size.pictures, int(rng.paretovariate(1.2)) if rng.random() < 0.3
+                             else rng.randint(1, size.pictures))
+            # Every seeded comment is a thread root; its path is the id as CommentRepository pads it
+            yield {"id": n, "text": _sentence(rng, rng.randint(2, 20)), "user_id": rng.randint(1, size.users),
+                   "picture_id": picture_id, "path": str(n).zfill(PATH_SEGMENT_WIDTH), "created_at": created, "updated_at": created}
+    else:
+        raise ValueError(f"Unknown table {table}")
+
+
+TABLES = (("users", User.__table__), ("tags", Tag.__table__), ("pictures", Picture.__table__),
+          ("tags_pictures", tags_pictures), ("comments", Comment.__table__))
+
+
+def _batches(rows: Iterator[dict], size: int) -> Iterator[list[dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _copy(engine: AsyncEngine, name: str, rows: Iterator[dict]) -> int:
+    count = 0
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        driver = raw.driver_connection
+        for batch in _batches(rows, BATCH_SIZE):
+            columns = list(batch[0])
+            await driver.copy_records_to_table(name, records=[tuple(row[c] for c in columns) for row in batch],
+                                               columns=columns)
+            count += len(batch)
+    return count
+
+
+async def _executemany(engine: AsyncEngine, table, rows: Iterator[dict]) -> int:
+    count = 0
+    for batch in _batches(rows, BATCH_SIZE):
+        async with engine.begin() as conn:
+            await conn.execute(insert(table), batch)
+        count += len(batch)
+    return count
+
+
+async def seed(engine: AsyncEngine, size: DatasetSize, seed: int = 42, reset: bool = False) -> dict:
+    """
+    Create the schema and load the dataset unless the database already holds it.
+
+    :param engine: Engine of the target database.
+    :param size: Dataset size.
+    :param seed: Random seed.
+    :param reset: Drop and recreate all tables first.
+    :return: Row counts and load time per table.
+    """
+    async with engine.begin() as conn:
+        if reset:
+            await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        users = (await conn.execute(select(func.count()).select_from(User.__table__))).scalar()
+    if users:
+        return {"skipped": f"database already holds {users} users"}
+
+    postgres = engine.dialect.name == "postgresql"
+    report = {}
+    for name, table in TABLES:
+        start = time.perf_counter()
+        rows = generate(name, size, seed)
+        count = await (_copy(engine, name, rows) if postgres else _executemany(engine, table, rows))
+        report[name] = {"rows": count, "seconds": round(time.perf_counter() - start, 2)}
+    start = time.perf_counter()
+    async with engine.begin() as conn:
+        counts = (select(Comment.picture_id, func.count().label("total"))
+                  .group_by(Comment.picture_id).subquery())
+        await conn.execute(update(Picture.__table__).where(Picture.id == counts.c.picture_id)
+                           .values(comment_count=counts.c.total))
+    report["comment_counts"] = {"seconds": round(time.perf_counter() - start, 2)}
+    if postgres:
+        async with engine.begin() as conn:
+            for name in ("users", "tags", "pictures", "comments"):
+                await conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                                        f"(SELECT max(id) FROM {name}))"))
+            await conn.execute(text("ANALYZE"))
+    return report
+
+
+def parse_size(args) -> DatasetSize:
+    size = SCALES[args.scale]
+    overrides = {field: getattr(args, field) for field in asdict(size) if getattr(args, field, None)}
+    return DatasetSize(**{**asdict(size), **overrides})
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    for field in asdict(SCALES["small"]):
+        parser.add_argument(f"--{field.replace('_', '-')}", dest=field, type=int, default=None,
+                            help=f"Override the number of {field.replace('_', ' ')}")
+
+
+async def main(args):
+    engine = create_async_engine(args.db_url)
+    try:
+        report = await seed(engine, parse_size(args), args.seed, args.reset)
+    finally:
+        await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-url", required=True)
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    add_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
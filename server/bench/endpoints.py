@@ -0,0 +1,276 @@
+"""
+Benchmark the API in-process against a seeded dataset.
+
+Usage: ``python -m bench.endpoints [--db-url URL] [--scale tiny|small|medium|large] [--requests N]
+[--concurrency N] [--scenarios search,get_picture,...] [--output FILE] [--baseline FILE]``
+
+The database is seeded on first use (see ``bench.dataset``); the default is a SQLite file in the
+working directory. The real application is driven through httpx's ASGI transport in the ``local``
+service profile (in-memory Redis, filesystem storage, captured mail) with rate limits disabled.
+``--faults`` injects latency and errors into those services, e.g.
+``--faults '{"redis": {"latency_ms": 5}, "storage": {"latency_ms": 200, "error_rate": 0.01}}'``.
+
+Results are printed as JSON; with ``--baseline`` they are compared against an earlier result and
+the exit status is 1 when a scenario regressed beyond ``--max-regression``.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from bench import dataset
+
+SCENARIOS = ("search", "get_picture", "comments", "login", "upload")
+
+# Smallest valid PNG, used as upload payload.
+PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082"
+)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values) + 0.5) - 1))]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0,
+        **{f"p{q}_ms": round(percentile(ms, q), 3) for q in (50, 90, 95, 99)},
+        "max_ms": round(ms[-1], 3) if ms else 0.0,
+    }
+
+
+class Workload:
+    """
+    Request factory for the benchmark scenarios, driven by a seeded random stream.
+    """
+
+    def __init__(self, size: dataset.DatasetSize, seed: int):
+        self.size = size
+        self.rng = random.Random(f"{seed}:workload")
+
+    def request(self, scenario: str, token: str) -> dict:
+        rng = self.rng
+        auth = {"Authorization": f"Bearer {token}"}
+        if scenario == "search":
+            params = {"page": rng.randint(1, 5)}
+            choice = rng.random()
+            if choice < 0.5:
+                params["search_term"] = rng.choice(dataset.WORDS)
+            elif choice < 0.8:
+                params["tag"] = dataset.tag_name(rng.randint(1, min(self.size.tags, len(dataset.WORDS))))
+            else:
+                params["user_id"] = rng.randint(1, self.size.users)
+            return {"method": "GET", "url": "/api/photos/search", "params": params}
+        if scenario == "get_picture":
+            return {"method": "GET", "url": f"/api/photos/{rng.randint(1, self.size.pictures)}", "headers": auth}
+        if scenario == "comments":
+            # Mix of the long comment lists of popular pictures and random ones.
+            picture_id = rng.randint(1, 10) if rng.random() < 0.3 else rng.randint(1, self.size.pictures)
+            return {"method": "GET", "url": f"/api/comments/photos/{picture_id}/comments",
+                    "params": {"skip": rng.choice((0, 0, 10, 50)), "limit": 10}}
+        if scenario == "login":
+            user = rng.randint(1, self.size.users)
+            return {"method": "POST", "url": "/api/auth/login",
+                    "data": {"username": f"user{user}@bench.local", "password": dataset.BENCH_PASSWORD}}
+        if scenario == "upload":
+            tags = ",".join(rng.sample(dataset.WORDS, 3))
+            return {"method": "POST", "url": "/api/photos/", "headers": auth,
+                    "data": {"description": "bench upload", "tags": tags},
+                    "files": {"file": ("bench.png", PNG, "image/png")}}
+        raise ValueError(f"Unknown scenario {scenario}")
+
+
+async def run_scenario(client, workload: Workload, scenario: str, token: str, requests: int,
+                       concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            request = workload.request(scenario, token)
+            start = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> dict:
+    """
+    Compare scenario results against a baseline.
+
+    :param results: Current results.
+    :param baseline: Baseline results in the same format.
+    :param max_regression: Allowed relative growth of p95 latency, e.g. 0.2 for 20%.
+    :return: Relative changes per scenario and the list of regressed scenarios.
+    """
+    changes, regressions = {}, []
+    for scenario, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(scenario)
+        if not previous:
+            continue
+        change = {}
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            if previous.get(metric):
+                change[metric] = round(current[metric] / previous[metric] - 1, 3)
+        changes[scenario] = change
+        if change.get("p95_ms", 0) > max_regression or current["errors"] > previous.get("errors", 0):
+            regressions.append(scenario)
+    return {"changes": changes, "regressions": regressions}
+
+
+def use_local_profile(db_url: str) -> None:
+    """
+    Point the application at a database and the local service profile.
+
+    Must run before the application is imported, because the settings are read at import.
+    """
+    os.environ["DB_URL"] = db_url
+    os.environ["SERVICE_PROFILE"] = "local"
+    os.environ.setdefault("LOCAL_STORAGE_DIR", tempfile.mkdtemp(prefix="bench-storage-"))
+
+
+@contextlib.asynccontextmanager
+async def local_app(args, size: dataset.DatasetSize):
+    """
+    Seed the database and start the application in the local profile without rate limits.
+
+    :param args: Parsed arguments with ``db_url``, ``seed``, ``reset`` and ``faults``.
+    :param size: Dataset size.
+    :return: The application and the seeding report.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from main import app
+    from src.conf.config import config, FaultRule
+    from src.database.cache import redis_manager
+    from src.database.db import sessionmanager
+    from src.services.auth import auth_service
+    from src.services.rate_limit import rate_limiter
+
+    engine = create_async_engine(args.db_url)
+    try:
+        seeded = await dataset.seed(engine, size, args.seed, args.reset)
+    finally:
+        await engine.dispose()
+
+    redis_client = await redis_manager.connect()
+    auth_service.init(redis_client)
+    rate_limiter.init(redis_client)
+    sessionmanager.sticky.init(redis_client)
+    config.RATE_LIMIT_ENABLED = False
+    config.LOCAL_FAULTS = {service: FaultRule(**rule) for service, rule in json.loads(args.faults).items()}
+    try:
+        yield app, seeded
+    finally:
+        await redis_manager.close()
+        await sessionmanager.close()
+
+
+async def login(client) -> str:
+    """
+    Log in as the seeded admin user.
+
+    :return: The access token.
+    """
+    response = await client.post("/api/auth/login", data={"username": "user1@bench.local",
+                                                          "password": dataset.BENCH_PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def run(app, args, size: dataset.DatasetSize, seeded: dict) -> dict:
+    import httpx
+
+    scenarios = args.scenarios.split(",")
+    results = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "database": args.db_url.split(":", 1)[0],
+            "dataset": {"scale": args.scale, "seed": args.seed, **dataset.asdict(size)},
+            "seeding": seeded,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "faults": json.loads(args.faults),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "scenarios": {},
+    }
+    workload = Workload(size, args.seed)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        token = await login(client)
+        for scenario in scenarios:
+            await run_scenario(client, workload, scenario, token, min(args.warmup, args.requests), args.concurrency)
+            results["scenarios"][scenario] = await run_scenario(client, workload, scenario, token, args.requests,
+                                                                args.concurrency)
+    return results
+
+
+async def main(args) -> int:
+    size = dataset.parse_size(args)
+    async with local_app(args, size) as (app, seeded):
+        results = await run(app, args, size, seeded)
+
+    status = 0
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            results["comparison"] = compare(results, json.load(file), args.max_regression)
+        status = 1 if results["comparison"]["regressions"] else 0
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    print(output)
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///bench.db")
+    parser.add_argument("--reset", action="store_true", help="Drop and reseed the database")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="Untimed requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--output", help="Also write the results to this file, e.g. to store a baseline")
+    parser.add_argument("--baseline", help="Compare against results stored earlier")
+    parser.add_argument("--faults", default="{}", help="JSON object of latency/error rules per local service")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed relative p95 latency growth before a scenario counts as regressed")
+    dataset.add_arguments(parser)
+    arguments = parser.parse_args()
+    use_local_profile(arguments.db_url)
+    sys.exit(asyncio.run(main(arguments)))
@@ -0,0 +1,284 @@
+"""
+Index advisor: explain every repository query against a seeded dataset and report sequential scans.
+
+Usage: ``python -m bench.explain [--db-url URL] [--scale tiny|small|medium|large] [--min-rows N]
+[--output FILE]``
+
+The repository functions are called with ids of the seeded dataset (see ``bench.dataset``) while
+the SQL they send is recorded. Write paths run too, inside a transaction that is rolled back at
+the end, so the dataset is left untouched. Every distinct statement is then run through
+``EXPLAIN (FORMAT JSON)`` on Postgres or ``EXPLAIN QUERY PLAN`` on SQLite.
+
+Sequential scans of tables with fewer than ``--min-rows`` rows are ignored, and some scans are
+expected, e.g. listing all users or substring search in descriptions. The exit status is 1 when
+any other sequential scan is found, so the tool can guard migrations in CI. Planners only choose
+index scans on tables of realistic size; use at least the ``small`` scale, on Postgres ideally.
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+from typing import AsyncIterator, Awaitable, Callable, NamedTuple
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from bench import dataset
+from bench.endpoints import PNG, use_local_profile
+from src.database.models import Base
+
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+class Case(NamedTuple):
+    name: str
+    call: Callable[[AsyncSession], Awaitable]
+    # Tables the query has to read in full by design
+    expected_scans: tuple = ()
+
+
+def cases(size: dataset.DatasetSize) -> list[Case]:
+    """
+    Calls of every repository function with arguments hitting the seeded dataset.
+    """
+    from src.database.models import Comment, Role, User
+    from src.repository import users as repository_users
+    from src.repository.comments import CommentRepository
+    from src.repository.photos import PictureRepository
+    from src.schemas.comments import CommentCreate, CommentUpdate
+    from src.schemas.moderation import CommentModeration, PictureModeration
+    from src.schemas.user import UserSchema
+
+    email = "user2@bench.local"
+    tag = dataset.tag_name(1)
+
+    async def admin(db):
+        return (await db.execute(select(User).filter_by(id=1))).scalar_one()
+
+    async def post_and_resize(db):
+        picture = await PictureRepository.post_picture("explained", [tag, "explain-new-tag"], PNG, 1, db)
+        await PictureRepository.resize_picture(picture.id, {"width": 100}, 1, db)
+        await PictureRepository.create_qrcode(picture.id, db)
+
+    async def comment_lifecycle(db):
+        comment = await CommentRepository.create_comment(db, CommentCreate(text="explained"), 1, 1)
+        await CommentRepository.update_comment(db, comment.id, CommentUpdate(text="explained again"), 1)
+        await CommentRepository.delete_comment(db, comment.id)
+
+    return [
+        Case("users.get_user_by_email", lambda db: repository_users.get_user_by_email(email, db)),
+        Case("users.get_user_by_id", lambda db: repository_users.get_user_by_id(2, db)),
+        Case("users.get_users", lambda db: repository_users.get_users(db, after=1)),
+        Case("users.stream_users", lambda db: _drain(repository_users.stream_users(db, role=Role.user)),
+             ("users",)),
+        Case("users.create_user", lambda db: repository_users.create_user(
+            UserSchema(username="explain", email="explain@example.com", password="secret1"), db)),
+        Case("users.update_token", lambda db: _then(admin(db), lambda user: repository_users.update_token(
+            user, "token", db))),
+        Case("users.confirmed_email", lambda db: repository_users.confirmed_email(email, db)),
+        Case("users.update_avatar_url", lambda db: repository_users.update_avatar_url(email, "avatar", db)),
+        Case("users.update_user_role", lambda db: repository_users.update_user_role(2, Role.moderator, db)),
+        Case("photos.get_picture", lambda db: PictureRepository.get_picture(1, db)),
+        Case("photos.get_tags", lambda db: PictureRepository.get_tags(1, 1, db)),
+        Case("photos.search_pictures", lambda db: PictureRepository.search_pictures(db)),
+        Case("photos.search_pictures(search_term)", lambda db: PictureRepository.search_pictures(
+            db, search_term=dataset.WORDS[0]), ("pictures",)),
+        Case("photos.search_pictures(tag)", lambda db: PictureRepository.search_pictures(db, tag=tag)),
+        Case("photos.search_pictures(user_id)", lambda db: PictureRepository.search_pictures(db, user_id=2)),
+        Case("photos.search_pictures(page)", lambda db: PictureRepository.search_pictures(db, page=5)),
+        Case("photos.update_picture", lambda db: _then(admin(db), lambda user: PictureRepository.update_picture(
+            1, "explained", [tag], user, db))),
+        Case("photos.post_picture+resize+qrcode", post_and_resize),
+        Case("photos.delete_picture", lambda db: _then(admin(db), lambda user: PictureRepository.delete_picture(
+            size.pictures, db, user))),
+        Case("comments.get_comments", lambda db: CommentRepository.get_comments(db, 1, 0, 10)),
+        Case("comments.get_comment_previews", lambda db: CommentRepository.get_comment_previews(
+            db, list(range(1, 11)))),
+        Case("comments.get_threads", lambda db: CommentRepository.get_threads(db, 1)),
+        Case("comments.get_replies", lambda db: _then(db.get(Comment, 1), lambda comment: (
+            CommentRepository.get_replies(db, comment)))),
+        Case("comments.create+update+delete", comment_lifecycle),
+        Case("comments.moderate_comments", lambda db: CommentRepository.moderate_comments(
+            db, CommentModeration(action="hide", user_id=2))),
+        Case("photos.stream_metadata", lambda db: _drain(PictureRepository.stream_metadata(db)), ("pictures",)),
+        Case("photos.moderate_pictures", lambda db: PictureRepository.moderate_pictures(
+            db, PictureModeration(action="hide", user_id=2))),
+    ]
+
+
+async def _then(first: Awaitable, then: Callable[..., Awaitable]):
+    return await then(await first)
+
+
+async def _drain(batches: AsyncIterator):
+    async for _ in batches:
+        pass
+
+
+def plan_scans(dialect: str, plan) -> list[str]:
+    """
+    Tables read by sequential scans in a query plan.
+
+    :param dialect: ``postgresql`` or ``sqlite``.
+    :param plan: The ``EXPLAIN (FORMAT JSON)`` document or the ``EXPLAIN QUERY PLAN`` rows.
+    :return: Names of the scanned tables.
+    """
+    if dialect == "postgresql":
+        scans, nodes = [], [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            if node["Node Type"] == "Seq Scan":
+                scans.append(node["Relation Name"])
+            nodes.extend(node.get("Plans", ()))
+        return scans
+    # "SCAN table" is a full table scan, "SCAN table USING INDEX ..." walks an index in order.
+    # SQLite names aliased tables by their alias, e.g. tags_pictures_1; subqueries are anon_1.
+    # Nested joins, as joinedload emits for many-to-many relationships, are materialized by
+    # SQLite and always scanned; Postgres flattens them and no index would help, so skip them.
+    details = {row[0]: row[-1] for row in plan}
+    scans = []
+    for row in plan:
+        match = SQLITE_SCAN.match(row[-1])
+        if match and not details.get(row[1], "").startswith("MATERIALIZE"):
+            name = match[1] if match[1] in Base.metadata.tables else re.sub(r"_\d+$", "", match[1])
+            if name in Base.metadata.tables:
+                scans.append(name)
+    return scans
+
+
+async def explain(conn, statement: str, parameters):
+    if conn.dialect.name == "postgresql":
+        result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+        document = result.scalar()
+        return json.loads(document) if isinstance(document, str) else document
+    result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    return [tuple(row) for row in result]
+
+
+async def table_rows(conn, tables) -> dict[str, int]:
+    if conn.dialect.name == "postgresql":
+        # Planner estimates, counting the large tables would take minutes
+        result = await conn.execute(text("SELECT relname, reltuples::bigint FROM pg_class WHERE relkind = 'r'"))
+        estimates = dict(result.all())
+        return {table: max(0, estimates.get(table, 0)) for table in tables}
+    return {table: (await conn.execute(select(func.count()).select_from(text(table)))).scalar() for table in tables}
+
+
+async def advise(engine, size: dataset.DatasetSize, min_rows: int) -> dict:
+    """
+    Record the statements of all repository calls and explain them.
+
+    :param engine: Engine of the seeded database.
+    :param size: Dataset size, to pick ids that exist.
+    :param min_rows: Ignore sequential scans of tables smaller than this.
+    :return: The report with one entry per distinct statement.
+    """
+    statements: dict[str, dict] = {}
+    current = [None]
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if current[0] is None:
+            return
+        entry = statements.setdefault(statement, {"cases": [], "parameters": parameters[0] if executemany
+                                                  else parameters})
+        if current[0] not in entry["cases"]:
+            entry["cases"].append(current[0])
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        failed = {}
+        try:
+            # Commits in the repository release savepoints; the outer transaction is rolled back
+            async with AsyncSession(bind=conn, join_transaction_mode="create_savepoint",
+                                    expire_on_commit=False) as db:
+                for case in cases(size):
+                    current[0] = case.name
+                    try:
+                        await case.call(db)
+                    except Exception as error:
+                        failed[case.name] = repr(error)
+                        await db.rollback()
+        finally:
+            current[0] = None
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+        expected = {case.name: set(case.expected_scans) for case in cases(size)}
+        report, scanned = [], set()
+        for statement, entry in statements.items():
+            item = {"statement": " ".join(statement.split()), "cases": entry["cases"]}
+            try:
+                plan = await explain(conn, statement, entry["parameters"])
+            except Exception as error:
+                item["error"] = repr(error)
+            else:
+                item["plan"] = plan
+                item["seq_scans"] = plan_scans(conn.dialect.name, plan)
+                scanned.update(item["seq_scans"])
+            report.append(item)
+        rows = await table_rows(conn, scanned)
+        await transaction.rollback()
+
+    findings = []
+    for item in report:
+        allowed = set.intersection(*(expected[name] for name in item["cases"]))
+        for table in item.get("seq_scans", ()):
+            if rows[table] < min_rows:
+                status = "small table"
+            elif table in allowed:
+                status = "expected"
+            else:
+                status = "missing index"
+            findings.append({"table": table, "rows": rows[table], "status": status, "cases": item["cases"],
+                             "statement": item["statement"]})
+    return {"dialect": engine.dialect.name, "statements": len(report), "failed_cases": failed,
+            "findings": findings, "plans": report}
+
+
+def _sqlite_transactions(engine) -> None:
+    # pysqlite defers BEGIN to the first write, so the rollback would not undo the savepoints the
+    # repository commits release; let SQLAlchemy emit BEGIN itself instead.
+    @event.listens_for(engine.sync_engine, "connect")
+    def connect(dbapi_connection, record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
+async def main(args) -> int:
+    size = dataset.parse_size(args)
+    engine = create_async_engine(args.db_url)
+    if engine.dialect.name == "sqlite":
+        _sqlite_transactions(engine)
+    try:
+        seeded = await dataset.seed(engine, size, args.seed, args.reset)
+        report = await advise(engine, size, args.min_rows)
+    finally:
+        await engine.dispose()
+
+    report = {"meta": {"database": args.db_url.split(":", 1)[0], "dataset": dataset.asdict(size),
+                       "seeding": seeded, "min_rows": args.min_rows}, **report}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, default=str)
+    if not args.plans:
+        report.pop("plans")
+    print(json.dumps(report, indent=2, default=str))
+    return 1 if any(finding["status"] == "missing index" for finding in report["findings"]) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///bench.db")
+    parser.add_argument("--reset", action="store_true", help="Drop and reseed the database")
+    parser.add_argument("--min-rows", type=int, default=1000,
+                        help="Ignore sequential scans of tables with fewer rows")
+    parser.add_argument("--plans", action="store_true", help="Print the full plans, not only the findings")
+    parser.add_argument("--output", help="Also write the report with all plans to this file")
+    dataset.add_arguments(parser)
+    arguments = parser.parse_args()
+    use_local_profile(arguments.db_url)
+    sys.exit(asyncio.run(main(arguments)))
@@ -0,0 +1,79 @@
+"""
+Measure the per-request overhead of the rate limiting dependency.
+
+Usage: ``python -m bench.rate_limit_overhead [--requests N] [--redis-url URL]``
+
+Without ``--redis-url`` the Redis path runs against an in-process fake, which measures the
+client and script cost but not the network round trip.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+
+from src.conf.config import config, RateLimitRule
+from src.services.rate_limit import LocalRateLimiter, RateLimit, rate_limiter
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/plain")
+    async def plain():
+        return {}
+
+    @app.get("/limited", dependencies=[Depends(RateLimit("bench"))])
+    async def limited():
+        return {}
+
+    return app
+
+
+async def time_requests(client: httpx.AsyncClient, path: str, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        await client.get(path)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def main(requests: int, redis_url: str | None):
+    config.RATE_LIMITS["bench"] = RateLimitRule(algorithm="token_bucket", limit=10 ** 9, period=1)
+    results = {}
+
+    local = LocalRateLimiter()
+    rule = config.RATE_LIMITS["bench"]
+    start = time.perf_counter()
+    for i in range(requests):
+        local.hit(f"k{i % 100}", rule)
+    results["local_hit_us"] = (time.perf_counter() - start) / requests * 1e6
+
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await time_requests(client, "/plain", 100)
+        results["plain_request_us"] = await time_requests(client, "/plain", requests)
+        results["local_request_us"] = await time_requests(client, "/limited", requests)
+
+        if redis_url:
+            import redis.asyncio as redis
+            rate_limiter.init(redis.from_url(redis_url))
+        else:
+            import fakeredis
+            rate_limiter.init(fakeredis.FakeAsyncRedis())
+        rate_limiter.latency_budget = 1.0
+        results["redis_request_us"] = await time_requests(client, "/limited", requests)
+
+    results["local_overhead_us"] = results["local_request_us"] - results["plain_request_us"]
+    results["redis_overhead_us"] = results["redis_request_us"] - results["plain_request_us"]
+    results["redis_backend"] = redis_url or "fakeredis"
+    print(json.dumps({k: round(v, 1) if isinstance(v, float) else v for k, v in results.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--redis-url", default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.redis_url))
@@ -0,0 +1,285 @@
+"""
+Replay recorded traffic against an instance of the API.
+
+Usage: ``python -m bench.replay TRACE [--target URL | --db-url URL] [--speedup N] [--concurrency N]
+[--writes] [--limit N] [--output FILE]``
+
+TRACE is a uvicorn access log or an NDJSON trace with one request per line:
+``{"ts": 1714557600.25, "method": "GET", "path": "/api/photos/search?tag=cat", "status": 200}``.
+Access log lines keep their relative timing when they start with a timestamp
+(``2024-05-01 12:00:00,250`` or ISO 8601); otherwise requests are sent back to back.
+
+Picture, comment and user ids are remapped into the id ranges of the seeded dataset (see
+``bench.dataset``; pass the same ``--scale`` or size overrides), so recorded traffic finds data.
+Requests are authenticated as the seeded admin ``user1@bench.local``. Without ``--target`` the
+application runs in-process in the ``local`` service profile, fully offline. Only GET requests are
+replayed unless ``--writes`` is given, in which case bodies are synthesized for login, picture
+upload and comment creation; other writes are skipped.
+
+The report holds per-route latency percentiles, error rates and how far the replay fell behind
+the recorded schedule.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from bench import dataset
+from bench.endpoints import PNG, local_app, login, summarize, use_local_profile
+
+ACCESS_LOG = re.compile(
+    r'^(?P<prefix>.*?)\S+:\d+ - "(?P<method>[A-Z]+) (?P<path>\S+) HTTP/[\d.]+" (?P<status>\d{3})'
+)
+TIMESTAMP = re.compile(r"(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?)")
+
+# Path templates with the kind of id in each numbered segment.
+PATH_IDS = (
+    (re.compile(r"^/api/photos/(?:transform/|overlay/)?(\d+)(/.*)?$"), "pictures"),
+    (re.compile(r"^/api/comments/photos/(\d+)(/.*)?$"), "pictures"),
+    (re.compile(r"^/api/comments/comments/(\d+)(/.*)?$"), "comments"),
+    (re.compile(r"^/api/admin/users/(\d+)(/.*)?$"), "users"),
+)
+QUERY_IDS = {"user_id": "users", "picture_id": "pictures", "photo_id": "pictures"}
+
+
+class TraceRequest(NamedTuple):
+    offset: Optional[float]
+    method: str
+    path: str
+    status: Optional[int]
+
+
+def _parse_timestamp(value: str) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value.replace(",", ".")).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_trace(lines: Iterator[str]) -> Iterator[TraceRequest]:
+    """
+    Parse access log or NDJSON lines; unparsable lines are skipped.
+
+    :param lines: Lines of the trace.
+    :return: Requests with their offset in seconds from the first timed request, if known.
+    """
+    first = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+                ts, method, path, status = record.get("ts"), record["method"], record["path"], record.get("status")
+            except (ValueError, KeyError):
+                continue
+            if isinstance(ts, str):
+                ts = _parse_timestamp(ts)
+        else:
+            match = ACCESS_LOG.search(line)
+            if match is None:
+                continue
+            stamp = TIMESTAMP.search(match["prefix"])
+            ts = _parse_timestamp(stamp[1]) if stamp else None
+            method, path, status = match["method"], match["path"], int(match["status"])
+        if ts is not None and first is None:
+            first = ts
+        yield TraceRequest(ts - first if ts is not None else None, method.upper(), path, status)
+
+
+class IdMapper:
+    """
+    Maps recorded ids onto the id ranges of the seeded dataset.
+
+    The mapping is a stable hash, so repeated ids stay repeated and hot objects stay hot.
+    """
+
+    def __init__(self, size: dataset.DatasetSize):
+        self.ranges = {"users": size.users, "pictures": size.pictures, "comments": size.comments}
+
+    def map(self, kind: str, value: str) -> str:
+        digest = hashlib.blake2b(f"{kind}:{value}".encode(), digest_size=8).digest()
+        return str(int.from_bytes(digest, "big") % self.ranges[kind] + 1)
+
+    def remap(self, path: str) -> str:
+        """
+        Remap the ids in the path and query of a recorded URL.
+        """
+        parts = urlsplit(path)
+        route = parts.path
+        for pattern, kind in PATH_IDS:
+            match = pattern.match(route)
+            if match:
+                start, end = match.span(1)
+                route = route[:start] + self.map(kind, match[1]) + route[end:]
+                break
+        query = [(key, self.map(QUERY_IDS[key], value) if key in QUERY_IDS and value.isdigit() else value)
+                 for key, value in parse_qsl(parts.query, keep_blank_values=True)]
+        return route + (f"?{urlencode(query)}" if query else "")
+
+
+def route_of(path: str) -> str:
+    """
+    Route label of a URL: the path without query and with numeric segments replaced by ``{id}``.
+    """
+    return re.sub(r"/\d+(?=/|$)", "/{id}", urlsplit(path).path)
+
+
+def build_request(request: TraceRequest, mapper: IdMapper, token: str, writes: bool,
+                  rng_state: list) -> Optional[dict]:
+    """
+    Turn a recorded request into httpx request arguments.
+
+    :return: The arguments, or None when the request is not replayed.
+    """
+    path = mapper.remap(request.path)
+    headers = {"Authorization": f"Bearer {token}"}
+    route = route_of(path)
+    if request.method == "GET":
+        return {"method": "GET", "url": path, "headers": headers}
+    if not writes:
+        return None
+    rng_state[0] += 1
+    if request.method == "POST" and route == "/api/auth/login":
+        user = mapper.map("users", str(rng_state[0]))
+        return {"method": "POST", "url": path,
+                "data": {"username": f"user{user}@bench.local", "password": dataset.BENCH_PASSWORD}}
+    if request.method == "POST" and route == "/api/photos/":
+        return {"method": "POST", "url": path, "headers": headers, "data": {"description": "replayed upload"},
+                "files": {"file": ("replay.png", PNG, "image/png")}}
+    if request.method == "POST" and route == "/api/comments/photos/{id}/comments":
+        return {"method": "POST", "url": path, "headers": headers, "json": {"text": "replayed comment"}}
+    return None
+
+
+async def replay(client, requests: Iterable[TraceRequest], mapper: IdMapper, token: str, speedup: float,
+                 concurrency: int, writes: bool) -> dict:
+    """
+    Send the requests on their recorded schedule, compressed by ``speedup``.
+
+    The requests are consumed lazily, so a trace of any length is replayed in constant memory
+    apart from the collected latencies.
+
+    :return: Per-route summaries, read and skipped requests and schedule lag.
+    """
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    statuses: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    lags: list[float] = []
+    read = skipped = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    rng_state = [0]
+
+    async def send(arguments: dict, scheduled: float):
+        async with semaphore:
+            lags.append(max(0.0, time.perf_counter() - scheduled))
+            route = f"{arguments['method']} {route_of(arguments['url'])}"
+            start = time.perf_counter()
+            try:
+                response = await client.request(**arguments)
+                status = response.status_code
+            except Exception:
+                status = 599
+            latencies[route].append(time.perf_counter() - start)
+            statuses[route][status] += 1
+            errors[route] += status >= 500
+
+    start = time.perf_counter()
+    pending: set[asyncio.Task] = set()
+    for request in requests:
+        read += 1
+        arguments = build_request(request, mapper, token, writes, rng_state)
+        if arguments is None:
+            skipped += 1
+            continue
+        scheduled = start + (request.offset / speedup if request.offset is not None and speedup > 0 else 0)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Backpressure for untimed traces: do not queue more than a few batches ahead.
+        while len(pending) >= concurrency * 4:
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        task = asyncio.create_task(send(arguments, max(scheduled, start)))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    await asyncio.gather(*pending)
+    elapsed = time.perf_counter() - start
+
+    routes = {}
+    for route, values in sorted(latencies.items()):
+        summary = summarize(values, errors[route], elapsed)
+        summary["error_rate"] = round(errors[route] / len(values), 4)
+        summary["statuses"] = dict(sorted(statuses[route].items()))
+        routes[route] = summary
+    lags.sort()
+    return {
+        "read": read,
+        "sent": sum(len(values) for values in latencies.values()),
+        "skipped": skipped,
+        "elapsed_seconds": round(elapsed, 3),
+        "schedule_lag_ms": {"p50": round(lags[len(lags) // 2] * 1000, 3) if lags else 0.0,
+                            "max": round(lags[-1] * 1000, 3) if lags else 0.0},
+        "routes": routes,
+    }
+
+
+async def main(args) -> int:
+    import httpx
+
+    size = dataset.parse_size(args)
+    mapper = IdMapper(size)
+
+    async def run(client) -> dict:
+        token = await login(client)
+        # Streamed from the file: a production access log does not have to fit in memory
+        with open(args.trace) as file:
+            requests = islice(parse_trace(file), args.limit)
+            return await replay(client, requests, mapper, token, args.speedup, args.concurrency, args.writes)
+
+    if args.target:
+        async with httpx.AsyncClient(base_url=args.target, timeout=args.timeout) as client:
+            report = await run(client)
+    else:
+        async with local_app(args, size) as (app, _):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=args.timeout) as client:
+                report = await run(client)
+
+    report = {"meta": {"trace": args.trace, "target": args.target or "in-process", "requests": report.pop("read"),
+                       "speedup": args.speedup, "concurrency": args.concurrency,
+                       "dataset": dataset.asdict(size)}, **report}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="Access log or NDJSON trace")
+    parser.add_argument("--target", help="Base URL of a running instance; in-process when omitted")
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///bench.db", help="Database of the in-process app")
+    parser.add_argument("--reset", action="store_true", help="Drop and reseed the in-process database")
+    parser.add_argument("--faults", default="{}", help="JSON object of latency/error rules per local service")
+    parser.add_argument("--speedup", type=float, default=1.0, help="Replay N times faster; 0 ignores the timing")
+    parser.add_argument("--concurrency", type=int, default=20, help="Maximum requests in flight")
+    parser.add_argument("--writes", action="store_true", help="Also replay supported write requests")
+    parser.add_argument("--limit", type=int, help="Replay only the first N requests")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="Also write the report to this file")
+    dataset.add_arguments(parser)
+    arguments = parser.parse_args()
+    if not arguments.target:
+        use_local_profile(arguments.db_url)
+    sys.exit(asyncio.run(main(arguments)))
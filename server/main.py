@@ -1,13 +1,55 @@
+import logging
+import os
+from contextlib import asynccontextmanager, nullcontext
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 import uvicorn
-import redis.asyncio as redis
-from fastapi_limiter import FastAPILimiter
-from src.routes import users, photos, comments, auth, admin
+from src.routes import users, photos, comments, auth, admin, metrics, moderation
 from src.conf.config import config
-import cloudinary
+from src.database.cache import redis_manager
+from src.database.db import sessionmanager
+from src.database.instrumentation import QueryStatsMiddleware
+from src.services.auth import auth_service
+from src.services.comment_stream import comment_broker
+from src.services.counters import picture_counters
+from src.services.loop_monitor import forbid_blocking_calls, loop_monitor
+from src.services.metrics import MetricsMiddleware, registry
+from src.services.profiler import ProfilerMiddleware
+from src.services.rate_limit import rate_limiter
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    redis_client = await redis_manager.connect()
+    auth_service.init(redis_client)
+    rate_limiter.init(redis_client)
+    sessionmanager.sticky.init(redis_client)
+    comment_broker.init(redis_client)
+    picture_counters.init(redis_client, sessionmanager.lazy_session)
+    auth_service.denylist.start()
+    sessionmanager.start()
+    registry.start()
+    loop_monitor.start()
+    picture_counters.start()
+    try:
+        await sessionmanager.warmup(config.DB_POOL_WARMUP)
+    except Exception as err:
+        logging.warning(f"Database pool warmup failed: {err}")
+    with forbid_blocking_calls() if config.LOOP_STRICT else nullcontext():
+        yield
+    await comment_broker.stop()
+    await picture_counters.stop()
+    await loop_monitor.stop()
+    await registry.stop()
+    await auth_service.denylist.stop()
+    await sessionmanager.stop()
+    await redis_manager.close()
+    await sessionmanager.close()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -16,26 +58,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["Server-Timing", "X-Profile-Id", "X-Next-Cursor"],
 )
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 app.include_router(users.router, prefix='/api')
 app.include_router(photos.router, prefix='/api')
 app.include_router(comments.router, prefix='/api')
 app.include_router(auth.router, prefix='/api')
 app.include_router(admin.router, prefix='/api')
-
-
-@app.on_event("startup")
-async def startup():
-    r = await redis.Redis(
-        host=config.REDIS_DOMAIN,
-        port=config.REDIS_PORT,
-        password=config.REDIS_PASSWORD,
-        db=0,
-        encoding="utf-8",
-        decode_responses=True
-    )
-    await FastAPILimiter.init(r)
+app.include_router(moderation.router, prefix='/api')
+if config.METRICS_ENABLED:
+    app.include_router(metrics.router)
+if config.SERVICE_PROFILE == "local":
+    os.makedirs(config.LOCAL_STORAGE_DIR, exist_ok=True)
+    app.mount("/local-storage", StaticFiles(directory=config.LOCAL_STORAGE_DIR), name="local-storage")
 
 
 @app.get("/")
@@ -43,12 +83,5 @@ def read_root():
     return {"message": "Hello World"}
 
 
-cloudinary.config(
-    cloud_name=config.CLD_NAME,
-    api_key=config.CLD_API_KEY,
-    api_secret=config.CLD_API_SECRET,
-    secure=True
-)
-
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,200 @@
+import logging
+import time
+from typing import Optional
+from urllib.parse import quote
+
+import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+
+from src.conf.config import config
+from src.services.metrics import redis_command_duration, redis_pool_connections, registry
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """
+    Blocking connection pool that records how long callers wait for a connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        connection = await super().get_connection(*args, **kwargs)
+        waited = time.perf_counter() - start
+        self.checkouts += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        return connection
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    Redis client that records the latency of every command.
+    """
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            redis_command_duration.observe(str(args[0]).upper(), value=time.perf_counter() - start)
+
+
+def local_redis() -> redis.Redis:
+    """
+    Create an in-memory Redis for the ``local`` service profile.
+
+    Commands are answered by fakeredis (with Lua support for the scripts) and pass through the
+    ``redis`` rule of ``config.LOCAL_FAULTS``.
+
+    :return: An async Redis-compatible client.
+    """
+    try:
+        import fakeredis
+    except ImportError as err:
+        raise RuntimeError("The local service profile requires the fakeredis[lua] package") from err
+    from src.services.faults import FaultInjector
+
+    faults = FaultInjector("redis", error=ConnectionError)
+
+    class LocalRedis(fakeredis.FakeAsyncRedis):
+        async def execute_command(self, *args, **options):
+            start = time.perf_counter()
+            try:
+                await faults.apply()
+                return await super().execute_command(*args, **options)
+            finally:
+                redis_command_duration.observe(str(args[0]).upper(), value=time.perf_counter() - start)
+
+    return LocalRedis()
+
+
+class RedisManager:
+    """
+    Class owning the single Redis connection pool of a worker.
+
+    The application lifespan connects and closes it; services receive the client through their
+    ``init`` methods instead of creating their own connections.
+    """
+
+    def __init__(self, url: str, max_connections: int, pool_timeout: float, socket_timeout: float,
+                 connect_timeout: float, health_check_interval: int, retries: int):
+        """
+        Initializes the RedisManager object.
+
+        :param url: The Redis URL.
+        :param max_connections: Maximum number of pooled connections.
+        :param pool_timeout: Seconds to wait for a free connection before failing.
+        :param socket_timeout: Seconds to wait for a command reply.
+        :param connect_timeout: Seconds to wait for a connection to be established.
+        :param health_check_interval: Seconds of idleness after which a connection is checked before use.
+        :param retries: Number of retries with exponential backoff on connection errors and timeouts.
+        """
+        self.url = url
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.socket_timeout = socket_timeout
+        self.connect_timeout = connect_timeout
+        self.health_check_interval = health_check_interval
+        self.retries = retries
+        self._pool: Optional[InstrumentedConnectionPool] = None
+        self._client: Optional[InstrumentedRedis] = None
+
+    @property
+    def client(self) -> redis.Redis:
+        """
+        The shared Redis client.
+        """
+        if self._client is None:
+            raise Exception("Redis is not connected")
+        return self._client
+
+    async def connect(self) -> redis.Redis:
+        """
+        Create the connection pool and client.
+
+        :return: The shared Redis client.
+        """
+        if self._client is not None:
+            return self._client
+        if config.SERVICE_PROFILE == "local":
+            self._client = local_redis()
+            self._pool = self._client.connection_pool
+            return self._client
+        self._pool = InstrumentedConnectionPool.from_url(
+            self.url,
+            max_connections=self.max_connections,
+            timeout=self.pool_timeout,
+            socket_timeout=self.socket_timeout,
+            socket_connect_timeout=self.connect_timeout,
+            health_check_interval=self.health_check_interval,
+            retry=Retry(ExponentialBackoff(cap=0.5, base=0.01), self.retries),
+            retry_on_error=[ConnectionError, TimeoutError],
+        )
+        self._client = InstrumentedRedis(connection_pool=self._pool)
+        try:
+            await self._client.ping()
+        except Exception as err:
+            logger.warning("Redis is not reachable at startup: %s", err)
+        return self._client
+
+    async def close(self) -> None:
+        """
+        Close the client and disconnect all pooled connections.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            await self._pool.disconnect()
+        self._client = None
+        self._pool = None
+
+    def stats(self) -> dict:
+        """
+        Current pool statistics.
+
+        :return: Connections in use and idle, the pool limit and checkout wait times.
+        """
+        pool = self._pool
+        if pool is None:
+            return {"connected": False}
+        if not isinstance(pool, InstrumentedConnectionPool):
+            return {"connected": True, "pool": type(pool).__name__}
+        return {
+            "connected": True,
+            "max_connections": pool.max_connections,
+            "in_use": len(pool._in_use_connections),
+            "idle": len(pool._available_connections),
+            "checkouts": pool.checkouts,
+            "wait_seconds_total": round(pool.wait_seconds_total, 6),
+            "wait_seconds_max": round(pool.wait_seconds_max, 6),
+        }
+
+    def collect_metrics(self) -> None:
+        """
+        Update the pool connection gauges.
+        """
+        stats = self.stats()
+        if "in_use" in stats:
+            redis_pool_connections.set("in_use", value=stats["in_use"])
+            redis_pool_connections.set("idle", value=stats["idle"])
+            redis_pool_connections.set("max", value=stats["max_connections"])
+
+
+redis_manager = RedisManager(
+    f"redis://:{quote(config.REDIS_PASSWORD)}@{config.REDIS_DOMAIN}:{config.REDIS_PORT}/{config.REDIS_DB}",
+    max_connections=config.REDIS_MAX_CONNECTIONS,
+    pool_timeout=config.REDIS_POOL_TIMEOUT,
+    socket_timeout=config.REDIS_SOCKET_TIMEOUT,
+    connect_timeout=config.REDIS_CONNECT_TIMEOUT,
+    health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL,
+    retries=config.REDIS_RETRIES,
+)
+registry.add_collector(redis_manager.collect_metrics)
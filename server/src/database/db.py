@@ -1,22 +1,290 @@
+import asyncio
 import contextlib
-from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+from fastapi import Request
+from jose import JWTError, jwt
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from src.conf.config import config
+from src.services.metrics import db_pool_checkout_wait, db_pool_connections, registry
+
+logger = logging.getLogger(__name__)
+
+# Replication lag of a Postgres standby in seconds; 0 when it has replayed everything it received.
+POSTGRES_LAG_SQL = """
+SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+"""
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        if orm_execute_state.session.info.get("read_only"):
+            raise Exception("Write statement issued on a read-only session")
+        orm_execute_state.session.info["wrote"] = True
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long checkouts wait for a connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        connection = super()._do_get()
+        waited = time.perf_counter() - start
+        self.checkouts += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        db_pool_checkout_wait.observe(value=waited)
+        return connection
+
+
+def engine_options(url: str) -> dict:
+    """
+    Build engine keyword arguments for a database URL from the settings.
+
+    :param url: The database URL.
+    :return: Keyword arguments for create_async_engine.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {"echo": config.SQL_ECHO}
+    options = {
+        "echo": config.SQL_ECHO,
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+    }
+    if parsed.get_driver_name() == "asyncpg":
+        connect_args = {"prepared_statement_cache_size": config.DB_STATEMENT_CACHE_SIZE}
+        if config.DB_STATEMENT_TIMEOUT_MS:
+            connect_args["server_settings"] = {"statement_timeout": str(config.DB_STATEMENT_TIMEOUT_MS)}
+        options["connect_args"] = connect_args
+    return options
+
+
+class StickyWrites:
+    """
+    Remembers users who wrote recently so their reads go to the primary (read-your-writes).
+
+    Marks are kept in process and, once a Redis client is attached, shared across workers
+    through keys that expire with the window.
+    """
+
+    def __init__(self, window: float, max_keys: int = 10_000, prefix: str = "sticky"):
+        """
+        Initializes the StickyWrites object.
+
+        :param window: Seconds after a write during which reads stay on the primary.
+        :param max_keys: Maximum number of identities remembered in process.
+        :param prefix: Key prefix for Redis records.
+        """
+        self.window = window
+        self.max_keys = max_keys
+        self.prefix = prefix
+        self.redis = None
+        self._local: OrderedDict = OrderedDict()
+
+    def init(self, redis_client) -> None:
+        """
+        Attach a Redis client to share marks across workers.
+
+        :param redis_client: Async Redis client.
+        """
+        self.redis = redis_client
+
+    async def mark(self, identity: str) -> None:
+        """
+        Record a write by an identity.
+
+        :param identity: The identity (user email) that wrote.
+        """
+        self._local.pop(identity, None)
+        self._local[identity] = time.monotonic() + self.window
+        if len(self._local) > self.max_keys:
+            self._local.popitem(last=False)
+        if self.redis is not None:
+            try:
+                await self.redis.set(f"{self.prefix}:{identity}", 1, px=int(self.window * 1000))
+            except Exception as err:
+                logger.warning("Failed to share sticky write mark: %s", err)
+
+    async def is_sticky(self, identity: str) -> bool:
+        """
+        Check whether an identity wrote within the window.
+
+        :param identity: The identity (user email) to check.
+        :return: True if reads should go to the primary.
+        """
+        until = self._local.get(identity)
+        if until is not None and until > time.monotonic():
+            return True
+        if self.redis is not None:
+            try:
+                return bool(await self.redis.exists(f"{self.prefix}:{identity}"))
+            except Exception as err:
+                logger.warning("Failed to read sticky write mark: %s", err)
+                return True
+        return False
+
+
+class StickySession(AsyncSession):
+    """
+    Session on the primary that pins its writer's reads to the primary as soon as a write commits.
+
+    The mark is recorded before ``commit`` returns, so it is in place before the response is sent,
+    whenever the framework tears down its dependencies.
+    """
+
+    async def commit(self) -> None:
+        await super().commit()
+        sticky = self.info.get("sticky")
+        if sticky is not None and self.info.get("wrote"):
+            writes, request = sticky
+            identity = request_identity(request)
+            if identity is not None:
+                await writes.mark(identity)
+
+
+class Replica:
+    """
+    A read replica engine together with its health state.
+    """
+
+    def __init__(self, url: str, engine_kwargs: dict):
+        """
+        Initializes the Replica object.
+
+        :param url: The replica database URL.
+        :param engine_kwargs: Keyword arguments for the engine.
+        """
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine: AsyncEngine = create_async_engine(url, **engine_kwargs)
+        self.session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, autocommit=False,
+                                                                    bind=self.engine)
+        self.lag_sql = POSTGRES_LAG_SQL if self.engine.dialect.name == "postgresql" else "SELECT 0"
+        self.healthy = True
+        self.lag: Optional[float] = None
+
+
+class LazySession:
+    """
+    Proxy for an AsyncSession that creates the session on first attribute access.
+
+    Requests that never touch the database (e.g. the user came from the cache) then skip the
+    session setup, its connection checkout and the cleanup on close.
+    """
+
+    __slots__ = ("_factory", "_session")
+
+    def __init__(self, factory):
+        """
+        Initializes the LazySession object.
+
+        :param factory: Callable returning a new AsyncSession.
+        """
+        self._factory = factory
+        self._session = None
+
+    @property
+    def materialized(self) -> bool:
+        """
+        Whether the underlying session was created.
+        """
+        return self._session is not None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = self._factory()
+        return getattr(self._session, name)
 
 
 class DatabaseSessionManager:
     """
-    Class for managing database sessions.
+    Class for managing database sessions on a primary and optional read replicas.
     """
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, engine_kwargs: Optional[dict] = None, replica_urls: Sequence[str] = (),
+                 max_lag: float = 2.0, check_interval: float = 5.0, sticky_window: float = 5.0):
         """
         Initializes the DatabaseSessionManager object.
 
-        :param url: The database URL.
+        :param url: The primary database URL.
+        :param engine_kwargs: Keyword arguments for the engines; derived from the settings by default.
+        :param replica_urls: URLs of read replicas.
+        :param max_lag: Replication lag in seconds above which a replica stops serving reads.
+        :param check_interval: Seconds between replica health checks.
+        :param sticky_window: Seconds after a write during which the writer reads from the primary.
         """
-        self._engine: AsyncEngine = create_async_engine(url)
+        if engine_kwargs is None:
+            engine_kwargs = engine_options(url)
+        self._engine: AsyncEngine = create_async_engine(url, **engine_kwargs)
         self._session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, autocommit=False,
-                                                                     bind=self._engine)
+                                                                     bind=self._engine, class_=StickySession)
+        self.replicas = [Replica(replica_url, engine_options(replica_url)) for replica_url in replica_urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky = StickyWrites(sticky_window)
+        self._round_robin = itertools.cycle(self.replicas) if self.replicas else None
+        self.session_stats = {"requested": 0, "used": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    def _pick_replica(self) -> Optional[Replica]:
+        for _ in range(len(self.replicas)):
+            replica = next(self._round_robin)
+            if replica.healthy:
+                return replica
+        return None
+
+    def _new_session(self, read: bool = False, primary: bool = False, request: Optional[Request] = None):
+        replica = self._pick_replica() if read and not primary and self.replicas else None
+        if replica is None:
+            if self._session_maker is None:
+                raise Exception("Session is not initialized")
+            session = self._session_maker()
+            if request is not None and self.replicas:
+                # Read by StickySession.commit
+                session.info["sticky"] = (self.sticky, request)
+            return session
+        session = replica.session_maker()
+        session.info["read_only"] = True
+        return session
+
+    @staticmethod
+    @contextlib.asynccontextmanager
+    async def _managed(session):
+        try:
+            yield session
+        except Exception as err:
+            print(f"Session error: {err}")
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
 
     @contextlib.asynccontextmanager
     async def session(self):
@@ -25,28 +293,206 @@ class DatabaseSessionManager:
 
         :return: A database session.
         """
-        if self._session_maker is None:
-            raise Exception("Session is not initialized")
-        session = self._session_maker()
-        try:
+        async with self._managed(self._new_session()) as session:
             yield session
+
+    @contextlib.asynccontextmanager
+    async def read_session(self, primary: bool = False):
+        """
+        Context manager for acquiring a read-only session on a healthy replica.
+
+        Falls back to the primary when no replica is configured or healthy.
+
+        :param primary: Force the primary, e.g. to read the caller's own recent writes.
+        :return: A database session.
+        """
+        async with self._managed(self._new_session(read=True, primary=primary)) as session:
+            yield session
+
+    @contextlib.asynccontextmanager
+    async def lazy_session(self, read: bool = False, primary: bool = False, request: Optional[Request] = None):
+        """
+        Context manager for a session that is only created when first used.
+
+        :param read: Use a read-only replica session.
+        :param primary: Force the primary for reads.
+        :param request: The request of a primary session, whose user is pinned to the primary when
+            a write commits.
+        :return: A LazySession proxy.
+        """
+        lazy = LazySession(lambda: self._new_session(read=read, primary=primary, request=request))
+        self.session_stats["requested"] += 1
+        try:
+            yield lazy
         except Exception as err:
-            print(f"Session error: {err}")
-            await session.rollback()
+            if lazy.materialized:
+                print(f"Session error: {err}")
+                await lazy.rollback()
             raise
         finally:
-            await session.close()
+            if lazy.materialized:
+                self.session_stats["used"] += 1
+                await lazy.close()
 
+    async def check_replicas(self) -> None:
+        """
+        Measure the lag of every replica and take lagging or unreachable ones out of rotation.
+        """
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as conn:
+                    replica.lag = float((await conn.execute(text(replica.lag_sql))).scalar() or 0)
+                replica.healthy = replica.lag <= self.max_lag
+            except Exception as err:
+                logger.warning("Replica %s is unavailable: %s", replica.name, err)
+                replica.lag = None
+                replica.healthy = False
 
-sessionmanager = DatabaseSessionManager(config.DB_URL)
+    async def run(self) -> None:
+        """
+        Check replicas every ``check_interval`` seconds until cancelled.
+        """
+        while True:
+            await self.check_replicas()
+            await asyncio.sleep(self.check_interval)
 
+    def start(self) -> None:
+        """
+        Start the background replica health checks.
+        """
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self.run())
 
-async def get_db():
+    async def stop(self) -> None:
+        """
+        Stop the background replica health checks.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def warmup(self, connections: int) -> None:
+        """
+        Open pool connections ahead of traffic.
+
+        :param connections: Number of connections to open concurrently.
+        """
+        async def ping():
+            async with self._engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        await asyncio.gather(*(ping() for _ in range(connections)))
+
+    async def close(self) -> None:
+        """
+        Dispose of the engines and their pooled connections.
+        """
+        await self._engine.dispose()
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def pool_stats(self) -> dict:
+        """
+        Current pool statistics.
+
+        :return: Pool size, checked in/out and overflow connections and checkout wait times, with the
+            health and pool statistics of every replica.
+        """
+        stats = self._engine_stats(self._engine)
+        stats["sessions"] = {**self.session_stats,
+                             "unused": self.session_stats["requested"] - self.session_stats["used"]}
+        if self.replicas:
+            stats["replicas"] = [
+                {"name": replica.name, "healthy": replica.healthy, "lag": replica.lag,
+                 **self._engine_stats(replica.engine)}
+                for replica in self.replicas
+            ]
+        return stats
+
+    @staticmethod
+    def _engine_stats(engine: AsyncEngine) -> dict:
+        pool = engine.pool
+        if not isinstance(pool, InstrumentedQueuePool):
+            return {"pool": type(pool).__name__}
+        return {
+            "pool": type(pool).__name__,
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": pool.checkouts,
+            "wait_seconds_total": round(pool.wait_seconds_total, 6),
+            "wait_seconds_max": round(pool.wait_seconds_max, 6),
+        }
+
+    def collect_metrics(self) -> None:
+        """
+        Update the pool connection gauges of the primary and every replica.
+        """
+        engines = [("primary", self._engine)] + [(replica.name, replica.engine) for replica in self.replicas]
+        for name, engine in engines:
+            stats = self._engine_stats(engine)
+            for state in ("size", "checked_in", "checked_out", "overflow"):
+                if state in stats:
+                    db_pool_connections.set(name, state, value=stats[state])
+
+
+sessionmanager = DatabaseSessionManager(
+    config.DB_URL,
+    replica_urls=config.DB_REPLICA_URLS,
+    max_lag=config.DB_REPLICA_MAX_LAG_SECONDS,
+    check_interval=config.DB_REPLICA_CHECK_SECONDS,
+    sticky_window=config.DB_STICKY_SECONDS,
+)
+registry.add_collector(sessionmanager.collect_metrics)
+
+
+def request_identity(request: Request) -> Optional[str]:
+    """
+    Extract the user email from the bearer token of a request without hitting the database.
+
+    :param request: The incoming request.
+    :return: The token subject, or None for anonymous or invalid tokens.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, config.SECRET_KEY_JWT, algorithms=[config.ALG]).get("sub")
+    except JWTError:
+        return None
+
+
+async def get_db(request: Request):
     """
-    Asynchronous function for acquiring a database session.
+    Asynchronous function for acquiring a lazily created database session on the primary.
 
+    Requests that write pin their user's reads to the primary for the sticky window, from the
+    moment the write commits.
+
+    :param request: The incoming request.
     :return: A database session.
     """
-    async with sessionmanager.session() as session:
+    async with sessionmanager.lazy_session(request=request) as session:
         yield session
 
+
+async def get_read_db(request: Request):
+    """
+    Asynchronous function for acquiring a lazily created read-only database session.
+
+    Uses a healthy replica unless the user wrote recently or no replica is available.
+
+    :param request: The incoming request.
+    :return: A database session.
+    """
+    primary = False
+    if sessionmanager.replicas:
+        identity = request_identity(request)
+        primary = identity is not None and await sessionmanager.sticky.is_sticky(identity)
+    async with sessionmanager.lazy_session(read=True, primary=primary) as session:
+        yield session
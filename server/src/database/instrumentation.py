@@ -0,0 +1,209 @@
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+import greenlet
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.conf.config import config
+
+logger = logging.getLogger("src.database.sql")
+
+_SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_DATABASE_DIR = os.path.join(_SRC_DIR, "database")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN\s*\((?:[^()]|\([^()]*\))*\)", re.IGNORECASE)
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Reduce a SQL statement to its shape by dropping literals, IN lists and extra whitespace.
+
+    :param statement: The SQL statement.
+    :return: The statement fingerprint.
+    """
+    statement = _LITERALS.sub("?", statement)
+    statement = _IN_LISTS.sub("IN (?)", statement)
+    return " ".join(statement.split())
+
+
+def call_site() -> str:
+    """
+    Locate the application code that issued the current query.
+
+    SQLAlchemy's asyncio layer runs queries in a child greenlet, so the search continues in the
+    suspended stack of the parent greenlet where the awaiting coroutine lives.
+
+    :return: ``file:line in function`` of the innermost frame in ``src`` outside ``src/database``.
+    """
+    frame = sys._getframe(1)
+    current = greenlet.getcurrent()
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_SRC_DIR) and not filename.startswith(_DATABASE_DIR):
+            return f"{os.path.relpath(filename, os.path.dirname(_SRC_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+        if frame is None and current.parent is not None:
+            current = current.parent
+            frame = current.gr_frame
+    return "unknown"
+
+
+class QueryStats:
+    """
+    Query count and total database time of one request.
+
+    With the query detector enabled it also counts statement fingerprints and remembers where
+    each one was first issued.
+    """
+
+    __slots__ = ("count", "duration", "fingerprints", "sites")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints: Counter = Counter()
+        self.sites: dict[str, str] = {}
+
+    def record(self, statement: str, elapsed: float, detect: bool) -> None:
+        """
+        Record an executed statement.
+
+        :param statement: The SQL statement.
+        :param elapsed: Execution time in seconds.
+        :param detect: Whether to fingerprint the statement and flag repeats.
+        """
+        self.count += 1
+        self.duration += elapsed
+        if not detect:
+            return
+        shape = fingerprint(statement)
+        self.fingerprints[shape] += 1
+        if shape not in self.sites:
+            self.sites[shape] = call_site()
+        if self.fingerprints[shape] == config.QUERY_REPEAT_THRESHOLD:
+            logger.warning(json.dumps({
+                "event": "repeated_query",
+                "count": self.fingerprints[shape],
+                "statement": shape,
+                "call_site": self.sites[shape],
+            }))
+
+    def repeated(self, threshold: int) -> list[tuple[str, int, str]]:
+        """
+        Statements issued at least ``threshold`` times.
+
+        :param threshold: Minimum number of executions.
+        :return: Tuples of fingerprint, count and call site.
+        """
+        return [(shape, count, self.sites[shape]) for shape, count in self.fingerprints.most_common()
+                if count >= threshold]
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a block issues more queries than its declared budget.
+    """
+
+
+_budgets: list[QueryStats] = []
+
+
+@contextlib.contextmanager
+def query_budget(limit: int):
+    """
+    Fail if the enclosed block issues more than ``limit`` queries.
+
+    Counts every query of the process, including those of a TestClient running the app in another
+    thread, so it is meant for tests.
+
+    :param limit: Maximum number of queries.
+    :return: The QueryStats of the block.
+    """
+    stats = QueryStats()
+    _budgets.append(stats)
+    try:
+        yield stats
+    finally:
+        _budgets.remove(stats)
+    if stats.count > limit:
+        details = "\n".join(f"  {count}x {shape}\n     at {site}" for shape, count, site in stats.repeated(1))
+        raise QueryBudgetExceeded(f"{stats.count} queries issued, budget is {limit}:\n{details}")
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    """
+    Query statistics of the request being handled.
+
+    :return: The QueryStats of the current request, or None outside of a request.
+    """
+    return _current.get()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed, config.QUERY_DETECTOR)
+    for budget in _budgets:
+        budget.record(statement, elapsed, True)
+    if elapsed * 1000 >= config.SLOW_QUERY_MS and random.random() < config.SLOW_QUERY_SAMPLE_RATE:
+        logger.warning(json.dumps({
+            "event": "slow_query",
+            "duration_ms": round(elapsed * 1000, 2),
+            "statement": " ".join(statement.split()),
+            "executemany": executemany,
+        }))
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware collecting per-request query statistics.
+
+    Adds a ``Server-Timing`` header with the database time and query count of the request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and config.SERVER_TIMING:
+                total = (time.perf_counter() - start) * 1000
+                timing = f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries", app;dur={total:.2f}'
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, Integer, String, ForeignKey, Enum, DateTime, func, Boolean
+from sqlalchemy import Table, Column, Integer, String, ForeignKey, Enum, DateTime, func, Boolean, Index, false
 from sqlalchemy.orm import relationship, declarative_base
 import enum
 
@@ -7,7 +7,16 @@ Base = declarative_base()
 # Association table for many-to-many relationship between pictures and tags
 tags_pictures = Table('tags_pictures', Base.metadata,
                       Column('picture_id', Integer, ForeignKey('pictures.id', ondelete='CASCADE'), primary_key=True),
-                      Column('tag_id', Integer, ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True)
+                      Column('tag_id', Integer, ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True),
+                      # The primary key covers lookups by picture; this one serves searches by tag
+                      Index('ix_tags_pictures_tag_id_picture_id', 'tag_id', 'picture_id')
+                      )
+
+# One row per user and liked picture; the like count itself lives on pictures
+picture_likes = Table('picture_likes', Base.metadata,
+                      Column('picture_id', Integer, ForeignKey('pictures.id', ondelete='CASCADE'), primary_key=True),
+                      Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+                      Column('created_at', DateTime, default=func.now())
                       )
 
 
@@ -24,7 +33,7 @@ class User(Base):
     username = Column(String(50), nullable=False)
     password = Column(String(250), nullable=False)
     avatar = Column(String(255), nullable=True)
-    email = Column(String(150), nullable=False)
+    email = Column(String(150), nullable=False, unique=True, index=True)
     refresh_token = Column(String(255), nullable=True)
     role = Column(Enum(Role), default=Role.user, nullable=True)
     created_at = Column(DateTime, default=func.now())
@@ -37,6 +46,10 @@ class User(Base):
 
 class Picture(Base):
     __tablename__ = "pictures"
+    __table_args__ = (
+        Index('ix_pictures_user_id_created_at', 'user_id', 'created_at'),
+        Index('ix_pictures_created_at', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     qr_code_url = Column(String(255), nullable=True)
@@ -51,23 +64,46 @@ class Picture(Base):
         passive_deletes=True
     )
     comments = relationship('Comment', back_populates='picture', cascade="all, delete-orphan")
+    # Visible comments; maintained by CommentRepository in the transactions creating, deleting and hiding comments
+    comment_count = Column(Integer, nullable=False, default=0, server_default='0')
+    # Written behind by src.services.counters; readers add the deltas still pending there
+    view_count = Column(Integer, nullable=False, default=0, server_default='0')
+    like_count = Column(Integer, nullable=False, default=0, server_default='0')
+    # Set by moderators; hidden pictures are left out of searches
+    hidden = Column(Boolean, nullable=False, default=False, server_default=false())
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        Index('ix_comments_picture_id_created_at_id', 'picture_id', 'created_at', 'id'),
+        Index('ix_comments_user_id', 'user_id'),
+        Index('ix_comments_picture_id_path', 'picture_id', 'path'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    text = Column(String, index=True)
+    text = Column(String)
     user_id = Column(Integer, ForeignKey('users.id', ondelete="CASCADE"))
     picture_id = Column(Integer, ForeignKey('pictures.id', ondelete="CASCADE"))
+    parent_id = Column(Integer, ForeignKey('comments.id', ondelete="CASCADE"), nullable=True)
+    # Materialized path: zero-padded ids of the thread root down to the comment, joined by dots.
+    # Sorting by path lists threads depth-first in display order; the byte-wise "C" collation keeps
+    # Postgres from ignoring the dots when comparing.
+    path = Column(String(255).with_variant(String(255, collation="C"), "postgresql"), nullable=True)
+    # Set by moderators; hidden comments are left out of all comment listings
+    hidden = Column(Boolean, nullable=False, default=False, server_default=false())
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
     user = relationship("User", back_populates="comments")
     picture = relationship("Picture", back_populates="comments")
 
+    @property
+    def depth(self) -> int:
+        return self.path.count('.') if self.path else 0
+
 
 class Tag(Base):
     __tablename__ = "tags"
@@ -1,52 +1,326 @@
+from datetime import datetime
+from collections import defaultdict
+from typing import Optional, Sequence
+
+from sqlalchemy import and_, delete, exists, func, or_, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import Session
-from src.database.models import Comment
-from src.schemas.comments import CommentUpdate, CommentCreate
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm.attributes import flag_modified
+from src.database.models import Comment, Picture
+from src.schemas.comments import CommentUpdate, CommentCreate, CommentOut
+from src.schemas.moderation import CommentModeration
+from src.conf.config import config
+from src.services.comment_stream import comment_broker
 from sqlalchemy.exc import NoResultFound
 from fastapi import HTTPException, status
-from sqlalchemy.sql import func
+
+# Width of one path segment; fixed width makes string order equal numeric order
+PATH_SEGMENT_WIDTH = 10
+
+
+def path_segment(comment_id: int) -> str:
+    return str(comment_id).zfill(PATH_SEGMENT_WIDTH)
+
+
+def subtree_end(path: str) -> str:
+    """
+    Exclusive upper bound of the paths in the subtree rooted at ``path``.
+
+    Descendants extend the path with ``.``; ``/`` is the next character, so
+    ``path <= p < subtree_end(path)`` selects exactly the subtree.
+    """
+    return path + "/"
+
+
+def on_visible_picture(picture_id):
+    """
+    Predicate of the comments of a picture that is not hidden; a hidden picture has no readable comments.
+    """
+    return exists().where(Picture.id == picture_id, Picture.hidden.is_(False))
 
 
 class CommentRepository:
 
     @staticmethod
     async def create_comment(db: AsyncSession, comment: CommentCreate, user_id: int, picture_id: int) -> Comment:
-        db_comment = Comment(
-            text=comment.text, user_id=user_id, picture_id=picture_id)
+        # Set here rather than by the server default: SQLite would store CURRENT_TIMESTAMP in a
+        # different text format than bound datetimes, which breaks keyset comparisons
+        now = datetime.now()
+        parent = None
+        if comment.parent_id is not None:
+            parent = await db.get(Comment, comment.parent_id)
+            if parent is None or parent.picture_id != picture_id or parent.hidden:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Parent comment not found")
+            if parent.depth + 1 >= config.COMMENT_MAX_DEPTH:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Thread is too deep")
+        db_comment = Comment(text=comment.text, user_id=user_id, picture_id=picture_id, created_at=now,
+                             updated_at=now, parent_id=comment.parent_id)
         db.add(db_comment)
+        # The path ends with the comment's own id, which is known after the insert
+        await db.flush()
+        segment = path_segment(db_comment.id)
+        db_comment.path = f"{parent.path}.{segment}" if parent is not None else segment
+        # Written explicitly, so the onupdate default does not fire for the path
+        flag_modified(db_comment, "updated_at")
+        # Same transaction as the insert; the increment is atomic, so concurrent comments are all counted.
+        # It also finds no row for a missing or hidden picture, which then gets no comment
+        result = await db.execute(update(Picture).where(Picture.id == picture_id, Picture.hidden.is_(False))
+                                  .values(comment_count=Picture.comment_count + 1))
+        if not result.rowcount:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Picture not found")
         await db.commit()
         await db.refresh(db_comment)
+        await comment_broker.publish(picture_id, "comment.created",
+                                     CommentOut.model_validate(db_comment, from_attributes=True).model_dump(mode="json"))
         return db_comment
 
     @staticmethod
-    async def update_comment(db: AsyncSession, comment_id: int, comment: CommentUpdate) -> Comment:
-        result = await db.execute(select(Comment).filter(Comment.id == comment_id))
-        db_comment = result.scalars().first()
+    async def _raise_if_exists(db: AsyncSession, comment_id: int) -> None:
+        # Only reached when a guarded statement matched no row: a forbidden change, not a missing comment.
+        # Hidden comments stay missing, as on every read path
+        if await db.scalar(select(exists().where(Comment.id == comment_id, Comment.hidden.is_(False)))):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You can only edit your own comments")
+
+    @staticmethod
+    async def update_comment(db: AsyncSession, comment_id: int, comment: CommentUpdate,
+                             user_id: Optional[int] = None) -> Comment:
+        """
+        Updates the text of a comment with a single guarded ``UPDATE ... RETURNING``.
+
+        :param db: The database session.
+        :param comment_id: The ID of the comment.
+        :param comment: The new text.
+        :param user_id: Only the comment of this author is updated; None skips the check.
+        :return: The updated comment.
+        :raises HTTPException: 404 if the comment does not exist or is hidden, 403 if it has another author.
+        """
+        query = update(Comment).where(Comment.id == comment_id, Comment.hidden.is_(False))
+        if user_id is not None:
+            query = query.where(Comment.user_id == user_id)
+        result = await db.scalars(query.values(text=comment.text, updated_at=datetime.now()).returning(Comment),
+                                  execution_options={"synchronize_session": False})
+        db_comment = result.one_or_none()
 
         if not db_comment:
+            if user_id is not None:
+                await CommentRepository._raise_if_exists(db, comment_id)
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
 
-        db_comment.text = comment.text
-        db_comment.updated_at = func.now()
+        # Detached, the returned state survives the commit instead of being expired and reloaded
+        db.expunge(db_comment)
         await db.commit()
-        await db.refresh(db_comment)
+        await comment_broker.publish(db_comment.picture_id, "comment.updated",
+                                     CommentOut.model_validate(db_comment, from_attributes=True).model_dump(mode="json"))
         return db_comment
 
     @staticmethod
     async def delete_comment(db: AsyncSession, comment_id: int) -> None:
-        result = await db.execute(select(Comment).filter(Comment.id == comment_id))
-        db_comment = result.scalars().first()
+        """
+        Deletes a comment with its replies.
 
-        if not db_comment:
+        The comment is not read first: a single ``DELETE ... RETURNING`` finds the thread range
+        from the comment's own row in subqueries, and one ``UPDATE`` adjusts the comment count.
+
+        :param db: The database session.
+        :param comment_id: The ID of the comment.
+        :raises HTTPException: 404 if the comment does not exist.
+        """
+        target = aliased(Comment)
+        picture_id, path = (select(column).where(target.id == comment_id).scalar_subquery()
+                            for column in (target.picture_id, target.path))
+        # Replies go with the comment, removed by a range over the thread index
+        result = await db.execute(
+            delete(Comment)
+            .where(or_(Comment.id == comment_id,
+                       and_(Comment.picture_id == picture_id, Comment.path >= path, Comment.path < subtree_end(path))))
+            .returning(Comment.picture_id, Comment.hidden)
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+
+        if not rows:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
 
-        await db.delete(db_comment)
+        picture_id, deleted = rows[0].picture_id, len(rows)
+        # Hidden comments were already taken out of the count
+        await db.execute(update(Picture).where(Picture.id == picture_id)
+                         .values(comment_count=Picture.comment_count - sum(not row.hidden for row in rows)))
         await db.commit()
+        await comment_broker.publish(picture_id, "comment.deleted",
+                                     {"id": comment_id, "picture_id": picture_id, "deleted": deleted})
 
     @staticmethod
-    async def get_comments(db: AsyncSession, photo_id: int, skip: int = 0, limit: int = 10):
-        result = await db.execute(select(Comment).filter(Comment.picture_id == photo_id).offset(skip).limit(limit))
+    async def get_comments(db: AsyncSession, photo_id: int, skip: int = 0, limit: int = 10,
+                           after: Optional[tuple[datetime, int]] = None):
+        """
+        Retrieves the comments of a picture, oldest first.
+
+        The order follows the ``(picture_id, created_at, id)`` index, so pages are read straight
+        from it. Pass the sort key of the last comment of a page as ``after`` to get the next page;
+        unlike ``skip``, its cost does not grow with the page number.
+
+        :param db: The database session.
+        :param photo_id: The ID of the picture.
+        :param skip: Number of comments to skip; superseded by ``after``.
+        :param limit: Maximum number of comments to return.
+        :param after: ``(created_at, id)`` of the last comment of the previous page.
+        :return: List of comments.
+        """
+        query = select(Comment).filter(Comment.picture_id == photo_id, Comment.hidden.is_(False),
+                                       on_visible_picture(photo_id))
+        if after is not None:
+            query = query.filter(tuple_(Comment.created_at, Comment.id) > after)
+        elif skip:
+            query = query.offset(skip)
+        result = await db.execute(query.order_by(Comment.created_at, Comment.id).limit(limit))
         return result.scalars().all()
+
+    @staticmethod
+    async def get_comment_previews(db: AsyncSession, picture_ids: Sequence[int],
+                                   per_picture: int = 3) -> dict[int, list[Comment]]:
+        """
+        Retrieves the most recent comments of several pictures in a single query.
+
+        Comments are ranked per picture with ``ROW_NUMBER() OVER (PARTITION BY picture_id ...)``,
+        newest first, and only the first ``per_picture`` ranks are returned.
+
+        :param db: The database session.
+        :param picture_ids: IDs of the pictures.
+        :param per_picture: Maximum number of comments per picture.
+        :return: The comments of every picture, newest first, keyed by picture ID.
+        """
+        previews = defaultdict(list)
+        if not picture_ids:
+            return previews
+        rank = func.row_number().over(partition_by=Comment.picture_id,
+                                      order_by=(Comment.created_at.desc(), Comment.id.desc())).label("rank")
+        ranked = (select(Comment, rank)
+                  .filter(Comment.picture_id.in_(set(picture_ids)), Comment.hidden.is_(False)).subquery())
+        comment = aliased(Comment, ranked)
+        result = await db.execute(
+            select(comment).filter(ranked.c.rank <= per_picture)
+            .order_by(ranked.c.picture_id, ranked.c.rank)
+        )
+        for row in result.scalars():
+            previews[row.picture_id].append(row)
+        return previews
+
+    @staticmethod
+    async def get_threads(db: AsyncSession, photo_id: int, limit: int = 10, after: str = "") -> list[Comment]:
+        """
+        Retrieves a page of top-level threads of a picture with all their replies.
+
+        Threads are ordered by their first comment, replies depth-first below their parent. The
+        page is read with a single range query over ``(picture_id, path)``: from the cursor up
+        to the end of the subtree of the last thread root on the page. At most
+        ``COMMENT_THREAD_PAGE_MAX`` comments are returned; if a thread is cut off, continuing
+        from the path of the last comment returns the rest of it first.
+
+        :param db: The database session.
+        :param photo_id: The ID of the picture.
+        :param limit: Maximum number of top-level threads starting on the page.
+        :param after: Path of the last comment of the previous page, empty for the first page.
+        :return: Comments in display order.
+        """
+        roots = (select(Comment.path)
+                 .filter(Comment.picture_id == photo_id, Comment.parent_id.is_(None), Comment.path > after,
+                         Comment.hidden.is_(False))
+                 .order_by(Comment.path).limit(limit).subquery())
+        # A cursor inside a thread first finishes that thread
+        last_root = func.coalesce(select(func.max(roots.c.path)).scalar_subquery(), after.split(".")[0])
+        result = await db.execute(
+            select(Comment)
+            .filter(Comment.picture_id == photo_id, Comment.path > after, Comment.path < last_root + "/",
+                    Comment.hidden.is_(False), on_visible_picture(photo_id))
+            .order_by(Comment.path)
+            .limit(config.COMMENT_THREAD_PAGE_MAX)
+        )
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def get_replies(db: AsyncSession, comment: Comment, limit: int = 50,
+                          after: Optional[str] = None) -> list[Comment]:
+        """
+        Retrieves the replies below a comment, at any depth, in display order.
+
+        :param db: The database session.
+        :param comment: The comment whose subtree to read.
+        :param limit: Maximum number of replies.
+        :param after: Path of the last reply of the previous page.
+        :return: Replies in display order.
+        """
+        result = await db.execute(
+            select(Comment)
+            .filter(Comment.picture_id == comment.picture_id, Comment.path > max(after or "", comment.path),
+                    Comment.path < subtree_end(comment.path), Comment.hidden.is_(False),
+                    on_visible_picture(comment.picture_id))
+            .order_by(Comment.path)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+    @staticmethod
+    def _moderation_criteria(comment, moderation: CommentModeration) -> list:
+        criteria = []
+        if moderation.ids is not None:
+            criteria.append(comment.id.in_(moderation.ids))
+        if moderation.user_id is not None:
+            criteria.append(comment.user_id == moderation.user_id)
+        if moderation.picture_id is not None:
+            criteria.append(comment.picture_id == moderation.picture_id)
+        if moderation.created_after is not None:
+            criteria.append(comment.created_at >= moderation.created_after)
+        if moderation.created_before is not None:
+            criteria.append(comment.created_at < moderation.created_before)
+        if moderation.text_contains is not None:
+            criteria.append(comment.text.icontains(moderation.text_contains, autoescape=True))
+        return criteria
+
+    @staticmethod
+    async def moderate_comments(db: AsyncSession, moderation: CommentModeration) -> tuple[int, int]:
+        """
+        Deletes, hides or unhides all comments matching a filter, with their replies.
+
+        The comments are changed by one set-based statement and the counts of the affected
+        pictures by one recount, in a single transaction. Stream listeners get one
+        ``comments.moderated`` event per picture, published in one Redis round trip.
+
+        :param db: The database session.
+        :param moderation: The action and the selection criteria.
+        :return: The number of changed comments and of affected pictures.
+        """
+        target = aliased(Comment)
+        criteria = CommentRepository._moderation_criteria(target, moderation)
+        # A selected comment takes its replies along, as when it is deleted on its own
+        in_selected_thread = exists().where(target.picture_id == Comment.picture_id, Comment.path >= target.path,
+                                            Comment.path < subtree_end(target.path), *criteria)
+        selection = [
+            # Restricting to the selected pictures lets the thread check run over the (picture_id, path) index
+            Comment.picture_id.in_(select(target.picture_id).where(*criteria)),
+            or_(and_(*CommentRepository._moderation_criteria(Comment, moderation)), in_selected_thread),
+        ]
+        if moderation.action == "delete":
+            query = delete(Comment).where(*selection)
+        else:
+            hidden = moderation.action == "hide"
+            query = update(Comment).where(*selection, Comment.hidden != hidden).values(hidden=hidden)
+        result = await db.execute(query.returning(Comment.id, Comment.picture_id)
+                                  .execution_options(synchronize_session=False))
+        changed = defaultdict(list)
+        for comment_id, picture_id in result:
+            changed[picture_id].append(comment_id)
+
+        if changed:
+            visible = (select(func.count()).where(Comment.picture_id == Picture.id, Comment.hidden.is_(False))
+                       .scalar_subquery())
+            await db.execute(update(Picture).where(Picture.id.in_(changed)).values(comment_count=visible))
+        await db.commit()
+        await comment_broker.publish_many(
+            (picture_id, "comments.moderated", {"action": moderation.action, "picture_id": picture_id, "ids": ids})
+            for picture_id, ids in changed.items()
+        )
+        return sum(map(len, changed.values())), len(changed)
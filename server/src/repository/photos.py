@@ -1,18 +1,88 @@
-from sqlalchemy import desc
+import logging
+import asyncio
+from fastapi import HTTPException, status
+from sqlalchemy import delete, desc, exists, func, text, true, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload, joinedload
-from typing import List, Optional
+from typing import AsyncIterable, AsyncIterator, List, Optional, Sequence, Tuple
 from datetime import datetime
-import cloudinary.uploader
-from src.database.models import Picture, Tag, User
+from src.services.storage import storage
+from src.database.models import Picture, Role, Tag, User, picture_likes, tags_pictures
+from src.schemas.moderation import PictureModeration
+from src.schemas.photos import PictureImport
 import qrcode
 import io
 
+# Exported picture columns besides the tags
+EXPORT_COLUMNS = ("id", "image_url", "description", "user_id", "qr_code_url", "comment_count", "view_count",
+                  "like_count", "hidden", "created_at", "updated_at")
+
+IMPORT_COLUMNS = ("image_url", "description", "user_id", "qr_code_url", "tags", "hidden", "view_count", "like_count",
+                  "created_at", "updated_at")
+
+# Postgres import: every batch is copied into a temporary table, then merged with set-based statements.
+# ON COMMIT DELETE ROWS empties it after each batch; it lives as long as the pooled connection.
+IMPORT_STAGING_SQL = (
+    "CREATE TEMPORARY TABLE IF NOT EXISTS picture_import (image_url text, description text, user_id integer, "
+    "qr_code_url text, tags text[], hidden boolean, view_count integer, like_count integer, created_at timestamp, "
+    "updated_at timestamp) ON COMMIT DELETE ROWS"
+)
+IMPORT_MERGE_SQL = (
+    "INSERT INTO pictures (image_url, description, user_id, qr_code_url, comment_count, hidden, view_count, "
+    "like_count, created_at, updated_at) SELECT image_url, description, user_id, qr_code_url, 0, hidden, "
+    "view_count, like_count, created_at, updated_at "
+    "FROM picture_import ON CONFLICT (image_url) DO NOTHING",
+    "INSERT INTO tags (name) SELECT DISTINCT unnest(tags) FROM picture_import ON CONFLICT (name) DO NOTHING",
+    "INSERT INTO tags_pictures (picture_id, tag_id) SELECT DISTINCT pictures.id, tags.id FROM picture_import "
+    "JOIN pictures ON pictures.image_url = picture_import.image_url "
+    "CROSS JOIN LATERAL unnest(picture_import.tags) AS tag(name) JOIN tags ON tags.name = tag.name "
+    "ON CONFLICT DO NOTHING",
+)
+
 
 class PictureRepository:
 
+    @staticmethod
+    def _changeable_by(user: User):
+        """
+        Predicate of the pictures a user may change: their own, or any picture for an admin.
+
+        :param user: The acting user.
+        :type user: User
+        :return: A SQL expression for the WHERE clause.
+        """
+        return true() if user.role == Role.admin else Picture.user_id == user.id
+
+    @staticmethod
+    def _visible():
+        """
+        Predicate of the pictures not hidden by moderation.
+
+        A hidden picture is missing to every per-picture read and change except deletion, as it is to search.
+
+        :return: A SQL expression for the WHERE clause.
+        """
+        return Picture.hidden.is_(False)
+
+    @staticmethod
+    async def _raise_if_exists(picture_id: int, db: AsyncSession) -> None:
+        """
+        Tell a forbidden change from a missing picture after a guarded statement matched no row.
+
+        Only runs on the failure path, so a successful change stays a single statement.
+
+        :param picture_id: The ID of the picture.
+        :type picture_id: int
+        :param db: The database session.
+        :type db: AsyncSession
+        :raises HTTPException: 403 if the picture exists.
+        """
+        if await db.scalar(select(exists().where(Picture.id == picture_id))):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+
     @staticmethod
     async def post_picture(description: Optional[str], tags: Optional[List[str]], file, user_id, db: AsyncSession):
         """
@@ -33,7 +103,7 @@ class PictureRepository:
         """
         try:
             # Upload the picture to Cloudinary
-            upload_result = cloudinary.uploader.upload(file)
+            upload_result = await storage.upload(file)
             url = upload_result['secure_url']
 
             # Create a new Picture object
@@ -80,11 +150,11 @@ class PictureRepository:
         :type picture_id: int
         :param db: The database session.
         :type db: AsyncSession
-        :return: The picture with the specified ID, or None if it does not exist.
+        :return: The picture with the specified ID, or None if it does not exist or is hidden.
         :rtype: Optional[Picture]
         """
 
-        result = await db.execute(select(Picture).filter(Picture.id == picture_id))
+        result = await db.execute(select(Picture).filter(Picture.id == picture_id, PictureRepository._visible()))
         picture = result.scalar_one_or_none()
         return picture
 
@@ -120,7 +190,7 @@ class PictureRepository:
             picture_result = await db.execute(
                 select(Picture)
                 .options(selectinload(Picture.tags))
-                .filter(Picture.id == picture_id)
+                .filter(Picture.id == picture_id, PictureRepository._visible())
             )
             picture = picture_result.scalars().one_or_none()
 
@@ -192,7 +262,7 @@ class PictureRepository:
         :return: A list of pictures matching the search criteria.
         :rtype: List[Picture]
         """
-        query = select(Picture).options(joinedload(Picture.tags))
+        query = select(Picture).options(joinedload(Picture.tags)).filter(PictureRepository._visible())
 
         if search_term:
             query = query.filter(Picture.description.ilike(f'%{search_term}%'))
@@ -231,7 +301,8 @@ class PictureRepository:
          """
 
         # Retrieve the picture from the database
-        result = await db.execute(select(Picture).filter(Picture.id == picture_id, Picture.user_id == user_id))
+        result = await db.execute(select(Picture).filter(Picture.id == picture_id, Picture.user_id == user_id,
+                                                         PictureRepository._visible()))
         picture = result.scalar_one_or_none()
         if not picture:
             return None
@@ -242,7 +313,7 @@ class PictureRepository:
 
         # Perform the transformation using Cloudinary
         try:
-            transformed = cloudinary.uploader.explicit(
+            transformed = await storage.explicit(
                 public_id, type="upload", **transformation)
             transformed_url = transformed['secure_url']
         except Exception as e:
@@ -276,7 +347,8 @@ class PictureRepository:
         """
 
         # Retrieve the picture from the database
-        result = await db.execute(select(Picture).filter(Picture.id == picture_id, Picture.user_id == user_id))
+        result = await db.execute(select(Picture).filter(Picture.id == picture_id, Picture.user_id == user_id,
+                                                         PictureRepository._visible()))
         picture = result.scalar_one_or_none()
         if not picture:
             return None
@@ -294,7 +366,7 @@ class PictureRepository:
         }
 
         try:
-            transformed = cloudinary.uploader.explicit(
+            transformed = await storage.explicit(
                 public_id, type="upload", **transformation)
             transformed_url = transformed['secure_url']
         except Exception as e:
@@ -328,7 +400,7 @@ class PictureRepository:
         result = await db.execute(
             select(Picture)
             .options(joinedload(Picture.tags))
-            .filter(Picture.id == picture_id, Picture.user_id == user_id)
+            .filter(Picture.id == picture_id, Picture.user_id == user_id, PictureRepository._visible())
         )
 
         # Call unique() on the result to handle duplicates
@@ -340,51 +412,312 @@ class PictureRepository:
         return [tag.name for tag in picture.tags]
 
     @staticmethod
-    async def delete_picture(picture_id: int, db: AsyncSession):
+    async def delete_picture(picture_id: int, db: AsyncSession, user: Optional[User] = None):
         """
         Deletes a single picture with the specified ID from the database.
+
+        The ownership check is part of the ``DELETE ... RETURNING`` statement, so the picture is
+        neither read beforehand nor reloaded afterwards. Comments and tag links are removed by
+        the ``ON DELETE CASCADE`` of their foreign keys.
+
         :param picture_id: The ID of the picture to delete.
         :type picture_id: int
         :param db: The database session.
-        :type db: Session
+        :type db: AsyncSession
+        :param user: The user deleting the picture; None skips the ownership check.
+        :type user: Optional[User]
         :return: The deleted picture, or None if it does not exist.
         :rtype: Picture | None
+        :raises HTTPException: 403 if the picture exists but the user may not delete it.
         """
-        picture = await db.execute(select(Picture).filter(Picture.id == picture_id))
-        picture = picture.scalar_one_or_none()
+        query = delete(Picture).where(Picture.id == picture_id)
+        if user is not None:
+            query = query.where(PictureRepository._changeable_by(user))
+        result = await db.scalars(query.returning(Picture), execution_options={"synchronize_session": False})
+        picture = result.one_or_none()
         if not picture:
+            if user is not None:
+                await PictureRepository._raise_if_exists(picture_id, db)
             return None
 
-        await db.delete(picture)
+        # Detached, the returned state survives the commit instead of being expired and reloaded
+        db.expunge(picture)
         await db.commit()
 
         return picture
 
     @staticmethod
-    async def create_qrcode(picture_id: int, db: AsyncSession):
-        picture = await db.execute(select(Picture).filter(Picture.id == picture_id))
-        picture = picture.scalar_one_or_none()
-        if not picture:
-            return None
-
+    def _render_qrcode(data: str) -> io.BytesIO:
         qr = qrcode.QRCode(
             version=1,
             error_correction=qrcode.constants.ERROR_CORRECT_H,
             box_size=10,
         )
-        qr.add_data(picture.image_url)
+        qr.add_data(data)
         qr.make(fit=True)
         img = qr.make_image()
 
         byte_arr = io.BytesIO()
         img.save(byte_arr, format='PNG')
         byte_arr.seek(0)
+        return byte_arr
 
-        qr_code_url = cloudinary.uploader.upload(byte_arr)['secure_url']
+    @staticmethod
+    async def create_qrcode(picture_id: int, db: AsyncSession, user: Optional[User] = None):
+        """
+        Render a QR code of the picture URL, upload it and store its URL on the picture.
 
-        picture.qr_code_url = qr_code_url
-        db.add(picture)
+        The picture is read once, for its URL and owner, and written with a guarded
+        ``UPDATE ... RETURNING``; a picture deleted or handed over in the meantime is not written.
+
+        :param picture_id: The ID of the picture.
+        :type picture_id: int
+        :param db: The database session.
+        :type db: AsyncSession
+        :param user: The user requesting the QR code; None skips the ownership check.
+        :type user: Optional[User]
+        :return: The updated picture, or None if it does not exist or is hidden.
+        :rtype: Optional[Picture]
+        :raises HTTPException: 403 if the picture exists but the user may not change it.
+        """
+        query = select(Picture.image_url).where(Picture.id == picture_id, PictureRepository._visible())
+        if user is not None:
+            query = query.add_columns(PictureRepository._changeable_by(user))
+        row = (await db.execute(query)).one_or_none()
+        if not row:
+            return None
+        if user is not None and not row[1]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+
+        # Rendering the QR code is CPU bound, keep it off the event loop
+        byte_arr = await asyncio.to_thread(PictureRepository._render_qrcode, row[0])
+
+        qr_code_url = (await storage.upload(byte_arr))['secure_url']
+
+        query = update(Picture).where(Picture.id == picture_id, PictureRepository._visible())
+        if user is not None:
+            query = query.where(PictureRepository._changeable_by(user))
+        result = await db.scalars(query.values(qr_code_url=qr_code_url, updated_at=datetime.now())
+                                  .returning(Picture), execution_options={"synchronize_session": False})
+        picture = result.one_or_none()
+        if not picture:
+            return None
+        db.expunge(picture)
         await db.commit()
-        await db.refresh(picture)
 
         return picture
+
+    @staticmethod
+    async def moderate_pictures(db: AsyncSession, moderation: PictureModeration) -> int:
+        """
+        Deletes, hides or unhides all pictures matching a filter with one set-based statement.
+
+        Comments and tag links of deleted pictures are removed by the ``ON DELETE CASCADE`` of
+        their foreign keys.
+
+        :param db: The database session.
+        :type db: AsyncSession
+        :param moderation: The action and the selection criteria.
+        :type moderation: PictureModeration
+        :return: The number of changed pictures.
+        :rtype: int
+        """
+        criteria = []
+        if moderation.ids is not None:
+            criteria.append(Picture.id.in_(moderation.ids))
+        if moderation.user_id is not None:
+            criteria.append(Picture.user_id == moderation.user_id)
+        if moderation.created_after is not None:
+            criteria.append(Picture.created_at >= moderation.created_after)
+        if moderation.created_before is not None:
+            criteria.append(Picture.created_at < moderation.created_before)
+        if moderation.description_contains is not None:
+            criteria.append(Picture.description.icontains(moderation.description_contains, autoescape=True))
+
+        if moderation.action == "delete":
+            query = delete(Picture).where(*criteria)
+        else:
+            hidden = moderation.action == "hide"
+            query = update(Picture).where(*criteria, Picture.hidden != hidden).values(hidden=hidden)
+        result = await db.execute(query.execution_options(synchronize_session=False))
+        await db.commit()
+        return result.rowcount
+
+    @staticmethod
+    async def stream_metadata(db: AsyncSession, batch_size: int = 1000) -> AsyncIterator[Sequence]:
+        """
+        Streams the metadata of all pictures, ordered by ID, in batches.
+
+        Tags are aggregated per picture by a correlated subquery over the ``tags_pictures`` primary
+        key, so a single query is streamed through a server-side cursor and memory use does not
+        depend on the number of pictures.
+
+        :param db: The database session; it stays busy until the stream ends.
+        :type db: AsyncSession
+        :param batch_size: Rows fetched per round trip.
+        :type batch_size: int
+        :return: Batches of rows of ``EXPORT_COLUMNS`` followed by the comma-separated tag names.
+        :rtype: AsyncIterator[Sequence[Row]]
+        """
+        tags = (select(func.aggregate_strings(Tag.name, ","))
+                .select_from(tags_pictures.join(Tag))
+                .where(tags_pictures.c.picture_id == Picture.id)
+                .scalar_subquery())
+        query = (select(*(getattr(Picture, column) for column in EXPORT_COLUMNS), tags.label("tags"))
+                 .order_by(Picture.id)
+                 .execution_options(yield_per=batch_size))
+        result = await db.stream(query)
+        async for batch in result.partitions():
+            yield batch
+
+    @staticmethod
+    async def import_metadata(db: AsyncSession, records: AsyncIterable[Tuple[int, PictureImport]],
+                              batch_size: int = 1000) -> dict:
+        """
+        Imports picture metadata, e.g. from an export, in batches of one transaction each.
+
+        Pictures are matched by ``image_url``: existing pictures are left as they are and only get
+        missing tags linked, so an interrupted import can simply be run again. Tags are created and
+        resolved in bulk. On Postgres with asyncpg every batch is loaded with ``COPY``; other
+        databases get chunked ``executemany`` inserts.
+
+        :param db: The database session.
+        :type db: AsyncSession
+        :param records: The pictures to import with their line numbers; they are consumed as they arrive.
+        :type records: AsyncIterable[Tuple[int, PictureImport]]
+        :param batch_size: Pictures per batch.
+        :type batch_size: int
+        :return: The numbers of records read and of pictures created.
+        :rtype: dict
+        :raises HTTPException: 400 naming the line if a record references an unknown author or
+            violates another constraint; the batches before it are committed.
+        """
+        connection = await db.connection()
+        copy = connection.dialect.name == "postgresql" and connection.dialect.driver == "asyncpg"
+        load = PictureRepository._copy_batch if copy else PictureRepository._insert_batch
+        counts = {"records": 0, "created": 0}
+        batch = []
+        async for record in records:
+            batch.append(record)
+            if len(batch) == batch_size:
+                counts["created"] += await PictureRepository._load_batch(db, load, batch)
+                counts["records"] += len(batch)
+                batch = []
+        if batch:
+            counts["created"] += await PictureRepository._load_batch(db, load, batch)
+            counts["records"] += len(batch)
+        return counts
+
+    @staticmethod
+    async def _load_batch(db: AsyncSession, load, batch: List[Tuple[int, PictureImport]]) -> int:
+        # Authors are checked up front, as the constraint error of a batch would not tell the line
+        user_ids = {record.user_id for _, record in batch}
+        known = set((await db.scalars(select(User.id).where(User.id.in_(user_ids)))).all())
+        for number, record in batch:
+            if record.user_id not in known:
+                await db.rollback()
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail=f"Line {number}: Unknown user_id {record.user_id}")
+        try:
+            return await load(db, [record for _, record in batch])
+        except IntegrityError as err:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Lines {batch[0][0]}-{batch[-1][0]}: {err.orig}")
+
+    @staticmethod
+    def _import_rows(batch: List[PictureImport]) -> List[dict]:
+        now = datetime.now()
+        return [{"image_url": record.image_url, "description": record.description, "user_id": record.user_id,
+                 "qr_code_url": record.qr_code_url, "tags": sorted(set(record.tags)), "hidden": record.hidden,
+                 "view_count": record.view_count, "like_count": record.like_count,
+                 "created_at": record.created_at or now, "updated_at": record.updated_at or record.created_at or now}
+                for record in batch]
+
+    @staticmethod
+    async def _insert_for(db: AsyncSession):
+        # The dialect's insert construct, for ON CONFLICT clauses
+        connection = await db.connection()
+        return postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+
+    @staticmethod
+    async def _copy_batch(db: AsyncSession, batch: List[PictureImport]) -> int:
+        rows = PictureRepository._import_rows(batch)
+        await db.execute(text(IMPORT_STAGING_SQL))
+        connection = await (await db.connection()).get_raw_connection()
+        await connection.driver_connection.copy_records_to_table(
+            "picture_import", records=[tuple(row[column] for column in IMPORT_COLUMNS) for row in rows],
+            columns=IMPORT_COLUMNS)
+        created = (await db.execute(text(IMPORT_MERGE_SQL[0]))).rowcount
+        for statement in IMPORT_MERGE_SQL[1:]:
+            await db.execute(text(statement))
+        await db.commit()
+        return created
+
+    @staticmethod
+    async def _insert_batch(db: AsyncSession, batch: List[PictureImport]) -> int:
+        insert = await PictureRepository._insert_for(db)
+        rows = PictureRepository._import_rows(batch)
+
+        result = await db.execute(
+            insert(Picture.__table__).on_conflict_do_nothing(index_elements=["image_url"]),
+            [{column: row[column] for column in IMPORT_COLUMNS if column != "tags"} for row in rows])
+        names = {name for row in rows for name in row["tags"]}
+        if names:
+            await db.execute(insert(Tag.__table__).on_conflict_do_nothing(index_elements=["name"]),
+                             [{"name": name} for name in names])
+            tag_ids = dict((await db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names)))).all())
+            picture_ids = dict((await db.execute(
+                select(Picture.image_url, Picture.id).where(Picture.image_url.in_([row["image_url"] for row in rows]))
+            )).all())
+            await db.execute(
+                insert(tags_pictures).on_conflict_do_nothing(),
+                [{"picture_id": picture_ids[row["image_url"]], "tag_id": tag_ids[name]}
+                 for row in rows for name in row["tags"]])
+        await db.commit()
+        return max(result.rowcount, 0)
+
+    @staticmethod
+    async def like_picture(picture_id: int, user_id: int, db: AsyncSession) -> Optional[bool]:
+        """
+        Record that a user likes a picture.
+
+        Only the like itself is written here; the like count is incremented behind by the caller.
+
+        :param picture_id: The ID of the picture.
+        :type picture_id: int
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :param db: The database session.
+        :type db: AsyncSession
+        :return: True if the like is new, False if the user already liked the picture, None if the
+            picture does not exist or is hidden.
+        :rtype: Optional[bool]
+        """
+        if not await db.scalar(select(exists().where(Picture.id == picture_id, PictureRepository._visible()))):
+            return None
+        insert = await PictureRepository._insert_for(db)
+        result = await db.execute(insert(picture_likes).values(picture_id=picture_id, user_id=user_id,
+                                                               created_at=datetime.now())
+                                  .on_conflict_do_nothing())
+        await db.commit()
+        return result.rowcount > 0
+
+    @staticmethod
+    async def unlike_picture(picture_id: int, user_id: int, db: AsyncSession) -> bool:
+        """
+        Withdraw a like of a user.
+
+        :param picture_id: The ID of the picture.
+        :type picture_id: int
+        :param user_id: The ID of the user.
+        :type user_id: int
+        :param db: The database session.
+        :type db: AsyncSession
+        :return: True if the user had liked the picture.
+        :rtype: bool
+        """
+        result = await db.execute(delete(picture_likes).where(picture_likes.c.picture_id == picture_id,
+                                                              picture_likes.c.user_id == user_id))
+        await db.commit()
+        return result.rowcount > 0
@@ -1,6 +1,7 @@
-from typing import Optional, Sequence
+from datetime import datetime
+from typing import AsyncIterator, Optional, Sequence
 from fastapi import Depends, HTTPException, status
-from sqlalchemy import select, func, update
+from sqlalchemy import Row, select, func, update
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from libgravatar import Gravatar
@@ -94,17 +95,64 @@ async def update_avatar_url(email: str, url: Optional[str], db: AsyncSession) ->
     return user
 
 
-async def get_all_users(db: AsyncSession = Depends(get_db)) -> Sequence[User]:
+def _user_filters(role: Optional[Role] = None, confirmed: Optional[bool] = None,
+                  created_after: Optional[datetime] = None, created_before: Optional[datetime] = None) -> list:
+    criteria = []
+    if role is not None:
+        criteria.append(User.role == role)
+    if confirmed is not None:
+        criteria.append(User.confirmed.is_(confirmed))
+    if created_after is not None:
+        criteria.append(User.created_at >= created_after)
+    if created_before is not None:
+        criteria.append(User.created_at < created_before)
+    return criteria
+
+
+async def get_users(db: AsyncSession, limit: int = 50, after: Optional[int] = None, **filters) -> Sequence[User]:
     """
-    Retrieves all users from the database.
+    Retrieves a page of users ordered by ID.
+
+    Pages are read by keyset on the primary key, so every page costs the same however far
+    into the table it is.
 
     :param db: AsyncSession instance for database interaction.
+    :param limit: Maximum number of users to return.
+    :param after: ID of the last user of the previous page.
+    :param filters: ``role``, ``confirmed``, ``created_after`` and ``created_before``.
     :return: List of User objects.
     """
-    stmt = select(User)
-    result = await db.execute(stmt)
-    users = result.scalars().all()
-    return users
+    stmt = select(User).where(*_user_filters(**filters))
+    if after is not None:
+        stmt = stmt.where(User.id > after)
+    result = await db.execute(stmt.order_by(User.id).limit(limit))
+    return result.scalars().all()
+
+
+# Exported columns; credentials and tokens never leave the database
+EXPORT_COLUMNS = ("id", "username", "email", "role", "confirmed", "created_at")
+
+
+async def stream_users(db: AsyncSession, batch_size: int = 1000, **filters) -> AsyncIterator[Sequence[Row]]:
+    """
+    Streams the users matching the filters, ordered by ID, in batches.
+
+    The rows are read through a server-side cursor ``batch_size`` at a time, so memory use does
+    not depend on the number of users. Plain rows of ``EXPORT_COLUMNS`` are fetched rather than
+    User objects, which keeps the identity map out of the way.
+
+    :param db: AsyncSession instance for database interaction; it stays busy until the stream ends.
+    :param batch_size: Rows fetched per round trip.
+    :param filters: ``role``, ``confirmed``, ``created_after`` and ``created_before``.
+    :return: Batches of rows.
+    """
+    stmt = (select(*(getattr(User, column) for column in EXPORT_COLUMNS))
+            .where(*_user_filters(**filters))
+            .order_by(User.id)
+            .execution_options(yield_per=batch_size))
+    result = await db.stream(stmt)
+    async for batch in result.partitions():
+        yield batch
 
 
 async def get_user_by_id(user_id: int, db: AsyncSession = Depends(get_db)) -> Optional[User]:
@@ -1,11 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Literal, Optional
 
-from src.database.db import get_db
+from src.conf.config import config
+from src.database.cache import redis_manager
+from src.database.db import get_db, get_read_db, sessionmanager
 from src.database.models import User, Role
+from src.schemas.photos import PictureImport
 from src.schemas.user import UserOut, UserRoleUpdate
-from src.repository import users as repository_users
+from src.repository import photos as repository_photos, users as repository_users
+from src.repository.photos import PictureRepository
+from src.services.loop_monitor import loop_monitor
+from src.services.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from src.services.profiler import profile_store, to_collapsed
 from src.services.user import RoleAccess
 
 router = APIRouter(
@@ -15,19 +30,152 @@ router = APIRouter(
 )
 
 
+def _export_value(value):
+    if isinstance(value, Role):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _ndjson(rows) -> str:
+    return "".join(json.dumps({column: _export_value(value) for column, value in zip(repository_users.EXPORT_COLUMNS, row)})
+                   + "\n" for row in rows)
+
+
+def _csv(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_export_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+class UserFilters:
+    """
+    Query parameters shared by the user listing and export.
+    """
+
+    def __init__(self, role: Optional[Role] = None, confirmed: Optional[bool] = None,
+                 created_after: Optional[datetime] = None, created_before: Optional[datetime] = None):
+        self.role = role
+        self.confirmed = confirmed
+        self.created_after = created_after
+        self.created_before = created_before
+
+
 @router.get("/users", response_model=List[UserOut])
-async def get_users(db: AsyncSession = Depends(get_db)):
+async def get_users(response: Response, cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=500),
+                    filters: UserFilters = Depends(), db: AsyncSession = Depends(get_read_db)):
     """
-    Retrieve all users.
+    Retrieve a page of users ordered by ID.
 
+    A full page carries the cursor of the next one in the ``X-Next-Cursor`` header; pass it back
+    as ``cursor`` with the same filters.
+
+    :param response: The outgoing response, for the cursor header.
+    :param cursor: Cursor of the page to read, from the previous page.
+    :param limit: Maximum number of users per page.
+    :param filters: Role, confirmation and creation time filters.
     :param db: AsyncSession instance for database interaction.
     :return: List of User objects.
     """
+    after = decode_cursor(cursor, int)
     try:
-        users = await repository_users.get_all_users(db)
-        return users
+        users = await repository_users.get_users(db, limit=limit, after=after[0] if after else None,
+                                                 **vars(filters))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    if len(users) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(users[-1].id)
+    return users
+
+
+@router.get("/users/export")
+async def export_users(format: Literal["ndjson", "csv"] = Query("ndjson"), filters: UserFilters = Depends()):
+    """
+    Export the users matching the filters as NDJSON or CSV.
+
+    The export is streamed from a server-side cursor, so the worker's memory use does not grow with
+    the number of users. Passwords and tokens are not exported.
+
+    :param format: ``ndjson`` (one JSON object per line) or ``csv`` with a header row.
+    :param filters: Role, confirmation and creation time filters.
+    :return: The streamed export.
+    """
+    encode = _csv if format == "csv" else _ndjson
+
+    async def body():
+        if format == "csv":
+            yield _csv([repository_users.EXPORT_COLUMNS])
+        # Opened by the body: depending on the FastAPI version, a dependency session is closed
+        # before the response is streamed
+        async with sessionmanager.lazy_session(read=True) as db:
+            async for rows in repository_users.stream_users(db, batch_size=config.USER_EXPORT_BATCH_SIZE,
+                                                            **vars(filters)):
+                yield encode(rows)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="users.{format}"'})
+
+
+@router.get("/pictures/export")
+async def export_pictures():
+    """
+    Export the metadata of all pictures as NDJSON, one picture with its tags and counts per line.
+
+    The export is streamed from a server-side cursor, so the worker's memory use does not grow with
+    the number of pictures. Its lines can be loaded again with ``POST /admin/pictures/import``.
+
+    :return: The streamed export.
+    """
+    columns = repository_photos.EXPORT_COLUMNS
+
+    async def body():
+        # Opened by the body, like the user export's session
+        async with sessionmanager.lazy_session(read=True) as db:
+            async for rows in PictureRepository.stream_metadata(db, batch_size=config.PICTURE_TRANSFER_BATCH_SIZE):
+                yield "".join(json.dumps({**{column: _export_value(value) for column, value in zip(columns, row)},
+                                          "tags": sorted(row.tags.split(",")) if row.tags else []}) + "\n"
+                              for row in rows)
+
+    return StreamingResponse(body(), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": 'attachment; filename="pictures.ndjson"'})
+
+
+@router.post("/pictures/import")
+async def import_pictures(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Import picture metadata from an NDJSON request body, e.g. an export of another instance.
+
+    The body is read as it arrives and loaded in batches of one transaction each. Pictures are
+    matched by ``image_url``: existing ones are kept and only get missing tags, so a failed import
+    can be sent again as a whole. Authors are referenced by ``user_id`` and must exist.
+
+    :param request: The incoming request with one JSON picture per line.
+    :param db: AsyncSession instance for database interaction.
+    :return: The numbers of records read and of pictures created.
+    """
+    async def records():
+        number, pending = 0, b""
+        async for chunk in request.stream():
+            *lines, pending = (pending + chunk).split(b"\n")
+            for line in lines:
+                number += 1
+                if line.strip():
+                    yield number, _parse_import_line(number, line)
+        if pending.strip():
+            yield number + 1, _parse_import_line(number + 1, pending)
+
+    return await PictureRepository.import_metadata(db, records(), batch_size=config.PICTURE_TRANSFER_BATCH_SIZE)
+
+
+def _parse_import_line(number: int, line: bytes) -> PictureImport:
+    try:
+        return PictureImport.model_validate_json(line)
+    except ValidationError as err:
+        # Batches before this line are already committed; importing them again is a no-op
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Line {number}: {err.errors(include_url=False)[0]['msg']}")
 
 
 @router.put("/users/{user_id}/role", response_model=None)
@@ -49,3 +197,50 @@ async def update_role(user_id: int, role_update: UserRoleUpdate, db: AsyncSessio
         return updated_user
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/pools")
+async def get_pool_stats():
+    """
+    Retrieve connection pool statistics of this worker.
+
+    :return: Pool statistics per backend.
+    """
+    return {"redis": redis_manager.stats(), "db": sessionmanager.pool_stats()}
+
+
+@router.get("/loop")
+async def get_loop_stats():
+    """
+    Retrieve event loop lag statistics of this worker.
+
+    :return: The maximum lag seen and the stacks captured while the loop was blocked (debug mode).
+    """
+    return {"max_lag": round(loop_monitor.max_lag, 6), "blocks": list(loop_monitor.blocks)}
+
+
+@router.get("/profiles")
+async def get_profiles():
+    """
+    List the stored request profiles, newest first.
+
+    :return: Profile summaries.
+    """
+    return await asyncio.to_thread(profile_store.list)
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: Literal["speedscope", "collapsed"] = Query("speedscope")):
+    """
+    Retrieve a stored request profile.
+
+    :param profile_id: The ID of the profile.
+    :param format: ``speedscope`` JSON or ``collapsed`` stacks for flame graph tools.
+    :return: The profile.
+    """
+    document = await asyncio.to_thread(profile_store.load, profile_id)
+    if document is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(to_collapsed(document))
+    return document
@@ -1,18 +1,25 @@
+import asyncio
+from typing import List
+
 from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.repository import users as repository_users
-from src.schemas.user import UserSchema, TokenSchema, UserResponse, RequestEmail
+from src.database.models import User
+from src.schemas.user import UserSchema, TokenSchema, UserResponse, RequestEmail, SessionResponse
 from src.services.auth import auth_service
 from src.services.email import send_email
+from src.services.rate_limit import RateLimit
+from src.services.sessions import ROTATED, REUSED
 
 router = APIRouter(prefix='/auth', tags=['auth'])
 get_refresh_token = HTTPBearer()
 
 
-@router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+@router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(RateLimit("signup"))])
 async def signup(body: UserSchema, bt: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Register a new user.
@@ -27,7 +34,7 @@ async def signup(body: UserSchema, bt: BackgroundTasks, request: Request, db: As
         exist_user = await repository_users.get_user_by_email(body.email, db)
         if exist_user:
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-        body.password = auth_service.get_password_hash(body.password)
+        body.password = await asyncio.to_thread(auth_service.get_password_hash, body.password)
         new_user = await repository_users.create_user(body, db)
         bt.add_task(send_email, new_user.email,
                     new_user.username, str(request.base_url))
@@ -41,12 +48,13 @@ async def signup(body: UserSchema, bt: BackgroundTasks, request: Request, db: As
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
 
-@router.post("/login", response_model=TokenSchema)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+@router.post("/login", response_model=TokenSchema, dependencies=[Depends(RateLimit("login"))])
+async def login(request: Request, body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
-    Log in a user and generate access tokens.
+    Log in a user, open a session for the device and generate tokens.
 
-    :param body: OAuth2PasswordRequestForm containing login credentials.
+    :param request: Request object to retrieve the device user agent.
+    :param body: OAuth2PasswordRequestForm containing login credentials; client_id labels the device.
     :param db: AsyncSession instance for database interaction.
     :return: TokenSchema containing access_token and refresh_token.
     """
@@ -57,24 +65,25 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
     if not user.confirmed:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    if not await asyncio.to_thread(auth_service.verify_password, body.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
-    # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email, "test": "ВалЄра"})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
+    device = body.client_id or request.headers.get("user-agent")
+    session_id, jti = await auth_service.sessions.open(user.email, user.username, device)
+    access_token, refresh_token = await auth_service.create_session_tokens(user.email, session_id, jti)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer", "username": user.username}
 
 
 @router.post("/logout")
-async def logout_user(background_tasks: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
+async def logout_user(background_tasks: BackgroundTasks, request: Request):
     """
-    Log out a user by revoking access tokens.
+    Log out a user by revoking the access token and its session.
+
+    The Authorization header may carry the access token (revoked until it expires) or, for older
+    clients, the refresh token; either way the session it belongs to is revoked.
 
     :param background_tasks: BackgroundTasks to run token revocation asynchronously.
-    :param request: Request object to retrieve user's email.
-    :param db: AsyncSession instance for database interaction.
+    :param request: Request object to retrieve the token.
     :return: Success message if user is logged out.
     """
     authorization_header = request.headers.get("Authorization")
@@ -88,34 +97,72 @@ async def logout_user(background_tasks: BackgroundTasks, request: Request, db: A
                             detail="Invalid Authorization header format")
 
     token = token_parts[1]
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    await repository_users.update_token(user, None, db)
+    payload = await auth_service.decode_token(token)
+    if payload.get("scope") == "access_token":
+        await auth_service.revoke_access_token(payload)
+    elif payload.get("scope") != "refresh_token":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid scope for token")
+    if payload.get("sid"):
+        await auth_service.sessions.revoke(payload["sub"], payload["sid"])
     return {"message": "User logged out successfully"}
 
 
 @router.get('/refresh_token', response_model=TokenSchema)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Depends(get_refresh_token),
-                        db: AsyncSession = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Depends(get_refresh_token)):
     """
     Refresh access_token using refresh_token.
 
+    The session store rotates the refresh token without touching the database. Presenting a
+    refresh token that was already exchanged revokes the whole session.
+
     :param credentials: HTTPAuthorizationCredentials containing refresh_token.
-    :param db: AsyncSession instance for database interaction.
     :return: TokenSchema containing refreshed access_token and new refresh_token.
     """
-    token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
+    payload = await auth_service.decode_refresh_claims(credentials.credentials)
+    email, session_id, jti = payload["sub"], payload.get("sid"), payload.get("jti")
+    if not session_id or not jti:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+    new_jti = auth_service.sessions.new_token_id()
+    outcome, username = await auth_service.sessions.rotate(email, session_id, jti, new_jti)
+    if outcome == REUSED:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token reuse detected, session revoked")
+    if outcome != ROTATED:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
-    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+    access_token, refresh_token = await auth_service.create_session_tokens(email, session_id, new_jti)
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer",
+            "username": username}
+
+
+@router.get('/sessions', response_model=List[SessionResponse])
+async def get_sessions(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    List the active sessions (devices) of the current user.
+
+    :param current_user: The current authenticated user.
+    :return: List of SessionResponse objects.
+    """
+    return await auth_service.sessions.list_sessions(current_user.email)
+
+
+@router.delete('/sessions/{session_id}')
+async def revoke_session(session_id: str, current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Revoke one session (device) of the current user.
+
+    :param session_id: The ID of the session to revoke.
+    :param current_user: The current authenticated user.
+    :return: Success message if the session is revoked.
+    """
+    session = await auth_service.sessions.get(session_id)
+    if session is None or session["email"] != current_user.email:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    await auth_service.sessions.revoke(current_user.email, session_id)
+    return {"message": "Session revoked"}
 
 
 @router.get('/confirmed_email/{token}')
@@ -1,37 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from typing import List
-from src.database.db import get_db
+from typing import List, Optional
+from src.database.db import get_db, get_read_db
 from src.schemas.comments import CommentCreate, CommentUpdate, CommentOut
 from src.services.auth import auth_service
 from src.repository.comments import CommentRepository
 from src.database.models import User, Comment, Role
 from src.services.user import RoleAccess
+from src.services.rate_limit import RateLimit
+from src.conf.config import config
+from src.services.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 
 router = APIRouter(prefix='/comments', tags=['comments'])
 
 
-@router.post("/photos/{photo_id}/comments", response_model=CommentOut)
+@router.post("/photos/{photo_id}/comments", response_model=CommentOut, dependencies=[Depends(RateLimit("comments"))])
 async def create_comment(photo_id: int, comment: CommentCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
     return await CommentRepository.create_comment(db, comment, current_user.id, photo_id)
 
 
 @router.put("/comments/{comment_id}", response_model=CommentOut)
 async def update_comment(comment_id: int, comment: CommentUpdate, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
-    result = await db.execute(select(Comment).filter(Comment.id == comment_id))
-    db_comment = result.scalars().first()
-
-    if not db_comment:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
-
-    if current_user.id != db_comment.user_id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                            detail="You can only edit your own comments")
-
-    updated_comment = await CommentRepository.update_comment(db, comment_id, comment)
-    return updated_comment
+    return await CommentRepository.update_comment(db, comment_id, comment, current_user.id)
 
 
 @router.delete("/comments/{comment_id}", dependencies=[Depends(RoleAccess([Role.admin, Role.moderator]))])
@@ -41,5 +32,47 @@ async def delete_comment(comment_id: int, db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/photos/{photo_id}/comments", response_model=List[CommentOut])
-async def get_comments(photo_id: int, skip: int = Query(0, ge=0), limit: int = Query(10, ge=1), db: AsyncSession = Depends(get_db)):
-    return await CommentRepository.get_comments(db, photo_id, skip=skip, limit=limit)
+async def get_comments(photo_id: int, response: Response, cursor: Optional[str] = None,
+                       skip: int = Query(0, ge=0, deprecated=True), limit: int = Query(10, ge=1, le=100),
+                       db: AsyncSession = Depends(get_read_db)):
+    """
+    Comments of a picture, oldest first. A full page carries the cursor of the next one in the
+    ``X-Next-Cursor`` header; pass it back as ``cursor``.
+    """
+    comments = await CommentRepository.get_comments(db, photo_id, skip=skip, limit=limit,
+                                                    after=decode_cursor(cursor, datetime, int))
+    if len(comments) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(comments[-1].created_at, comments[-1].id)
+    return comments
+
+
+@router.get("/photos/{photo_id}/threads", response_model=List[CommentOut])
+async def get_threads(photo_id: int, response: Response, cursor: Optional[str] = None,
+                      limit: int = Query(10, ge=1, le=50), db: AsyncSession = Depends(get_read_db)):
+    """
+    Top-level comment threads of a picture with their replies, in display order. Every comment
+    carries its ``parent_id`` and ``depth`` for indentation. When more comments follow, the
+    ``X-Next-Cursor`` header holds the cursor of the next page.
+    """
+    after = decode_cursor(cursor, str)
+    comments = await CommentRepository.get_threads(db, photo_id, limit=limit, after=after[0] if after else "")
+    roots = sum(comment.parent_id is None for comment in comments)
+    if comments and (roots == limit or len(comments) == config.COMMENT_THREAD_PAGE_MAX):
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(comments[-1].path)
+    return comments
+
+
+@router.get("/comments/{comment_id}/replies", response_model=List[CommentOut])
+async def get_replies(comment_id: int, response: Response, cursor: Optional[str] = None,
+                      limit: int = Query(50, ge=1, le=500), db: AsyncSession = Depends(get_read_db)):
+    """
+    Replies below a comment at any depth, in display order, paginated like the threads.
+    """
+    comment = await db.get(Comment, comment_id)
+    if comment is None or comment.path is None or comment.hidden:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
+    after = decode_cursor(cursor, str)
+    replies = await CommentRepository.get_replies(db, comment, limit=limit, after=after[0] if after else None)
+    if len(replies) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(replies[-1].path)
+    return replies
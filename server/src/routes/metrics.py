@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from src.services.metrics import registry
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """
+    Expose the metrics of all workers in the Prometheus text format.
+
+    :return: The exposition text.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
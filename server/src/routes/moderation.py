@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db import get_db
+from src.database.models import Role
+from src.repository.comments import CommentRepository
+from src.repository.photos import PictureRepository
+from src.schemas.moderation import CommentModeration, ModerationResult, PictureModeration
+from src.services.user import RoleAccess
+
+router = APIRouter(
+    prefix="/moderation",
+    tags=["moderation"],
+    dependencies=[Depends(RoleAccess([Role.admin, Role.moderator]))]
+)
+
+
+@router.post("/comments", response_model=ModerationResult)
+async def moderate_comments(moderation: CommentModeration, db: AsyncSession = Depends(get_db)):
+    """
+    Delete, hide or unhide comments in bulk, by ID list, author, picture, creation time or text.
+
+    Replies of a selected comment are changed with it. The whole batch is one transaction.
+
+    :param moderation: The action and the selection criteria; all given criteria must match.
+    :param db: AsyncSession instance for database interaction.
+    :return: The number of changed comments and of affected pictures.
+    """
+    affected, pictures = await CommentRepository.moderate_comments(db, moderation)
+    return ModerationResult(action=moderation.action, affected=affected, pictures=pictures)
+
+
+@router.post("/pictures", response_model=ModerationResult)
+async def moderate_pictures(moderation: PictureModeration, db: AsyncSession = Depends(get_db)):
+    """
+    Delete, hide or unhide pictures in bulk, by ID list, author, creation time or description.
+
+    Hidden pictures are left out of searches. Deleting a picture deletes its comments.
+
+    :param moderation: The action and the selection criteria; all given criteria must match.
+    :param db: AsyncSession instance for database interaction.
+    :return: The number of changed pictures.
+    """
+    affected = await PictureRepository.moderate_pictures(db, moderation)
+    return ModerationResult(action=moderation.action, affected=affected, pictures=affected)
@@ -1,29 +1,36 @@
-from src.database.models import User, Picture, Role
+import asyncio
+import json
+from src.database.models import User, Role
 from src.repository.photos import PictureRepository
+from src.repository.comments import CommentRepository
 from fastapi import UploadFile, File, Form
 import logging
-from fastapi import APIRouter, HTTPException, Query, Depends
-from typing import Optional, List
+from fastapi import APIRouter, HTTPException, Query, Depends, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from typing import Optional, List, Literal
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db, sessionmanager
 from src.services.auth import auth_service
-from src.schemas.photos import PictureUpload, PictureResponse
+from src.services.rate_limit import RateLimit
+from src.services.comment_stream import StreamLimitExceeded, StreamUnavailable, comment_broker
+from src.services.counters import picture_counters
+from src.schemas.photos import PictureUpload, PictureResponse, PictureSearchResponse
 
 logging.basicConfig()
-logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
 
 router = APIRouter(prefix='/photos', tags=['photos'])
 
 
-@router.get("/search", response_model=List[PictureResponse])
+@router.get("/search", response_model=List[PictureSearchResponse], dependencies=[Depends(RateLimit("search"))])
 async def search_pictures(
         search_term: Optional[str] = Query(None),
         tag: Optional[str] = Query(None),
         user_id: Optional[int] = Query(None),
         page: int = Query(1, ge=1),
         page_size: int = Query(10, ge=1),
-        db: AsyncSession = Depends(get_db),
+        include: List[Literal["comments_preview"]] = Query([]),
+        comments_preview_size: int = Query(3, ge=1, le=10),
+        db: AsyncSession = Depends(get_read_db),
 ):
     """
     Route handler for searching pictures.
@@ -39,19 +46,31 @@ async def search_pictures(
     :type page: int
     :param page_size: The number of items per page.
     :type page_size: int
+    :param include: Related data to embed; ``comments_preview`` adds the latest comments of every picture.
+    :type include: List[str]
+    :param comments_preview_size: The number of comments per picture in the preview.
+    :type comments_preview_size: int
     :param db: The database session.
     :type db: AsyncSession
     :return: A list of pictures matching the search criteria.
-    :rtype: List[PictureResponse]
+    :rtype: List[PictureSearchResponse]
     """
 
     pictures = await PictureRepository.search_pictures(db=db, search_term=search_term, tag=tag, user_id=user_id,
                                                        page=page, page_size=page_size)
 
+    if "comments_preview" in include:
+        # One query for the whole page instead of a comments request per picture
+        previews = await CommentRepository.get_comment_previews(db, [picture.id for picture in pictures],
+                                                                comments_preview_size)
+        for picture in pictures:
+            picture.comments_preview = previews[picture.id]
+
+    await picture_counters.merge(pictures)
     return pictures
 
 
-@router.post("/", response_model=PictureResponse)
+@router.post("/", response_model=PictureResponse, dependencies=[Depends(RateLimit("upload"))])
 async def post_picture(
         file: UploadFile = File(...),
         description: Optional[str] = Form(None),
@@ -88,7 +107,7 @@ async def post_picture(
 @router.get("/{picture_id}", response_model=PictureResponse)
 async def get_picture(
         picture_id: int,
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_read_db),
         current_user: User = Depends(auth_service.get_current_user)
 ):
     """
@@ -106,6 +125,9 @@ async def get_picture(
     picture = await PictureRepository.get_picture(picture_id, db)
     if not picture:
         raise HTTPException(status_code=404, detail="Picture not found")
+    # Counted in Redis and written behind, so views of a hot picture do not queue on its row lock
+    await picture_counters.incr("views", picture_id)
+    await picture_counters.merge([picture])
     return picture
 
 
@@ -158,15 +180,10 @@ async def delete_picture(picture_id: int, db: AsyncSession = Depends(get_db),
     :rtype: PictureResponse form
 
     Raises:
-    HTTPException: If the picture is not found.
+    HTTPException: If the picture is not found, or belongs to another user and the current user is no admin.
     """
 
-    picture = await db.execute(select(Picture).filter(Picture.id == picture_id))
-    picture = picture.scalar()
-    if picture.user_id != current_user.id or current_user.role.name != 'admin':
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-
-    picture = await PictureRepository.delete_picture(picture_id, db)
+    picture = await PictureRepository.delete_picture(picture_id, db, current_user)
     if not picture:
         raise HTTPException(status_code=404, detail="Picture not found")
 
@@ -242,11 +259,60 @@ async def overlay_image(
     return picture
 
 
+@router.post("/{picture_id}/like", response_model=PictureResponse)
+async def like_picture(picture_id: int, db: AsyncSession = Depends(get_db),
+                       current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Route handler for liking a picture. Liking a picture twice counts once.
+
+    :param picture_id: The ID of the picture to like.
+    :type picture_id: int
+    :param db: The database session.
+    :type db: AsyncSession
+    :param current_user: The current authenticated user.
+    :type current_user: User
+    :return: The picture with its current counts.
+    :rtype: PictureResponse
+    """
+    liked = await PictureRepository.like_picture(picture_id, current_user.id, db)
+    if liked is None:
+        raise HTTPException(status_code=404, detail="Picture not found")
+    if liked:
+        await picture_counters.incr("likes", picture_id)
+    picture = await PictureRepository.get_picture(picture_id, db)
+    await picture_counters.merge([picture])
+    return picture
+
+
+@router.delete("/{picture_id}/like", response_model=PictureResponse)
+async def unlike_picture(picture_id: int, db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Route handler for withdrawing a like.
+
+    :param picture_id: The ID of the picture.
+    :type picture_id: int
+    :param db: The database session.
+    :type db: AsyncSession
+    :param current_user: The current authenticated user.
+    :type current_user: User
+    :return: The picture with its current counts.
+    :rtype: PictureResponse
+    """
+    if await PictureRepository.unlike_picture(picture_id, current_user.id, db):
+        await picture_counters.incr("likes", picture_id, -1)
+    picture = await PictureRepository.get_picture(picture_id, db)
+    if not picture:
+        raise HTTPException(status_code=404, detail="Picture not found")
+    await picture_counters.merge([picture])
+    return picture
+
+
 @router.get("/{picture_id}/tags", response_model=List[str])
 async def get_tags(
 
         picture_id: int,
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_read_db),
         current_user: User = Depends(auth_service.get_current_user)
 ):
     """
@@ -272,13 +338,7 @@ async def get_tags(
 @router.post("/{picture_id}/qrcode", response_model=PictureResponse)
 async def create_qrcode(picture_id: int, db: AsyncSession = Depends(get_db),
                         current_user: User = Depends(auth_service.get_current_user)):
-
-    picture = await db.execute(select(Picture).where(Picture.id == picture_id))
-    picture = picture.scalar()
-    if picture.user_id != current_user.id or current_user.role.name != 'admin':
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-        
-    picture = await PictureRepository.create_qrcode(picture_id, db)
+    picture = await PictureRepository.create_qrcode(picture_id, db, current_user)
     if not picture:
         raise HTTPException(status_code=404, detail="Picture not found")
 
@@ -286,10 +346,111 @@ async def create_qrcode(picture_id: int, db: AsyncSession = Depends(get_db),
 
 
 @router.get("/{picture_id}/qrcode")
-async def get_qrcode(picture_id: int, db: AsyncSession = Depends(get_db),
+async def get_qrcode(picture_id: int, db: AsyncSession = Depends(get_read_db),
                      current_user: User = Depends(auth_service.get_current_user)):
     picture = await PictureRepository.get_picture(picture_id, db)
     if not picture:
         raise HTTPException(status_code=404, detail="Picture not found")
 
     return picture.qr_code_url
+
+
+async def _picture_exists(picture_id: int) -> bool:
+    # A short-lived session: a dependency session would stay checked out for the whole stream
+    async with sessionmanager.lazy_session(read=True) as db:
+        return await PictureRepository.get_picture(picture_id, db) is not None
+
+
+def _sse(event: Optional[dict]) -> str:
+    if event is None:
+        return ": heartbeat\n\n"
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+@router.get("/{picture_id}/comments/stream")
+async def stream_comments(picture_id: int, request: Request):
+    """
+    Server-Sent Events stream of the comments created, updated and deleted on a picture.
+
+    Events are ``comment.created``, ``comment.updated`` and ``comment.deleted``. A comment line
+    is sent as heartbeat when nothing happened for a while. When the server ends the stream, it
+    sends a ``close`` event with the reason; after ``overflow`` the client missed events and
+    should reload the comments before reconnecting. While Redis is unavailable, the stream is
+    refused with 503.
+
+    :param picture_id: The ID of the picture.
+    :type picture_id: int
+    :param request: The incoming request.
+    :type request: Request
+    :return: The event stream.
+    :rtype: StreamingResponse
+    """
+    if not await _picture_exists(picture_id):
+        raise HTTPException(status_code=404, detail="Picture not found")
+    try:
+        listener = await comment_broker.subscribe(picture_id, request.client.host if request.client else "unknown")
+    except StreamLimitExceeded as err:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(err))
+    except StreamUnavailable as err:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(err))
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            async for event in comment_broker.events(listener):
+                yield _sse(event)
+            yield _sse({"event": "close", "data": {"reason": listener.closed}})
+        finally:
+            await comment_broker.unsubscribe(listener)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.websocket("/{picture_id}/comments/ws")
+async def comments_websocket(websocket: WebSocket, picture_id: int):
+    """
+    WebSocket variant of the comment stream.
+
+    Every message is a JSON object with ``event`` and ``data``; heartbeats are ``ping`` events.
+    The server closes the socket with code 1013 when the client is too slow to keep up, with
+    1008 when it has too many open streams and with 1011 when streams are unavailable.
+
+    :param websocket: The WebSocket connection.
+    :type websocket: WebSocket
+    :param picture_id: The ID of the picture.
+    :type picture_id: int
+    """
+    if not await _picture_exists(picture_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Picture not found")
+        return
+    try:
+        listener = await comment_broker.subscribe(picture_id, websocket.client.host if websocket.client else "unknown")
+    except StreamLimitExceeded as err:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(err))
+        return
+    except StreamUnavailable as err:
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason=str(err))
+        return
+    await websocket.accept()
+
+    async def receive():
+        # Incoming messages are ignored; reading them is how a disconnect is noticed
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            listener.close("disconnected")
+
+    receiver = asyncio.create_task(receive())
+    try:
+        async for event in comment_broker.events(listener):
+            await websocket.send_json(event if event is not None else {"event": "ping", "data": None})
+        if listener.closed != "disconnected":
+            code = status.WS_1013_TRY_AGAIN_LATER if listener.closed == "overflow" else status.WS_1000_NORMAL_CLOSURE
+            await websocket.close(code=code, reason=listener.closed)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        await comment_broker.unsubscribe(listener)
@@ -1,38 +1,27 @@
 import pickle
 
-import cloudinary
-import cloudinary.uploader
 from fastapi import (
     APIRouter,
     Depends,
     UploadFile,
     File,
 )
-from fastapi_limiter.depends import RateLimiter
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
 from src.schemas.user import UserResponse
 from src.services.auth import auth_service
-from src.conf.config import config
+from src.services.rate_limit import RateLimit
+from src.services.storage import storage
 from src.repository import users as repositories_users
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=config.CLD_NAME,
-    api_key=config.CLD_API_KEY,
-    api_secret=config.CLD_API_SECRET,
-    secure=True,
-)
-
-
 @router.get(
     "/me",
     response_model=UserResponse,
-    dependencies=[Depends(RateLimiter(times=1, seconds=20))],
+    dependencies=[Depends(RateLimit("users_me"))],
 )
 async def get_current_user(user: User = Depends(auth_service.get_current_user)):
     """
@@ -47,7 +36,7 @@ async def get_current_user(user: User = Depends(auth_service.get_current_user)):
 @router.patch(
     "/avatar",
     response_model=UserResponse,
-    dependencies=[Depends(RateLimiter(times=1, seconds=20))],
+    dependencies=[Depends(RateLimit("avatar"))],
 )
 async def get_current_user(
         file: UploadFile = File(),
@@ -63,12 +52,9 @@ async def get_current_user(
     :return: Updated UserResponse containing user details.
     """
     public_id = f"App id №{user.email}"
-    res = cloudinary.uploader.upload(file.file, public_id=public_id, overwrite=True)
+    res = await storage.upload(file.file, public_id=public_id, overwrite=True)
     print(res)
-    res_url = cloudinary.CloudinaryImage(public_id).build_url(
-        width=250, height=250, crop="fill", version=res.get("version")
-    )
+    res_url = storage.url(public_id, width=250, height=250, crop="fill", version=res.get("version"))
     user = await repositories_users.update_avatar_url(user.email, res_url, db)
-    auth_service.cache.set(user.email, pickle.dumps(user))
-    auth_service.cache.expire(user.email, 300)
+    await auth_service.cache.set(user.email, pickle.dumps(user), ex=300)
     return user
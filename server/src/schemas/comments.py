@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Optional
 
 
 class CommentBase(BaseModel):
@@ -7,7 +8,7 @@ class CommentBase(BaseModel):
 
 
 class CommentCreate(CommentBase):
-    pass
+    parent_id: Optional[int] = None
 
 
 class CommentUpdate(CommentBase):
@@ -18,6 +19,8 @@ class CommentOut(CommentBase):
     id: int
     user_id: int
     picture_id: int
+    parent_id: Optional[int] = None
+    depth: int = 0
     created_at: datetime
     updated_at: datetime
 
@@ -0,0 +1,39 @@
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+from src.conf.config import config
+
+
+class ModerationFilter(BaseModel):
+    """
+    Selects the rows of a bulk moderation. All given criteria must match; at least one is required,
+    so an empty request cannot act on the whole table.
+    """
+    action: Literal["delete", "hide", "unhide"]
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=config.MODERATION_MAX_IDS)
+    user_id: Optional[int] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def require_criteria(self):
+        if all(value is None for name, value in self if name != "action"):
+            raise ValueError("At least one selection criterion is required")
+        return self
+
+
+class CommentModeration(ModerationFilter):
+    picture_id: Optional[int] = None
+    text_contains: Optional[str] = Field(None, min_length=1)
+
+
+class PictureModeration(ModerationFilter):
+    description_contains: Optional[str] = Field(None, min_length=1)
+
+
+class ModerationResult(BaseModel):
+    action: str
+    affected: int
+    pictures: int
@@ -1,7 +1,8 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Optional
 from datetime import datetime  # Import missing datetime
 
+from src.schemas.comments import CommentOut
 from src.schemas.tags import TagResponse
 
 class PictureUpload(BaseModel):
@@ -18,9 +19,38 @@ class PictureResponse(BaseModel):
     description: Optional[str]
     user_id: int
     # tags: Optional[List[]]
+    comment_count: int = 0
+    view_count: int = 0
+    like_count: int = 0
     created_at: datetime
     updated_at: datetime
 
     class Config:
         orm_mode = True
 
+
+class PictureSearchResponse(PictureResponse):
+    # Latest comments, newest first; only filled in with include=comments_preview
+    comments_preview: Optional[List[CommentOut]] = None
+
+
+
+class PictureImport(BaseModel):
+    """
+    One line of a picture metadata import. The lines of an export are accepted. Their ``id`` is
+    not imported, nor is ``comment_count``, as comments are not part of the export; views and likes
+    exist nowhere else and are imported as counts.
+    """
+    # Limits of the columns, so an oversized value fails its line instead of the database statement
+    image_url: str = Field(max_length=255)
+    description: Optional[str] = None
+    user_id: int
+    qr_code_url: Optional[str] = Field(None, max_length=255)
+    # No commas: tag lists are comma-separated in uploads and in the export's aggregation
+    tags: List[Annotated[str, Field(min_length=1, max_length=50, pattern=r"^[^,]+$")]] = []
+    # Kept, so a migration does not make pictures hidden by moderation visible again
+    hidden: bool = False
+    view_count: int = Field(0, ge=0)
+    like_count: int = Field(0, ge=0)
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
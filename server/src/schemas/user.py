@@ -42,5 +42,12 @@ class TokenSchema(BaseModel):
     username: str
 
 
+class SessionResponse(BaseModel):
+    id: str
+    device: str
+    created_at: int
+    rotated_at: int
+
+
 class RequestEmail(BaseModel):
     email: EmailStr
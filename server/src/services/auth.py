@@ -1,7 +1,7 @@
 import pickle
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
-import redis.asyncio as redis
 from fastapi import Depends, HTTPException, status
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
@@ -11,6 +11,9 @@ from jose import JWTError, jwt
 from src.conf.config import config
 from src.database.db import get_db
 from src.repository import users as repository_users
+from src.services.denylist import TokenDenylist
+from src.services.metrics import auth_cache_requests
+from src.services.sessions import SessionStore
 
 
 class Auth:
@@ -24,7 +27,21 @@ class Auth:
     pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     SECRET_KEY = config.SECRET_KEY_JWT
     ALGORITHM = config.ALG
-    cache = redis.from_url(f"redis://{config.REDIS_DOMAIN}:{config.REDIS_PORT}", password=config.REDIS_PASSWORD)
+    cache = None
+    sessions = SessionStore(cache, ttl=config.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
+    denylist = TokenDenylist(cache, max_ttl=config.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+                             sync_interval=config.DENYLIST_SYNC_SECONDS, capacity=config.DENYLIST_CAPACITY,
+                             error_rate=config.DENYLIST_ERROR_RATE)
+
+    def init(self, redis_client) -> None:
+        """
+        Attach the shared Redis client to the user cache, session store and denylist.
+
+        :param redis_client: Async Redis client.
+        """
+        self.cache = redis_client
+        self.sessions.redis = redis_client
+        self.denylist.redis = redis_client
 
     def verify_password(self, plain_password, hashed_password):
         """
@@ -60,8 +77,8 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(minutes=15)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
+            expire = datetime.utcnow() + timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES)
+        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token", "jti": uuid.uuid4().hex})
         encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_access_token
 
@@ -77,7 +94,7 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
@@ -89,15 +106,58 @@ class Auth:
         :param refresh_token: The refresh token to decode.
         :return: The decoded token.
         """
+        payload = await self.decode_refresh_claims(refresh_token)
+        return payload['sub']
+
+    async def decode_refresh_claims(self, refresh_token: str) -> dict:
+        """
+        Decode the refresh token and return all of its claims.
+
+        :param refresh_token: The refresh token to decode.
+        :return: The token payload.
+        """
         try:
             payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
+    async def decode_token(self, token: str) -> dict:
+        """
+        Decode an access or refresh token.
+
+        :param token: The token to decode.
+        :return: The token payload.
+        """
+        try:
+            return jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
+
+    async def revoke_access_token(self, payload: dict) -> None:
+        """
+        Revoke an access token until it expires.
+
+        :param payload: The decoded access token.
+        """
+        if payload.get("jti"):
+            await self.denylist.revoke(payload["jti"], payload["exp"])
+
+    async def create_session_tokens(self, email: str, session_id: str, jti: str) -> tuple[str, str]:
+        """
+        Create the access and refresh token pair of a session.
+
+        :param email: Email of the user.
+        :param session_id: Id of the session family.
+        :param jti: Id of the refresh token.
+        :return: Tuple of the access token and the refresh token.
+        """
+        access_token = await self.create_access_token(data={"sub": email, "sid": session_id})
+        refresh_token = await self.create_refresh_token(data={"sub": email, "sid": session_id, "jti": jti})
+        return access_token, refresh_token
+
     async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         Get the current user based on the access token.
@@ -123,18 +183,21 @@ class Auth:
         except JWTError as e:
             raise credentials_exception
 
+        if await self.denylist.is_revoked(payload.get("jti")):
+            raise credentials_exception
+
         user_hash = str(email)
         user = await self.cache.get(user_hash)
 
         if user is None:
-            print("User from DB")
+            auth_cache_requests.inc("miss")
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
             await self.cache.set(user_hash, pickle.dumps(user))
             await self.cache.expire(user_hash, 600)
         else:
-            print("User from cache")
+            auth_cache_requests.inc("hit")
             user = pickle.loads(user)
         return user
 
@@ -1,7 +1,9 @@
+import asyncio
+
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
-from server.src.conf.config import config
+from src.conf.config import config
 
 cloudinary.config(
     cloud_name=config.CLD_NAME,
@@ -11,13 +13,36 @@ cloudinary.config(
 )
 
 
-def upload_picture(file):
-    response = cloudinary.uploader.upload(file)
-    return response['url']
+async def upload(file, **options) -> dict:
+    """
+    Upload a file to Cloudinary in a worker thread.
 
+    :param file: File-like object, path or bytes to upload.
+    :param options: Cloudinary upload options.
+    :return: The Cloudinary upload result.
+    """
+    return await asyncio.to_thread(cloudinary.uploader.upload, file, **options)
 
-def transform_picture(url, transformations):
-    return cloudinary.CloudinaryImage(url).build_url(**transformations)
+
+async def explicit(public_id: str, **options) -> dict:
+    """
+    Apply an explicit transformation to an uploaded asset in a worker thread.
+
+    :param public_id: Public ID of the asset.
+    :param options: Cloudinary explicit options.
+    :return: The Cloudinary result.
+    """
+    return await asyncio.to_thread(cloudinary.uploader.explicit, public_id, **options)
 
 
+def build_url(public_id: str, **transformation) -> str:
+    return cloudinary.CloudinaryImage(public_id).build_url(**transformation)
 
+
+async def upload_picture(file):
+    response = await upload(file)
+    return response['url']
+
+
+def transform_picture(url, transformations):
+    return cloudinary.CloudinaryImage(url).build_url(**transformations)
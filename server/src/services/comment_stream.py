@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import AsyncIterator, Iterable, Optional
+
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+comment_stream_listeners = registry.gauge(
+    "comment_stream_listeners", "Open comment stream connections.")
+comment_stream_dropped = registry.counter(
+    "comment_stream_dropped_total", "Closed comment stream connections by reason.", ("reason",))
+
+
+class StreamLimitExceeded(Exception):
+    """
+    Raised when a client or the worker has too many open comment streams.
+    """
+
+
+class StreamUnavailable(Exception):
+    """
+    Raised when a comment stream cannot be subscribed because Redis is unavailable.
+    """
+
+
+class Listener:
+    """
+    One open stream: a bounded queue of events for one picture.
+
+    The queue decouples the shared Redis reader from slow clients. A client that falls
+    ``queue_size`` events behind is closed with the reason ``overflow`` rather than slowing
+    down the fan-out to everybody else; it should reload the comments and reconnect.
+    """
+
+    def __init__(self, picture_id: int, client: str, queue_size: int):
+        self.picture_id = picture_id
+        self.client = client
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.closed: Optional[str] = None
+
+    def put(self, event: dict) -> None:
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.close("overflow")
+
+    def close(self, reason: str) -> None:
+        """
+        Close the stream; the consumer sees the reason once the queued events are drained.
+        """
+        if self.closed:
+            return
+        self.closed = reason
+        comment_stream_dropped.inc(reason)
+        # Wake up the consumer even if the queue is full
+        while True:
+            try:
+                self.queue.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                self.queue.get_nowait()
+
+
+class CommentBroker:
+    """
+    Fans out comment changes to the stream connections of all workers.
+
+    Writers publish every change to a Redis channel per picture. Each worker holds a single
+    Redis subscription, subscribed to the channels its local listeners need, and copies every
+    message into the queues of those listeners. The number of Redis connections therefore does
+    not grow with the number of clients.
+    """
+
+    def __init__(self, redis_client=None, prefix: str = "comments", queue_size: int = 100,
+                 max_per_client: int = 5, max_listeners: int = 10_000, heartbeat: float = 15.0,
+                 max_duration: float = 3600.0):
+        """
+        Initializes the CommentBroker object.
+
+        :param redis_client: Async Redis client used for pub/sub.
+        :param prefix: Channel name prefix.
+        :param queue_size: Events buffered per connection before it counts as too slow.
+        :param max_per_client: Open streams allowed per client in this worker.
+        :param max_listeners: Open streams allowed in this worker.
+        :param heartbeat: Seconds of silence after which a keep-alive is sent.
+        :param max_duration: Seconds after which a stream is closed, so clients reconnect and
+            connections spread over workers again.
+        """
+        self.redis = redis_client
+        self.prefix = prefix
+        self.queue_size = queue_size
+        self.max_per_client = max_per_client
+        self.max_listeners = max_listeners
+        self.heartbeat = heartbeat
+        self.max_duration = max_duration
+        self.listeners: dict[int, set[Listener]] = defaultdict(set)
+        self.clients: dict[str, int] = defaultdict(int)
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._lock = asyncio.Lock()
+
+    def init(self, redis_client) -> None:
+        """
+        Attach a Redis client.
+
+        :param redis_client: Async Redis client.
+        """
+        self.redis = redis_client
+
+    def channel(self, picture_id: int) -> str:
+        return f"{self.prefix}:picture:{picture_id}"
+
+    async def publish(self, picture_id: int, event: str, data: dict) -> None:
+        """
+        Publish a comment change to all workers.
+
+        Streams are best effort: a failure is logged and does not fail the write that caused it.
+
+        :param picture_id: ID of the commented picture.
+        :param event: Event name, e.g. ``comment.created``.
+        :param data: JSON-serializable event payload.
+        """
+        if self.redis is None:
+            return
+        try:
+            await self.redis.publish(self.channel(picture_id), json.dumps({"event": event, "data": data}))
+        except (RedisError, OSError) as err:
+            logger.warning("Publishing %s for picture %s failed: %s", event, picture_id, err)
+
+    async def publish_many(self, events: Iterable[tuple[int, str, dict]]) -> None:
+        """
+        Publish several comment changes in one pipelined round trip, e.g. for a bulk change.
+
+        :param events: ``(picture_id, event, data)`` tuples.
+        """
+        if self.redis is None:
+            return
+        pipeline = self.redis.pipeline(transaction=False)
+        for picture_id, event, data in events:
+            pipeline.publish(self.channel(picture_id), json.dumps({"event": event, "data": data}))
+        count = len(pipeline)
+        if not count:
+            return
+        try:
+            await pipeline.execute()
+        except (RedisError, OSError) as err:
+            logger.warning("Publishing %s comment events failed: %s", count, err)
+
+    async def subscribe(self, picture_id: int, client: str) -> Listener:
+        """
+        Register a stream connection.
+
+        :param picture_id: ID of the picture to follow.
+        :param client: Key of the client, e.g. its address, for the per-client cap.
+        :return: The listener to read events from.
+        :raises StreamLimitExceeded: If the client or the worker has too many open streams.
+        :raises StreamUnavailable: If the Redis subscription fails.
+        """
+        if self.redis is None:
+            raise StreamUnavailable("Comment streams are unavailable")
+        if self.clients[client] >= self.max_per_client:
+            raise StreamLimitExceeded("Too many open streams for this client")
+        if sum(self.clients.values()) >= self.max_listeners:
+            raise StreamLimitExceeded("Too many open streams")
+        listener = Listener(picture_id, client, self.queue_size)
+        self.clients[client] += 1
+        async with self._lock:
+            try:
+                if not self.listeners[picture_id]:
+                    if self._pubsub is None:
+                        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                    await self._pubsub.subscribe(self.channel(picture_id))
+                    if self._task is None:
+                        self._task = asyncio.create_task(self.run())
+            except (RedisError, OSError) as err:
+                # Like publishing, streams are best effort: the client is told to retry later
+                logger.warning("Subscribing to picture %s failed: %s", picture_id, err)
+                self._release(listener)
+                raise StreamUnavailable("Comment streams are unavailable") from err
+            except BaseException:
+                self._release(listener)
+                raise
+            self.listeners[picture_id].add(listener)
+        return listener
+
+    def _release(self, listener: Listener) -> None:
+        self.clients[listener.client] -= 1
+        if not self.clients[listener.client]:
+            del self.clients[listener.client]
+
+    async def unsubscribe(self, listener: Listener) -> None:
+        """
+        Remove a stream connection; the channel is left when its last local listener is gone.
+
+        :param listener: Listener returned by ``subscribe``.
+        """
+        self._release(listener)
+        async with self._lock:
+            listeners = self.listeners.get(listener.picture_id)
+            if listeners is None or listener not in listeners:
+                return
+            listeners.discard(listener)
+            if not listeners:
+                del self.listeners[listener.picture_id]
+                try:
+                    await self._pubsub.unsubscribe(self.channel(listener.picture_id))
+                except (RedisError, OSError) as err:
+                    logger.warning("Unsubscribing from picture %s failed: %s", listener.picture_id, err)
+
+    def dispatch(self, channel: str, payload) -> None:
+        """
+        Copy a published message into the queues of the local listeners of its channel.
+        """
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        try:
+            picture_id = int(channel.rsplit(":", 1)[1])
+            event = json.loads(payload)
+        except (IndexError, ValueError):
+            return
+        for listener in list(self.listeners.get(picture_id, ())):
+            listener.put(event)
+
+    async def run(self) -> None:
+        """
+        Read the shared subscription until the broker is stopped.
+        """
+        # Checked besides cancellation: redis-py may turn a cancelled read into a timeout error
+        while not self._stopping:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                # redis-py resubscribes the channels when it reconnects
+                logger.warning("Comment stream subscription failed: %s", err)
+                await asyncio.sleep(1.0)
+                continue
+            if message is not None and message["type"] == "message":
+                self.dispatch(message["channel"], message["data"])
+
+    async def events(self, listener: Listener) -> AsyncIterator[Optional[dict]]:
+        """
+        Events of a stream connection.
+
+        :param listener: Listener returned by ``subscribe``.
+        :return: Events as they arrive, and None whenever a heartbeat is due. Ends when the
+            listener is closed or ``max_duration`` has passed.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_duration
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                listener.close("max_duration")
+                return
+            try:
+                event = await asyncio.wait_for(listener.queue.get(), min(self.heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if event is None:
+                return
+            yield event
+
+    async def stop(self) -> None:
+        """
+        Close all streams and the shared subscription.
+        """
+        for listeners in list(self.listeners.values()):
+            for listener in list(listeners):
+                listener.close("shutdown")
+        if self._task is not None:
+            self._stopping = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._stopping = False
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        self.listeners.clear()
+
+    def collect_metrics(self) -> None:
+        comment_stream_listeners.set(value=sum(self.clients.values()))
+
+
+comment_broker = CommentBroker(
+    queue_size=config.COMMENT_STREAM_QUEUE_SIZE,
+    max_per_client=config.COMMENT_STREAM_MAX_PER_CLIENT,
+    max_listeners=config.COMMENT_STREAM_MAX_LISTENERS,
+    heartbeat=config.COMMENT_STREAM_HEARTBEAT_SECONDS,
+    max_duration=config.COMMENT_STREAM_MAX_SECONDS,
+)
+registry.add_collector(comment_broker.collect_metrics)
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from typing import Iterable, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import case, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from src.conf.config import config
+from src.database.models import Picture
+from src.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+counter_pending = registry.gauge(
+    "picture_counter_pending", "Counter deltas buffered in this worker, not yet written to the database.")
+counter_flushes = registry.counter(
+    "picture_counter_flushes_total", "Counter flushes by result.", ("result",))
+counter_fallbacks = registry.counter(
+    "picture_counter_fallbacks_total", "Increments buffered in the worker because Redis was unavailable.")
+
+# Counter name -> Picture column
+COUNTERS = {"views": Picture.view_count, "likes": Picture.like_count}
+
+
+class PictureCounters:
+    """
+    Write-behind view and like counters of pictures.
+
+    Increments go to a Redis hash per counter with ``HINCRBY``, which is atomic across workers and
+    costs no database row lock. When Redis is unavailable they are kept in a buffer of the worker,
+    so every worker acts as a shard of the pending deltas. A background task takes the deltas
+    every ``flush_interval`` seconds and adds them to the database with one ``UPDATE`` per chunk
+    of pictures. Readers add the deltas that are still pending to the persisted counts.
+
+    Deltas taken by a flush are missing from reads until the flush commits, and are lost if the
+    worker dies in between; counts are therefore exact only eventually and may lag slightly.
+    """
+
+    def __init__(self, redis_client=None, session_factory=None, prefix: str = "counters",
+                 flush_interval: float = 10.0, chunk_size: int = 1000):
+        """
+        Initializes the PictureCounters object.
+
+        :param redis_client: Async Redis client; None keeps all deltas in the worker.
+        :param session_factory: Returns an async context manager with a database session.
+        :param prefix: Redis key prefix.
+        :param flush_interval: Seconds between flushes.
+        :param chunk_size: Pictures updated per statement.
+        """
+        self.redis = redis_client
+        self.session_factory = session_factory
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self.chunk_size = chunk_size
+        self.local: dict[str, Counter] = defaultdict(Counter)
+        self._task: Optional[asyncio.Task] = None
+
+    def init(self, redis_client, session_factory=None) -> None:
+        """
+        Attach a Redis client and a database session factory.
+
+        :param redis_client: Async Redis client.
+        :param session_factory: Returns an async context manager with a database session.
+        """
+        self.redis = redis_client
+        if session_factory is not None:
+            self.session_factory = session_factory
+
+    def key(self, name: str) -> str:
+        return f"{self.prefix}:pictures:{name}"
+
+    async def incr(self, name: str, picture_id: int, amount: int = 1) -> None:
+        """
+        Add to a counter of a picture.
+
+        :param name: ``views`` or ``likes``.
+        :param picture_id: ID of the picture.
+        :param amount: Delta, negative to decrement.
+        """
+        if self.redis is not None:
+            try:
+                await self.redis.hincrby(self.key(name), str(picture_id), amount)
+                return
+            except (RedisError, OSError) as err:
+                logger.warning("Buffering %s of picture %s in the worker: %s", name, picture_id, err)
+                counter_fallbacks.inc()
+        self.local[name][picture_id] += amount
+
+    async def pending(self, picture_ids: Iterable[int]) -> dict[str, Counter]:
+        """
+        Deltas not yet written to the database.
+
+        :param picture_ids: IDs of the pictures.
+        :return: Pending delta per picture ID, per counter.
+        """
+        picture_ids = list(dict.fromkeys(picture_ids))
+        deltas = {name: Counter({picture_id: self.local[name][picture_id] for picture_id in picture_ids
+                                 if self.local[name][picture_id]}) for name in COUNTERS}
+        if self.redis is None or not picture_ids:
+            return deltas
+        fields = [str(picture_id) for picture_id in picture_ids]
+        try:
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                for name in COUNTERS:
+                    pipeline.hmget(self.key(name), fields)
+                results = await pipeline.execute()
+        except (RedisError, OSError) as err:
+            logger.warning("Reading pending counters failed: %s", err)
+            return deltas
+        for name, values in zip(COUNTERS, results):
+            for picture_id, value in zip(picture_ids, values):
+                if value is not None:
+                    deltas[name][picture_id] += int(value)
+        return deltas
+
+    async def merge(self, pictures: Iterable[Picture]) -> None:
+        """
+        Add the pending deltas to the counts of loaded pictures, with a single Redis round trip.
+
+        :param pictures: Pictures read from the database.
+        """
+        pictures = list(pictures)
+        if not pictures:
+            return
+        deltas = await self.pending(picture.id for picture in pictures)
+        for picture in pictures:
+            for name, column in COUNTERS.items():
+                delta = deltas[name][picture.id]
+                if delta:
+                    # Set as loaded state, so the session never writes the merged count back
+                    set_committed_value(picture, column.key, (getattr(picture, column.key) or 0) + delta)
+
+    async def _take(self) -> dict[str, Counter]:
+        taken = {name: self.local.pop(name, Counter()) for name in COUNTERS}
+        if self.redis is None:
+            return taken
+        try:
+            # Read and delete atomically, so increments arriving meanwhile wait for the next flush
+            async with self.redis.pipeline(transaction=True) as pipeline:
+                for name in COUNTERS:
+                    pipeline.hgetall(self.key(name))
+                    pipeline.delete(self.key(name))
+                results = await pipeline.execute()
+        except (RedisError, OSError) as err:
+            logger.warning("Taking counters from Redis failed: %s", err)
+            return taken
+        for name, values in zip(COUNTERS, results[::2]):
+            for picture_id, value in values.items():
+                taken[name][int(picture_id)] += int(value)
+        return taken
+
+    async def _give_back(self, taken: dict[str, Counter]) -> None:
+        for name, deltas in taken.items():
+            for picture_id, delta in deltas.items():
+                await self.incr(name, picture_id, delta)
+
+    async def flush(self) -> int:
+        """
+        Write the pending deltas to the database.
+
+        Every chunk of pictures is one ``UPDATE`` adding a ``CASE`` of deltas to each counter column,
+        in ID order so concurrent flushes of several workers lock rows in the same order. Deltas of
+        a failed flush are buffered again.
+
+        :return: The number of pictures updated.
+        """
+        taken = await self._take()
+        picture_ids = sorted({picture_id for deltas in taken.values() for picture_id, delta in deltas.items() if delta})
+        if not picture_ids:
+            return 0
+        try:
+            async with self.session_factory() as db:
+                for start in range(0, len(picture_ids), self.chunk_size):
+                    chunk = picture_ids[start:start + self.chunk_size]
+                    values = {
+                        column.key: column + case({picture_id: taken[name][picture_id] for picture_id in chunk
+                                                   if taken[name][picture_id]}, value=Picture.id, else_=0)
+                        for name, column in COUNTERS.items() if any(taken[name][picture_id] for picture_id in chunk)
+                    }
+                    await db.execute(update(Picture).where(Picture.id.in_(chunk)).values(**values)
+                                     .execution_options(synchronize_session=False))
+                await db.commit()
+        except Exception:
+            counter_flushes.inc("error")
+            await self._give_back(taken)
+            raise
+        counter_flushes.inc("ok")
+        return len(picture_ids)
+
+    async def run(self) -> None:
+        """
+        Flush every ``flush_interval`` seconds until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as err:
+                logger.warning("Counter flush failed: %s", err)
+
+    def start(self) -> None:
+        """
+        Start the background flush task.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background flush task and write what is still pending.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            try:
+                await self.flush()
+            except Exception as err:
+                logger.warning("Final counter flush failed: %s", err)
+
+    def collect_metrics(self) -> None:
+        counter_pending.set(value=sum(len(deltas) for deltas in self.local.values()))
+
+
+picture_counters = PictureCounters(flush_interval=config.COUNTER_FLUSH_SECONDS)
+registry.add_collector(picture_counters.collect_metrics)
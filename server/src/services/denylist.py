@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    In-process Bloom filter over strings.
+
+    Membership tests never give false negatives; false positives happen at roughly the
+    configured error rate while the filter holds no more than ``capacity`` items.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        """
+        Initializes the BloomFilter object.
+
+        :param capacity: Expected number of items.
+        :param error_rate: Target false positive probability.
+        """
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> None:
+        """
+        Add an item to the filter.
+
+        :param item: The item to add.
+        """
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TokenDenylist:
+    """
+    Denylist of revoked access tokens.
+
+    Revoked ``jti``s live in Redis with a TTL equal to the remaining token lifetime and are
+    appended to a revocation log. Each worker mirrors the log into a local Bloom filter that is
+    synced periodically, so checking a token that was not revoked costs no network call; only
+    Bloom hits are confirmed against Redis. Revocations made by other workers become visible
+    after at most one sync interval.
+    """
+
+    def __init__(self, redis_client, max_ttl: int, sync_interval: float = 5.0, capacity: int = 100_000,
+                 error_rate: float = 0.001, rebuild_every: int = 60, prefix: str = "denylist"):
+        """
+        Initializes the TokenDenylist object.
+
+        :param redis_client: Async Redis client used for storage.
+        :param max_ttl: Maximum lifetime of an access token in seconds.
+        :param sync_interval: Seconds between Bloom filter syncs.
+        :param capacity: Expected number of live revocations.
+        :param error_rate: Target false positive rate of the Bloom filter.
+        :param rebuild_every: Number of incremental syncs between full rebuilds that drop expired entries.
+        :param prefix: Key prefix for denylist records.
+        """
+        self.redis = redis_client
+        self.max_ttl = max_ttl
+        self.sync_interval = sync_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_every = rebuild_every
+        self.prefix = prefix
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.stats = {"checks": 0, "bloom_hits": 0, "confirmed": 0}
+        self._last_sync: Optional[float] = None
+        self._syncs = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def _log_key(self) -> str:
+        return f"{self.prefix}:log"
+
+    def _jti_key(self, jti: str) -> str:
+        return f"{self.prefix}:jti:{jti}"
+
+    async def revoke(self, jti: str, expires_at: float) -> None:
+        """
+        Revoke an access token until it expires.
+
+        :param jti: Id of the access token.
+        :param expires_at: Expiration time of the token as a UNIX timestamp.
+        """
+        remaining = int(expires_at - time.time())
+        if remaining <= 0:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._jti_key(jti), 1, ex=remaining)
+            pipe.zadd(self._log_key, {jti: time.time()})
+            await pipe.execute()
+        self.bloom.add(jti)
+
+    async def is_revoked(self, jti: Optional[str]) -> bool:
+        """
+        Check whether an access token was revoked.
+
+        :param jti: Id of the access token.
+        :return: True if the token is revoked.
+        """
+        self.stats["checks"] += 1
+        if jti is None or jti not in self.bloom:
+            return False
+        self.stats["bloom_hits"] += 1
+        try:
+            revoked = bool(await self.redis.exists(self._jti_key(jti)))
+        except Exception as err:
+            # A Bloom hit is most likely a real revocation, so fail closed.
+            logger.warning("Denylist lookup failed: %s", err)
+            return True
+        if revoked:
+            self.stats["confirmed"] += 1
+        return revoked
+
+    async def sync(self) -> None:
+        """
+        Pull revocations from Redis into the local Bloom filter.
+
+        Incremental syncs add entries logged since the previous sync; every ``rebuild_every`` syncs
+        the filter is rebuilt from the live part of the log so expired tokens stop causing hits.
+        """
+        now = time.time()
+        if self._last_sync is None or self._syncs % self.rebuild_every == 0:
+            await self.redis.zremrangebyscore(self._log_key, "-inf", now - self.max_ttl)
+            entries = await self.redis.zrangebyscore(self._log_key, now - self.max_ttl, "+inf")
+            bloom = BloomFilter(max(self.capacity, len(entries)), self.error_rate)
+        else:
+            # Overlap the window by a second to tolerate clock skew between workers.
+            entries = await self.redis.zrangebyscore(self._log_key, self._last_sync - 1, "+inf")
+            bloom = self.bloom
+        for jti in entries:
+            bloom.add(jti.decode() if isinstance(jti, bytes) else jti)
+        self.bloom = bloom
+        self._last_sync = now
+        self._syncs += 1
+
+    async def run(self) -> None:
+        """
+        Sync the Bloom filter every ``sync_interval`` seconds until cancelled.
+        """
+        while True:
+            try:
+                await self.sync()
+            except Exception as err:
+                logger.warning("Denylist sync failed: %s", err)
+            await asyncio.sleep(self.sync_interval)
+
+    def start(self) -> None:
+        """
+        Start the background sync task.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background sync task.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
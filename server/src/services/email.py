@@ -1,3 +1,5 @@
+import logging
+from collections import deque
 from pathlib import Path
 
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
@@ -6,6 +8,9 @@ from pydantic import EmailStr
 
 from src.services.auth import auth_service
 from src.conf.config import config
+from src.services.faults import FaultInjector
+
+logger = logging.getLogger(__name__)
 
 conf = ConnectionConfig(
     MAIL_USERNAME=config.MAIL_USERNAME,
@@ -22,6 +27,39 @@ conf = ConnectionConfig(
 )
 
 
+
+class CapturingMailer:
+    """
+    Mail sender of the ``local`` service profile that keeps messages instead of sending them.
+
+    It has the ``send_message`` interface of FastMail and passes through the ``mail`` rule of
+    ``config.LOCAL_FAULTS``.
+    """
+
+    def __init__(self, keep: int = 100):
+        """
+        Initializes the CapturingMailer object.
+
+        :param keep: Number of most recent messages to keep.
+        """
+        self.messages: deque = deque(maxlen=keep)
+        self.faults = FaultInjector("mail", error=ConnectionErrors)
+
+    async def send_message(self, message: MessageSchema, template_name: str = None) -> None:
+        await self.faults.apply()
+        captured = {
+            "recipients": [getattr(recipient, "email", str(recipient)) for recipient in message.recipients],
+            "subject": message.subject,
+            "template": template_name,
+            "template_body": message.template_body,
+        }
+        self.messages.append(captured)
+        logger.info("Captured email: %s", captured)
+
+
+mailer = CapturingMailer() if config.SERVICE_PROFILE == "local" else FastMail(conf)
+
+
 async def send_email(email: EmailStr, username: str, host: str):
     """
     Send an email for email verification.
@@ -39,7 +77,6 @@ async def send_email(email: EmailStr, username: str, host: str):
             subtype=MessageType.html
         )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="verify_email.html")
+        await mailer.send_message(message, template_name="verify_email.html")
     except ConnectionErrors as err:
         print(err)
@@ -0,0 +1,41 @@
+import asyncio
+import random
+from typing import Optional
+
+from src.conf.config import config
+
+
+class FaultInjector:
+    """
+    Class adding configurable latency and failures to calls of a local fake service.
+
+    The rule is looked up in ``config.LOCAL_FAULTS`` on every call, so it can be changed while the
+    application runs, e.g. in the middle of a load test.
+    """
+
+    def __init__(self, service: str, error: type[Exception] = ConnectionError, rng: Optional[random.Random] = None):
+        """
+        Initializes the FaultInjector object.
+
+        :param service: Key of the rule in ``config.LOCAL_FAULTS``.
+        :param error: Exception type raised for injected failures.
+        :param rng: Random generator, for reproducible failures.
+        """
+        self.service = service
+        self.error = error
+        self.rng = rng or random.Random()
+        self.injected = 0
+
+    async def apply(self) -> None:
+        """
+        Sleep for the configured latency and raise the configured share of calls.
+        """
+        rule = config.LOCAL_FAULTS.get(self.service)
+        if rule is None:
+            return
+        delay = rule.latency_ms + (self.rng.uniform(0, rule.jitter_ms) if rule.jitter_ms else 0)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if rule.error_rate and self.rng.random() < rule.error_rate:
+            self.injected += 1
+            raise self.error(f"Injected {self.service} failure")
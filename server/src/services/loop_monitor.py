@@ -0,0 +1,175 @@
+import asyncio
+import contextlib
+import functools
+import importlib
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+
+from src.conf.config import config
+from src.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Module and attribute of functions that must not run on the event loop thread.
+BLOCKING_CALLS = (
+    ("cloudinary.uploader", "upload"),
+    ("cloudinary.uploader", "explicit"),
+    ("bcrypt", "hashpw"),
+    ("bcrypt", "checkpw"),
+    ("qrcode.main", "QRCode.make_image"),
+)
+
+event_loop_lag = registry.histogram(
+    "event_loop_lag_seconds", "Delay of event loop callbacks behind schedule.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+event_loop_blocks = registry.counter(
+    "event_loop_blocks_total", "Times the event loop was blocked longer than the threshold.")
+
+
+class BlockingCallError(RuntimeError):
+    """
+    Raised in strict mode when a known blocking function is called on the event loop thread.
+    """
+
+
+class LoopMonitor:
+    """
+    Class measuring event loop lag.
+
+    A task sleeps for ``interval`` and records how late it wakes up. In debug mode a watchdog
+    thread also captures the stack of the loop thread whenever the loop has not run for longer
+    than ``threshold``, which points at the blocking call.
+    """
+
+    def __init__(self, interval: float, threshold: float, debug: bool = False, keep: int = 20):
+        """
+        Initializes the LoopMonitor object.
+
+        :param interval: Seconds between lag measurements.
+        :param threshold: Seconds without progress after which the loop counts as blocked.
+        :param debug: Capture the stack of the loop thread when it is blocked.
+        :param keep: Number of captured blocks to keep.
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self.blocks: deque = deque(maxlen=keep)
+        self.max_lag = 0.0
+        self._beat = time.perf_counter()
+        self._thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            self._beat = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.max_lag = max(self.max_lag, lag)
+            event_loop_lag.observe(value=lag)
+            if lag >= self.threshold and not self.debug:
+                event_loop_blocks.inc()
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            blocked = time.perf_counter() - beat - self.interval
+            if blocked < self.threshold or beat == reported:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self._thread_id)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            block = {"event": "event_loop_blocked", "blocked_ms": round(blocked * 1000, 1),
+                     "at": time.time(), "stack": [line.strip() for line in stack[-15:]]}
+            self.blocks.append(block)
+            event_loop_blocks.inc()
+            logger.warning(json.dumps(block))
+
+    def start(self) -> None:
+        """
+        Start measuring the lag of the running loop.
+        """
+        if self._task is not None:
+            return
+        self._thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self.run())
+        if self.debug:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _on_loop_thread() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _guard(function, name: str):
+    @functools.wraps(function)
+    def guarded(*args, **kwargs):
+        if _on_loop_thread():
+            raise BlockingCallError(f"{name} blocks the event loop; run it with asyncio.to_thread")
+        return function(*args, **kwargs)
+
+    return guarded
+
+
+@contextlib.contextmanager
+def forbid_blocking_calls(calls: tuple[tuple[str, str], ...] = BLOCKING_CALLS):
+    """
+    Make known blocking functions raise BlockingCallError when called on an event loop thread.
+
+    Calls from worker threads, e.g. through ``asyncio.to_thread``, are allowed.
+
+    :param calls: Module and attribute path of the functions to guard.
+    """
+    patched = []
+    try:
+        for module_name, path in calls:
+            try:
+                owner = importlib.import_module(module_name)
+            except ImportError:
+                continue
+            *parents, name = path.split(".")
+            for parent in parents:
+                owner = getattr(owner, parent)
+            original = getattr(owner, name)
+            setattr(owner, name, _guard(original, f"{module_name}.{path}"))
+            patched.append((owner, name, original))
+        yield
+    finally:
+        for owner, name, original in reversed(patched):
+            setattr(owner, name, original)
+
+
+loop_monitor = LoopMonitor(
+    interval=config.LOOP_MONITOR_INTERVAL,
+    threshold=config.LOOP_BLOCK_THRESHOLD_MS / 1000,
+    debug=config.LOOP_DEBUG,
+)
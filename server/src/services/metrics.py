@@ -0,0 +1,288 @@
+import asyncio
+import bisect
+import glob
+import json
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+from src.conf.config import config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    """
+    Base class of per-worker metrics.
+
+    Values live in plain dicts keyed by label values. Each worker updates its own copy from the
+    event loop thread only, so no locks are needed; workers are aggregated at scrape time.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: dict = {}
+
+    def snapshot(self) -> list:
+        return [[list(key), value] for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, *labels, value: float) -> None:
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, *labels, value: float) -> None:
+        state = self.values.get(labels)
+        if state is None:
+            # Per-bucket (non-cumulative) counts, then sum and count.
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+
+class Registry:
+    """
+    Collection of metrics with Prometheus text exposition and cross-worker aggregation.
+
+    With ``directory`` set, every worker writes a JSON snapshot of its metrics there; a scrape on
+    any worker merges the snapshots of all workers.
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5.0):
+        """
+        Initializes the Registry object.
+
+        :param directory: Shared directory for worker snapshots, or None for a single worker.
+        :param flush_interval: Seconds between snapshot writes.
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics: dict[str, Metric] = {}
+        self.collectors: list[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """
+        Register a callback that refreshes gauges right before a snapshot is taken.
+
+        :param collector: Callable without arguments.
+        """
+        self.collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as err:
+                logger.warning("Metrics collector failed: %s", err)
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+
+    def flush(self) -> None:
+        """
+        Write this worker's snapshot to the shared directory.
+        """
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._snapshot_path()
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(f"{path}.tmp", path)
+
+    def _merged(self) -> dict:
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        merged: dict = {}
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            try:
+                with open(path) as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for name, samples in snapshot.items():
+                target = merged.setdefault(name, {})
+                for key, value in samples:
+                    key = tuple(key)
+                    target[key] = _merge(target.get(key), value)
+        return {name: [[list(k), v] for k, v in samples.items()] for name, samples in merged.items()}
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text format.
+
+        :return: The exposition text.
+        """
+        lines = []
+        for name, samples in self._merged().items():
+            metric = self.metrics.get(name)
+            if metric is None:
+                continue
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in samples:
+                labels = dict(zip(metric.labels, key))
+                if isinstance(metric, Histogram):
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket in zip(list(metric.buckets) + ["+Inf"], counts):
+                        cumulative += bucket
+                        lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {total}")
+                    lines.append(f"{name}_count{_labels(labels)} {count}")
+                else:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as err:
+                logger.warning("Metrics flush failed: %s", err)
+
+    def start(self) -> None:
+        """
+        Start writing snapshots periodically when a shared directory is configured.
+        """
+        if self.directory and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Stop the snapshot writer and remove this worker's snapshot.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.directory:
+            try:
+                os.remove(self._snapshot_path())
+            except OSError:
+                pass
+
+
+def _merge(current, value):
+    if current is None:
+        return value
+    if isinstance(value, list):
+        return [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1], current[2] + value[2]]
+    return current + value
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+
+registry = Registry(config.METRICS_DIR, config.METRICS_FLUSH_SECONDS)
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "HTTP requests being handled.", ("method",))
+db_pool_checkout_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a database connection.")
+db_pool_connections = registry.gauge(
+    "db_pool_connections", "Database pool connections by state.", ("engine", "state"))
+redis_command_duration = registry.histogram(
+    "redis_command_duration_seconds", "Redis command latency.", ("command",))
+redis_pool_connections = registry.gauge(
+    "redis_pool_connections", "Redis pool connections by state.", ("state",))
+auth_cache_requests = registry.counter(
+    "auth_cache_requests_total", "Current user lookups by cache result.", ("result",))
+storage_request_duration = registry.histogram(
+    "storage_request_duration_seconds", "Storage backend call latency.", ("operation",))
+storage_errors = registry.counter(
+    "storage_errors_total", "Failed storage backend calls.", ("operation",))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency and in-flight requests.
+
+    Routes are labelled with their path template, so path parameters do not create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        start = time.perf_counter()
+        status = 500
+        http_requests_in_flight.inc(method)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec(method)
+            route = scope.get("route")
+            http_request_duration.observe(method, getattr(route, "path", "unmatched"), str(status),
+                                          value=time.perf_counter() - start)
@@ -0,0 +1,40 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    """
+    Encodes the sort key of the last row of a page as an opaque cursor.
+
+    :param values: Sort key values; datetimes are stored in ISO format.
+    :return: URL-safe cursor string.
+    """
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], *types) -> Optional[tuple]:
+    """
+    Decodes a cursor produced by ``encode_cursor``.
+
+    :param cursor: The cursor from the request, or None for the first page.
+    :param types: Expected type of every sort key value, e.g. ``datetime, int``.
+    :return: The sort key, or None for the first page.
+    :raises HTTPException: 400 if the cursor is malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(payload, list) or len(payload) != len(types):
+            raise ValueError(cursor)
+        return tuple(datetime.fromisoformat(value) if kind is datetime else kind(value)
+                     for kind, value in zip(types, payload))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
@@ -0,0 +1,299 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.database.models import Role
+from src.services.auth import auth_service
+from src.services.user import RoleAccess
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "x-profile-id"
+WAITING_FRAME = "[awaiting I/O]"
+MAX_DEPTH = 128
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the stack of one asyncio task from a background thread.
+
+    Samples are taken every ``interval`` seconds from the event loop thread. When the task is not
+    the one running on the loop it is waiting for I/O or for other tasks, which is recorded as a
+    single ``[awaiting I/O]`` frame so the profile reflects wall-clock time.
+    """
+
+    def __init__(self, thread_id: int, task: Optional[asyncio.Task], interval: float):
+        """
+        Initializes the SamplingProfiler object.
+
+        :param thread_id: Identifier of the event loop thread.
+        :param task: Task to profile, or None to sample whatever runs on the loop.
+        :param interval: Seconds between samples.
+        """
+        self.thread_id = thread_id
+        self.task = task
+        self.interval = interval
+        self.frames: list[dict] = []
+        self.frame_index: dict[tuple, int] = {}
+        self.samples: list[list[int]] = []
+        self.weights: list[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._loop = task.get_loop() if task is not None else None
+        self.started = 0.0
+        self.duration = 0.0
+
+    def _frame_id(self, name: str, file: str = "", line: int = 0) -> int:
+        key = (name, file, line)
+        index = self.frame_index.get(key)
+        if index is None:
+            index = self.frame_index[key] = len(self.frames)
+            self.frames.append({"name": name, "file": file, "line": line})
+        return index
+
+    def _running(self) -> bool:
+        if self.task is None:
+            return True
+        current_tasks = getattr(asyncio.tasks, "_current_tasks", None)
+        return current_tasks is None or current_tasks.get(self._loop) is self.task
+
+    def sample(self) -> Optional[list[int]]:
+        """
+        Take one stack sample of the event loop thread.
+
+        :return: Frame indexes from the outermost to the innermost frame.
+        """
+        if not self._running():
+            return [self._frame_id(WAITING_FRAME)]
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and len(stack) < MAX_DEPTH:
+            code = frame.f_code
+            stack.append(self._frame_id(code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        stack.reverse()
+        return stack or None
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            stack = self.sample()
+            now = time.perf_counter()
+            if stack:
+                self.samples.append(stack)
+                self.weights.append((now - last) * 1000)
+            last = now
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def speedscope(self, name: str) -> dict:
+        """
+        Build the profile in the speedscope file format.
+
+        :param name: Profile name shown in the viewer.
+        :return: The speedscope document.
+        """
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "photoshare",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self.frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(self.duration * 1000, 3),
+                "samples": self.samples,
+                "weights": [round(weight, 3) for weight in self.weights],
+            }],
+        }
+
+
+def to_collapsed(document: dict) -> str:
+    """
+    Convert a speedscope document to collapsed stacks for flame graph tools.
+
+    :param document: The speedscope document.
+    :return: One ``frame;frame;frame weight`` line per distinct stack.
+    """
+    frames = document["shared"]["frames"]
+    profile = document["profiles"][0]
+    stacks: dict[str, float] = {}
+    for sample, weight in zip(profile["samples"], profile["weights"]):
+        key = ";".join(frames[index]["name"] for index in sample)
+        stacks[key] = stacks.get(key, 0) + weight
+    return "".join(f"{stack} {round(weight * 1000)}\n" for stack, weight in stacks.items())
+
+
+class ProfileStore:
+    """
+    Bounded on-disk ring buffer of profiles; the oldest profiles are removed first.
+    """
+
+    def __init__(self, directory: str, max_profiles: int):
+        """
+        Initializes the ProfileStore object.
+
+        :param directory: Directory holding the profiles.
+        :param max_profiles: Maximum number of kept profiles.
+        """
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _path(self, profile_id: str, kind: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.{kind}.json")
+
+    @staticmethod
+    def valid_id(profile_id: str) -> bool:
+        return len(profile_id) == 32 and all(char in "0123456789abcdef" for char in profile_id)
+
+    def save(self, profile_id: str, document: dict, meta: dict) -> None:
+        """
+        Store a profile and drop the oldest ones beyond the limit.
+
+        :param profile_id: Identifier of the profile.
+        :param document: The speedscope document.
+        :param meta: Summary shown in the profile listing.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(profile_id, "speedscope"), "w") as file:
+            json.dump(document, file)
+        with open(self._path(profile_id, "meta"), "w") as file:
+            json.dump({"id": profile_id, **meta}, file)
+        for old in self.list()[self.max_profiles:]:
+            self.delete(old["id"])
+
+    def list(self) -> list[dict]:
+        """
+        Summaries of the stored profiles, newest first.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".meta.json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    profiles.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return sorted(profiles, key=lambda meta: meta.get("created_at", 0), reverse=True)
+
+    def load(self, profile_id: str) -> Optional[dict]:
+        """
+        Load a stored profile.
+
+        :param profile_id: Identifier of the profile.
+        :return: The speedscope document, or None if it does not exist.
+        """
+        if not self.valid_id(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id, "speedscope")) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def delete(self, profile_id: str) -> None:
+        for kind in ("speedscope", "meta"):
+            try:
+                os.remove(self._path(profile_id, kind))
+            except OSError:
+                pass
+
+
+profile_store = ProfileStore(config.PROFILE_DIR, config.PROFILE_MAX_FILES)
+
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware profiling requests on demand.
+
+    A request carrying the ``X-Profile`` header is profiled when it is made by an admin; in
+    addition a random ``PROFILE_SAMPLE_RATE`` share of all requests is profiled at the slower
+    ``PROFILE_SAMPLE_INTERVAL_MS``. Profiled responses carry the profile id in ``X-Profile-Id``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.active = 0
+
+    @staticmethod
+    async def _is_admin(scope) -> bool:
+        request = Request(scope)
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return False
+        try:
+            async with sessionmanager.lazy_session(read=True) as db:
+                user = await auth_service.get_current_user(token, db)
+            await RoleAccess([Role.admin])(request, user)
+        except HTTPException:
+            return False
+        except Exception as err:
+            # The header only opts in to profiling; a failing lookup must not fail the request
+            logger.warning("Profiling admin check failed: %s", err)
+            return False
+        return True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.active >= config.PROFILE_MAX_CONCURRENT:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if PROFILE_HEADER.encode() in headers and await self._is_admin(scope):
+            interval = config.PROFILE_INTERVAL_MS
+        elif config.PROFILE_SAMPLE_RATE and random.random() < config.PROFILE_SAMPLE_RATE:
+            interval = config.PROFILE_SAMPLE_INTERVAL_MS
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        profiler = SamplingProfiler(threading.get_ident(), asyncio.current_task(), interval / 1000)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER.encode(), profile_id.encode())]
+            await send(message)
+
+        self.active += 1
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            self.active -= 1
+            name = f"{scope['method']} {scope['path']}"
+            meta = {"name": name, "status": status, "created_at": time.time(),
+                    "duration_ms": round(profiler.duration * 1000, 3), "samples": len(profiler.samples)}
+            try:
+                await asyncio.to_thread(profile_store.save, profile_id, profiler.speedscope(name), meta)
+            except OSError as err:
+                logger.warning("Profile could not be stored: %s", err)
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from redis.exceptions import RedisError
+
+from src.conf.config import config, RateLimitRule
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] bucket; ARGV: capacity, refill rate (tokens per ms), now (ms), cost.
+# Returns {allowed, remaining tokens, ms until the bucket is full (allowed) or holds enough tokens (denied)}.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local reset
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+    reset = math.ceil((capacity - tokens) / rate)
+else
+    reset = math.ceil((cost - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate) + 1000)
+return {allowed, math.floor(tokens), reset}
+"""
+
+# KEYS[1] counter of the current window, KEYS[2] counter of the previous window;
+# ARGV: limit, window (ms), weight of the previous window, ms until the current window ends, cost.
+# Returns {allowed, remaining requests, ms until the current window ends}.
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local weight = tonumber(ARGV[3])
+local reset = tonumber(ARGV[4])
+local cost = tonumber(ARGV[5])
+local current = tonumber(redis.call('GET', KEYS[1])) or 0
+local previous = tonumber(redis.call('GET', KEYS[2])) or 0
+local estimate = previous * weight + current
+if estimate + cost > limit then
+    return {0, math.max(0, math.floor(limit - estimate)), reset}
+end
+redis.call('INCRBY', KEYS[1], cost)
+redis.call('PEXPIRE', KEYS[1], window * 2)
+return {1, math.floor(limit - estimate - cost), reset}
+"""
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int
+    reset: float
+
+
+def _window(rule: RateLimitRule, now: float) -> tuple[int, float, float]:
+    """
+    Split a timestamp into a sliding window index, the weight of the previous window and the
+    seconds left in the current one.
+    """
+    index = int(now // rule.period)
+    elapsed = now - index * rule.period
+    return index, 1 - elapsed / rule.period, rule.period - elapsed
+
+
+class LocalRateLimiter:
+    """
+    Approximate in-process rate limiter used when Redis is unavailable or too slow.
+
+    State is per worker, so the effective limit is multiplied by the number of workers. The number of
+    tracked keys is bounded; the least recently used keys are evicted first.
+    """
+
+    def __init__(self, max_keys: int = 10_000):
+        """
+        Initializes the LocalRateLimiter object.
+
+        :param max_keys: Maximum number of tracked keys.
+        """
+        self.max_keys = max_keys
+        self.state: OrderedDict = OrderedDict()
+
+    def _get(self, key: str, default):
+        value = self.state.pop(key, default)
+        self.state[key] = value
+        if len(self.state) > self.max_keys:
+            self.state.popitem(last=False)
+        return value
+
+    def hit(self, key: str, rule: RateLimitRule, now: Optional[float] = None, cost: int = 1) -> RateLimitResult:
+        """
+        Register a request against a rule.
+
+        :param key: Rate limit key.
+        :param rule: The rule to apply.
+        :param now: Current time in seconds.
+        :param cost: Number of requests to register.
+        :return: The outcome of the check.
+        """
+        now = time.time() if now is None else now
+        if rule.algorithm == "token_bucket":
+            capacity = rule.capacity
+            rate = rule.limit / rule.period
+            tokens, ts = self._get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                self.state[key] = (tokens, now)
+                return RateLimitResult(True, int(tokens), (capacity - tokens) / rate)
+            self.state[key] = (tokens, now)
+            return RateLimitResult(False, int(tokens), (cost - tokens) / rate)
+
+        index, weight, reset = _window(rule, now)
+        counters = self._get(key, {})
+        estimate = counters.get(index - 1, 0) * weight + counters.get(index, 0)
+        if estimate + cost > rule.limit:
+            return RateLimitResult(False, max(0, int(rule.limit - estimate)), reset)
+        self.state[key] = {index - 1: counters.get(index - 1, 0), index: counters.get(index, 0) + cost}
+        return RateLimitResult(True, int(rule.limit - estimate - cost), reset)
+
+    def clear(self) -> None:
+        """
+        Forget all tracked keys.
+        """
+        self.state.clear()
+
+
+class RateLimiter:
+    """
+    Rate limiter backed by atomic Redis scripts with an in-process fallback.
+
+    A Redis call that fails or exceeds the latency budget is answered by the local limiter, and Redis
+    is skipped for a cooldown period so a slow Redis does not add the budget to every request.
+    """
+
+    def __init__(self, prefix: str = "ratelimit"):
+        """
+        Initializes the RateLimiter object.
+
+        :param prefix: Key prefix for rate limit counters.
+        """
+        self.prefix = prefix
+        self.redis = None
+        self.local = LocalRateLimiter(config.RATE_LIMIT_LOCAL_MAX_KEYS)
+        self.latency_budget = config.RATE_LIMIT_REDIS_BUDGET_MS / 1000
+        self.cooldown = config.RATE_LIMIT_REDIS_COOLDOWN_SECONDS
+        self.stats = {"redis": 0, "local": 0, "fallbacks": 0, "denied": 0}
+        self._degraded_until = 0.0
+        self._token_bucket = None
+        self._sliding_window = None
+
+    def init(self, redis_client) -> None:
+        """
+        Attach a Redis client and register the Lua scripts.
+
+        :param redis_client: Async Redis client.
+        """
+        self.redis = redis_client
+        self._token_bucket = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._sliding_window = redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+
+    async def _redis_hit(self, key: str, rule: RateLimitRule, now: float, cost: int) -> RateLimitResult:
+        key = f"{self.prefix}:{key}"
+        if rule.algorithm == "token_bucket":
+            rate = rule.limit / rule.period / 1000
+            allowed, remaining, reset = await self._token_bucket(
+                keys=[key], args=[rule.capacity, rate, int(now * 1000), cost])
+        else:
+            index, weight, reset = _window(rule, now)
+            allowed, remaining, reset = await self._sliding_window(
+                keys=[f"{key}:{index}", f"{key}:{index - 1}"],
+                args=[rule.limit, int(rule.period * 1000), weight, int(reset * 1000), cost])
+        return RateLimitResult(bool(allowed), int(remaining), int(reset) / 1000)
+
+    async def hit(self, key: str, rule: RateLimitRule, cost: int = 1) -> RateLimitResult:
+        """
+        Register a request against a rule.
+
+        :param key: Rate limit key.
+        :param rule: The rule to apply.
+        :param cost: Number of requests to register.
+        :return: The outcome of the check.
+        """
+        now = time.time()
+        if self.redis is not None and now >= self._degraded_until:
+            try:
+                result = await asyncio.wait_for(self._redis_hit(key, rule, now, cost), self.latency_budget)
+                self.stats["redis"] += 1
+                return result
+            except (asyncio.TimeoutError, RedisError, OSError) as err:
+                logger.warning("Rate limiter falls back to local state: %r", err)
+                self.stats["fallbacks"] += 1
+                self._degraded_until = now + self.cooldown
+        self.stats["local"] += 1
+        return self.local.hit(key, rule, now, cost)
+
+
+rate_limiter = RateLimiter()
+
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
+
+
+class RateLimit:
+    """
+    Dependency enforcing a rate limit policy declared in ``config.RATE_LIMITS``.
+
+    Adds ``RateLimit-*`` headers to the response and raises 429 when the limit is exceeded.
+    """
+
+    def __init__(self, policy: str):
+        self.policy = policy
+
+    @staticmethod
+    def _identity(rule: RateLimitRule, request: Request, token: Optional[str]) -> str:
+        if rule.key == "user" and token:
+            try:
+                payload = jwt.decode(token, config.SECRET_KEY_JWT, algorithms=[config.ALG])
+                return f"user:{payload['sub']}"
+            except (JWTError, KeyError):
+                pass
+        return f"ip:{request.client.host if request.client else 'unknown'}"
+
+    async def __call__(self, request: Request, response: Response,
+                       token: Optional[str] = Depends(optional_oauth2_scheme)):
+        rule = config.RATE_LIMITS.get(self.policy)
+        if rule is None or not config.RATE_LIMIT_ENABLED:
+            return
+        identity = self._identity(rule, request, token)
+        result = await rate_limiter.hit(f"{self.policy}:{identity}", rule)
+        headers = {
+            "RateLimit-Limit": str(rule.capacity if rule.algorithm == "token_bucket" else rule.limit),
+            "RateLimit-Remaining": str(result.remaining),
+            "RateLimit-Reset": str(math.ceil(result.reset)),
+            "RateLimit-Policy": f"{rule.limit};w={int(rule.period)}",
+        }
+        if not result.allowed:
+            rate_limiter.stats["denied"] += 1
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many requests",
+                                headers={**headers, "Retry-After": headers["RateLimit-Reset"]})
+        response.headers.update(headers)
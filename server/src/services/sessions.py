@@ -0,0 +1,166 @@
+import time
+import uuid
+from typing import Optional
+
+# Atomically compares the presented refresh token id with the current one of its family.
+# Returns {1, username} when the token was rotated, {-1} when an already rotated token was
+# reused (the whole family is revoked) and {0} when the family does not exist (expired or revoked).
+ROTATE_SCRIPT = """
+local current = redis.call('HMGET', KEYS[1], 'jti', 'username')
+if not current[1] then
+    return {0}
+end
+if current[1] ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], ARGV[4])
+    return {-1}
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2], 'rotated_at', ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return {1, current[2]}
+"""
+
+ROTATED = 1
+REUSED = -1
+UNKNOWN = 0
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class SessionStore:
+    """
+    Redis-backed store of refresh-token sessions.
+
+    Every login opens a rotation family (one per device). The family remembers the id (``jti``)
+    of the only refresh token that may be exchanged next; presenting any other token of the
+    family is treated as token theft and revokes the family.
+    """
+
+    def __init__(self, redis_client, ttl: int, prefix: str = "session"):
+        """
+        Initializes the SessionStore object.
+
+        :param redis_client: Async Redis client used for storage.
+        :param ttl: Lifetime of an idle session in seconds (the refresh token lifetime).
+        :param prefix: Key prefix for session records.
+        """
+        self.redis = redis_client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _session_key(self, session_id: str) -> str:
+        return f"{self.prefix}:{session_id}"
+
+    def _user_key(self, email: str) -> str:
+        return f"{self.prefix}:user:{email}"
+
+    @staticmethod
+    def new_token_id() -> str:
+        """
+        Generate a new refresh token id.
+
+        :return: Random token id.
+        """
+        return uuid.uuid4().hex
+
+    async def open(self, email: str, username: str, device: Optional[str]) -> tuple[str, str]:
+        """
+        Open a new session family for a user device.
+
+        :param email: Email of the user.
+        :param username: Username returned with refreshed tokens.
+        :param device: Device label (client id or user agent).
+        :return: Tuple of the session id and the id of its first refresh token.
+        """
+        session_id = uuid.uuid4().hex
+        jti = self.new_token_id()
+        now = str(int(time.time()))
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._session_key(session_id), mapping={
+                "email": email,
+                "username": username,
+                "device": device or "unknown",
+                "jti": jti,
+                "created_at": now,
+                "rotated_at": now,
+            })
+            pipe.expire(self._session_key(session_id), self.ttl)
+            pipe.sadd(self._user_key(email), session_id)
+            pipe.expire(self._user_key(email), self.ttl)
+            await pipe.execute()
+        return session_id, jti
+
+    async def rotate(self, email: str, session_id: str, jti: str, new_jti: str) -> tuple[int, Optional[str]]:
+        """
+        Exchange the current refresh token of a session for a new one.
+
+        :param email: Email of the session owner.
+        :param session_id: Id of the session family.
+        :param jti: Id of the presented refresh token.
+        :param new_jti: Id of the refresh token that replaces it.
+        :return: Tuple of ROTATED, REUSED (the family was revoked) or UNKNOWN and the session username.
+        """
+        result = await self.redis.eval(
+            ROTATE_SCRIPT, 2, self._session_key(session_id), self._user_key(email),
+            jti, new_jti, self.ttl, session_id, int(time.time())
+        )
+        username = _decode(result[1]) if len(result) > 1 else None
+        return int(result[0]), username
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        """
+        Retrieve a session record.
+
+        :param session_id: Id of the session family.
+        :return: Session fields, or None if the session does not exist.
+        """
+        data = await self.redis.hgetall(self._session_key(session_id))
+        if not data:
+            return None
+        return {_decode(k): _decode(v) for k, v in data.items()}
+
+    async def list_sessions(self, email: str) -> list[dict]:
+        """
+        List the active sessions of a user, dropping references to expired ones.
+
+        :param email: Email of the user.
+        :return: Session records with their ids, without token ids.
+        """
+        session_ids = [_decode(s) for s in await self.redis.smembers(self._user_key(email))]
+        sessions = []
+        for session_id in session_ids:
+            session = await self.get(session_id)
+            if session is None:
+                await self.redis.srem(self._user_key(email), session_id)
+                continue
+            session.pop("jti", None)
+            session["id"] = session_id
+            sessions.append(session)
+        return sessions
+
+    async def revoke(self, email: str, session_id: str) -> bool:
+        """
+        Revoke a single session family.
+
+        :param email: Email of the session owner.
+        :param session_id: Id of the session family.
+        :return: True if the session existed.
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._session_key(session_id))
+            pipe.srem(self._user_key(email), session_id)
+            deleted, _ = await pipe.execute()
+        return bool(deleted)
+
+    async def revoke_all(self, email: str) -> None:
+        """
+        Revoke every session of a user.
+
+        :param email: Email of the user.
+        """
+        session_ids = [_decode(s) for s in await self.redis.smembers(self._user_key(email))]
+        keys = [self._session_key(s) for s in session_ids] + [self._user_key(email)]
+        await self.redis.delete(*keys)
@@ -0,0 +1,155 @@
+import asyncio
+import glob
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote, unquote, urlencode
+
+from src.conf.config import config
+from src.services.faults import FaultInjector
+from src.services.metrics import storage_errors, storage_request_duration
+
+_FORMATS = ((b"\x89PNG", "png"), (b"\xff\xd8\xff", "jpg"), (b"GIF8", "gif"), (b"RIFF", "webp"))
+
+
+class FileSystemStorage:
+    """
+    Storage backend keeping uploads in a local directory, for the ``local`` service profile.
+
+    It mimics the Cloudinary ``upload`` and ``explicit`` responses. Transformations are not
+    applied; they are only reflected in the returned URLs.
+    """
+
+    def __init__(self, directory: str, base_url: str, faults: FaultInjector):
+        """
+        Initializes the FileSystemStorage object.
+
+        :param directory: Directory holding the uploaded files.
+        :param base_url: URL under which the directory is served.
+        :param faults: Latency and error injection for storage calls.
+        """
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+        self.faults = faults
+
+    def _find(self, public_id: str):
+        matches = glob.glob(os.path.join(glob.escape(self.directory), f"{glob.escape(quote(public_id, safe=''))}.*"))
+        return matches[0] if matches else None
+
+    def _write(self, file, public_id: str, overwrite: bool) -> tuple[str, int]:
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "rb") as source:
+                data = source.read()
+        elif isinstance(file, bytes):
+            data = file
+        else:
+            data = file.read()
+        extension = next((name for magic, name in _FORMATS if data.startswith(magic)), "bin")
+        existing = self._find(public_id)
+        if existing is not None:
+            if not overwrite:
+                return os.path.splitext(existing)[1][1:], os.path.getsize(existing)
+            os.remove(existing)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{quote(public_id, safe='')}.{extension}"), "wb") as target:
+            target.write(data)
+        return extension, len(data)
+
+    def _response(self, public_id: str, extension: str, size: int, **transformation) -> dict:
+        url = self.build_url(public_id, **transformation)
+        return {
+            "public_id": public_id,
+            "version": int(time.time()),
+            "format": extension,
+            "resource_type": "image",
+            "type": "upload",
+            "bytes": size,
+            "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "url": url,
+            "secure_url": url,
+        }
+
+    async def upload(self, file, public_id: str = None, overwrite: bool = True, **options) -> dict:
+        await self.faults.apply()
+        public_id = public_id or uuid.uuid4().hex
+        extension, size = await asyncio.to_thread(self._write, file, public_id, overwrite)
+        return self._response(public_id, extension, size)
+
+    async def explicit(self, public_id: str, type: str = "upload", **transformation) -> dict:
+        await self.faults.apply()
+        public_id = unquote(public_id)
+        path = await asyncio.to_thread(self._find, public_id)
+        if path is None:
+            raise Exception(f"Resource not found - {public_id}")
+        return self._response(public_id, os.path.splitext(path)[1][1:], os.path.getsize(path), **transformation)
+
+    def build_url(self, public_id: str, **transformation) -> str:
+        path = self._find(public_id)
+        name = os.path.basename(path) if path else quote(public_id, safe="")
+        query = urlencode({key: value for key, value in transformation.items() if value is not None})
+        return f"{self.base_url}/{name}" + (f"?{query}" if query else "")
+
+
+class Storage:
+    """
+    Facade over the configured storage backend recording call latency and errors.
+    """
+
+    def __init__(self, backend):
+        """
+        Initializes the Storage object.
+
+        :param backend: Object with async ``upload`` and ``explicit`` and a ``build_url`` method.
+        """
+        self.backend = backend
+
+    async def _timed(self, operation: str, call, *args, **kwargs) -> dict:
+        start = time.perf_counter()
+        try:
+            return await call(*args, **kwargs)
+        except Exception:
+            storage_errors.inc(operation)
+            raise
+        finally:
+            storage_request_duration.observe(operation, value=time.perf_counter() - start)
+
+    async def upload(self, file, **options) -> dict:
+        """
+        Upload a file.
+
+        :param file: File-like object, path or bytes to upload.
+        :param options: Upload options such as ``public_id`` and ``overwrite``.
+        :return: The upload result in the Cloudinary format.
+        """
+        return await self._timed("upload", self.backend.upload, file, **options)
+
+    async def explicit(self, public_id: str, **options) -> dict:
+        """
+        Apply an explicit transformation to an uploaded asset.
+
+        :param public_id: Public ID of the asset.
+        :param options: Transformation options.
+        :return: The result in the Cloudinary format.
+        """
+        return await self._timed("explicit", self.backend.explicit, public_id, **options)
+
+    def url(self, public_id: str, **transformation) -> str:
+        """
+        Build the delivery URL of an asset.
+
+        :param public_id: Public ID of the asset.
+        :param transformation: Transformation options.
+        :return: The URL.
+        """
+        return self.backend.build_url(public_id, **transformation)
+
+
+def _backend():
+    if config.SERVICE_PROFILE == "local":
+        return FileSystemStorage(config.LOCAL_STORAGE_DIR, config.LOCAL_STORAGE_URL, FaultInjector("storage"))
+    from src.services import cloudinary as cloudinary_service
+    return cloudinary_service
+
+
+storage = Storage(_backend())
@@ -1,5 +1,6 @@
 import asyncio
 
+import fakeredis
 import pytest
 import pytest_asyncio
 from fastapi.testclient import TestClient
@@ -8,8 +9,10 @@ from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, Asyn
 
 from main import app
 from src.database.models import Base, User
-from src.database.db import get_db
+from src.database.db import DatabaseSessionManager, InstrumentedQueuePool, get_db, get_read_db
+from src.routes import admin as admin_routes
 from src.services.auth import auth_service
+from src.conf.config import config
 
 SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
@@ -49,15 +52,62 @@ def client():
         except Exception as err:
             print(err)
             await session.rollback()
+            raise
         finally:
             await session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
 
     yield TestClient(app)
 
 
+@pytest.fixture()
+def route_sessions(monkeypatch):
+    """
+    Session manager of the test database for routes that open their own sessions, e.g. to stream a
+    response; its pool is instrumented, so tests can check that every connection is returned.
+    """
+    manager = DatabaseSessionManager(SQLALCHEMY_DATABASE_URL, engine_kwargs={"poolclass": InstrumentedQueuePool})
+    monkeypatch.setattr(admin_routes, "sessionmanager", manager)
+    yield manager
+    asyncio.run(manager.close())
+
+
 @pytest_asyncio.fixture()
 async def get_token():
     token = await auth_service.create_access_token(data={"sub": test_user["email"]})
     return token
+
+
+@pytest_asyncio.fixture()
+async def db_sessions(tmp_path):
+    """
+    Session factory of an empty database of the test's own, for repository tests that must not
+    see the rows of the shared test database. Objects stay loaded after commits.
+    """
+    isolated = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'isolated.db'}")
+    async with isolated.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(isolated, expire_on_commit=False)
+    await isolated.dispose()
+
+
+@pytest_asyncio.fixture()
+async def db_session(db_sessions):
+    async with db_sessions() as session:
+        yield session
+
+
+@pytest.fixture()
+def fake_redis(monkeypatch):
+    cache = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(auth_service, "cache", cache)
+    monkeypatch.setattr(auth_service.sessions, "redis", cache)
+    monkeypatch.setattr(auth_service.denylist, "redis", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def disable_rate_limits(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", False)
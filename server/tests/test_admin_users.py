@@ -0,0 +1,66 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+
+from src.conf.config import config
+from src.database.models import Role, User
+from tests.conftest import TestingSessionLocal
+
+
+def seed_users():
+    async def seed():
+        async with TestingSessionLocal() as session:
+            session.add_all([User(username=f"listed{n}", email=f"listed{n}@example.com", password="secret",
+                                  role=Role.moderator if n % 2 else Role.user, confirmed=n < 4,
+                                  created_at=datetime(2024, 1, 1 + n))
+                             for n in range(7)])
+            await session.commit()
+
+    asyncio.run(seed())
+
+
+def test_users_are_listed_by_keyset_pages_with_filters(client, get_token, fake_redis):
+    seed_users()
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    pages, cursor = [], None
+    while True:
+        response = client.get("/api/admin/users", params={"role": "user", "limit": 2, "cursor": cursor},
+                              headers=headers)
+        assert response.status_code == 200
+        pages.append([user["email"] for user in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    filtered = client.get("/api/admin/users", params={"confirmed": "true", "created_after": "2024-01-02T00:00:00",
+                                                      "created_before": "2024-12-31T00:00:00"}, headers=headers)
+
+    assert pages == [["listed0@example.com", "listed2@example.com"], ["listed4@example.com", "listed6@example.com"],
+                     []]
+    assert [user["email"] for user in filtered.json()] == ["listed1@example.com", "listed2@example.com",
+                                                          "listed3@example.com"]
+    assert client.get("/api/admin/users", params={"cursor": "bogus"}, headers=headers).status_code == 400
+
+
+def test_users_export_streams_ndjson_and_csv(client, get_token, fake_redis, route_sessions, monkeypatch):
+    monkeypatch.setattr(config, "USER_EXPORT_BATCH_SIZE", 2)
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    ndjson = client.get("/api/admin/users/export", params={"role": "moderator"}, headers=headers)
+    exported_csv = client.get("/api/admin/users/export", params={"format": "csv", "role": "moderator"},
+                              headers=headers)
+
+    assert ndjson.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in ndjson.text.splitlines()]
+    assert [line["email"] for line in lines] == ["listed1@example.com", "listed3@example.com", "listed5@example.com"]
+    assert lines[0] == {"id": lines[0]["id"], "username": "listed1", "email": "listed1@example.com",
+                        "role": "moderator", "confirmed": True, "created_at": "2024-01-02T00:00:00"}
+    assert exported_csv.headers["content-disposition"] == 'attachment; filename="users.csv"'
+    rows = list(csv.reader(io.StringIO(exported_csv.text)))
+    assert rows[0] == ["id", "username", "email", "role", "confirmed", "created_at"]
+    assert [row[2] for row in rows[1:]] == ["listed1@example.com", "listed3@example.com", "listed5@example.com"]
+    # The export's own session has returned its connection to the pool
+    pool = route_sessions.pool_stats()
+    assert (pool["checkouts"], pool["checked_out"]) == (2, 0)
@@ -0,0 +1,58 @@
+from tests.conftest import test_user
+
+
+def login(client, device="phone"):
+    response = client.post("/api/auth/login", data={"username": test_user["email"], "password": test_user["password"],
+                                                    "client_id": device})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def refresh(client, refresh_token):
+    return client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {refresh_token}"})
+
+
+def test_refresh_rotates_token(client, fake_redis):
+    tokens = login(client)
+
+    response = refresh(client, tokens["refresh_token"])
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["refresh_token"] != tokens["refresh_token"]
+    assert data["username"] == test_user["username"]
+    assert refresh(client, data["refresh_token"]).status_code == 200
+
+
+def test_refresh_token_reuse_revokes_family(client, fake_redis):
+    tokens = login(client)
+    rotated = refresh(client, tokens["refresh_token"]).json()
+
+    reused = refresh(client, tokens["refresh_token"])
+
+    assert reused.status_code == 401
+    assert reused.json()["detail"] == "Refresh token reuse detected, session revoked"
+    assert refresh(client, rotated["refresh_token"]).status_code == 401
+
+
+def test_sessions_are_per_device(client, fake_redis):
+    phone = login(client, "phone")
+    laptop = login(client, "laptop")
+    headers = {"Authorization": f"Bearer {laptop['access_token']}"}
+
+    sessions = client.get("/api/auth/sessions", headers=headers).json()
+    assert sorted(s["device"] for s in sessions) == ["laptop", "phone"]
+
+    phone_session = next(s for s in sessions if s["device"] == "phone")
+    assert client.delete(f"/api/auth/sessions/{phone_session['id']}", headers=headers).status_code == 200
+    assert refresh(client, phone["refresh_token"]).status_code == 401
+    assert refresh(client, laptop["refresh_token"]).status_code == 200
+
+
+def test_logout_revokes_session(client, fake_redis):
+    tokens = login(client)
+
+    response = client.post("/api/auth/logout", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+
+    assert response.status_code == 200
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
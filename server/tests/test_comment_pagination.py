@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+
+from src.database.models import Comment, Picture, User
+from src.repository.comments import CommentRepository
+from src.schemas.comments import CommentCreate
+from src.services.pagination import decode_cursor, encode_cursor
+
+
+@pytest.mark.asyncio
+async def test_keyset_pages_follow_index_order_and_counts_are_maintained(db_session):
+    db = db_session
+    db.add(User(id=1, username="author", email="author@example.com", password="x"))
+    db.add(Picture(id=1, image_url="http://files/1.png", user_id=1))
+    await db.commit()
+    created = [(await CommentRepository.create_comment(db, CommentCreate(text=f"comment {n}"), 1, 1)).id
+               for n in range(5)]
+    # Ties on created_at are broken by the id
+    tie = (await db.get(Comment, created[1])).created_at
+    await db.execute(update(Comment).where(Comment.id.in_(created[1:4])).values(created_at=tie))
+    await db.commit()
+
+    pages, after = [], None
+    while True:
+        page = await CommentRepository.get_comments(db, 1, limit=2, after=after)
+        if not page:
+            break
+        pages.append([comment.id for comment in page])
+        after = (page[-1].created_at, page[-1].id)
+
+    await CommentRepository.delete_comment(db, created[0])
+    picture = await db.get(Picture, 1, populate_existing=True)
+
+    assert pages == [created[0:2], created[2:4], created[4:5]]
+    assert picture.comment_count == 4
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 250000)
+
+    assert decode_cursor(encode_cursor(created_at, 42), datetime, int) == (created_at, 42)
+    assert decode_cursor(None, datetime, int) is None
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not-a-cursor", datetime, int)
+    assert error.value.status_code == 400
@@ -0,0 +1,49 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database.instrumentation import query_budget
+from src.database.models import Comment, Picture
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture(scope="module")
+def preview_pictures():
+    # Seeded once per module, after the database is reset, so each test runs alone or in any order
+    async def seed():
+        async with TestingSessionLocal() as session:
+            start = datetime(2024, 5, 1)
+            for n in range(3):
+                picture = Picture(image_url=f"http://files/preview-{n}.png", description="preview", user_id=1,
+                                  created_at=start + timedelta(days=n), updated_at=start)
+                picture.comments = [Comment(text=f"{n}-{c}", user_id=1, created_at=start + timedelta(minutes=c),
+                                            updated_at=start) for c in range(n * 2)]
+                session.add(picture)
+            await session.commit()
+
+    asyncio.run(seed())
+
+
+def test_search_embeds_comment_previews_in_one_query(client, preview_pictures):
+    with query_budget(2) as stats:
+        response = client.get("/api/photos/search", params={"search_term": "preview", "include": "comments_preview",
+                                                            "comments_preview_size": 3})
+
+    assert response.status_code == 200
+    assert stats.count == 2
+    previews = {picture["image_url"]: [comment["text"] for comment in picture["comments_preview"]]
+                for picture in response.json()}
+    assert previews == {
+        "http://files/preview-0.png": [],
+        "http://files/preview-1.png": ["1-1", "1-0"],
+        "http://files/preview-2.png": ["2-3", "2-2", "2-1"],
+    }
+
+
+def test_search_without_include_has_no_previews(client, preview_pictures):
+    response = client.get("/api/photos/search", params={"search_term": "preview"})
+
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+    assert all(picture["comments_preview"] is None for picture in response.json())
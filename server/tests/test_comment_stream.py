@@ -0,0 +1,120 @@
+import asyncio
+
+import fakeredis
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from main import app
+from src.routes import photos as photos_routes
+from src.services.comment_stream import CommentBroker, StreamLimitExceeded, StreamUnavailable, comment_broker
+
+
+def test_broker_fans_out_one_subscription_and_enforces_limits():
+    async def scenario():
+        broker = CommentBroker(fakeredis.FakeAsyncRedis(), queue_size=2, max_per_client=2)
+        first = await broker.subscribe(1, "a")
+        second = await broker.subscribe(1, "b")
+        other = await broker.subscribe(2, "a")
+        with pytest.raises(StreamLimitExceeded):
+            await broker.subscribe(3, "a")
+        channels = set(broker._pubsub.channels)
+
+        await broker.publish(1, "comment.created", {"id": 10})
+        await asyncio.sleep(0.2)
+        received = [first.queue.get_nowait(), second.queue.get_nowait()]
+        assert other.queue.empty()
+
+        # A consumer that stops reading is closed instead of blocking the fan-out
+        for n in range(3):
+            await broker.publish(2, "comment.created", {"id": n})
+        await asyncio.sleep(0.2)
+        overflowed = other.closed
+
+        await broker.unsubscribe(other)
+        await asyncio.sleep(0.2)
+        remaining = set(broker._pubsub.channels)
+        await broker.stop()
+        return channels, received, overflowed, remaining, first.closed
+
+    channels, received, overflowed, remaining, closed = asyncio.run(scenario())
+
+    assert channels == {b"comments:picture:1", b"comments:picture:2"}
+    assert received == [{"event": "comment.created", "data": {"id": 10}}] * 2
+    assert overflowed == "overflow"
+    assert remaining == {b"comments:picture:1"}
+    assert closed == "shutdown"
+
+
+def test_sse_stream_sends_events_heartbeats_and_close(monkeypatch):
+    async def exists(picture_id):
+        return True
+
+    monkeypatch.setattr(photos_routes, "_picture_exists", exists)
+    monkeypatch.setattr(comment_broker, "heartbeat", 0.1)
+    monkeypatch.setattr(comment_broker, "max_duration", 0.5)
+
+    async def scenario():
+        comment_broker.init(fakeredis.FakeAsyncRedis())
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            request = asyncio.create_task(client.get("/api/photos/7/comments/stream"))
+            while not comment_broker.listeners.get(7):
+                await asyncio.sleep(0.01)
+            await comment_broker.publish(7, "comment.deleted", {"id": 3, "picture_id": 7})
+            response = await request
+        await comment_broker.stop()
+        return response
+
+    try:
+        response = asyncio.run(scenario())
+    finally:
+        comment_broker.init(None)
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    body = response.text
+    assert body.startswith("retry: 3000\n\n")
+    assert 'event: comment.deleted\ndata: {"id": 3, "picture_id": 7}\n\n' in body
+    assert ": heartbeat\n\n" in body
+    assert body.endswith('event: close\ndata: {"reason": "max_duration"}\n\n')
+    assert not comment_broker.clients
+
+
+class BrokenPubSub:
+    async def subscribe(self, *channels):
+        raise ConnectionError("Redis is down")
+
+
+class BrokenRedis:
+    def pubsub(self, **kwargs):
+        return BrokenPubSub()
+
+
+def test_unavailable_redis_refuses_streams_cleanly(monkeypatch):
+    async def exists(picture_id):
+        return True
+
+    async def scenario():
+        broker = CommentBroker(BrokenRedis())
+        with pytest.raises(StreamUnavailable):
+            await broker.subscribe(1, "a")
+        return broker.clients
+
+    assert not asyncio.run(scenario())
+
+    monkeypatch.setattr(photos_routes, "_picture_exists", exists)
+    client = TestClient(app)
+    for redis in (None, BrokenRedis()):
+        comment_broker.init(redis)
+        try:
+            response = client.get("/api/photos/7/comments/stream")
+            with pytest.raises(WebSocketDisconnect) as closed:
+                with client.websocket_connect("/api/photos/7/comments/ws"):
+                    pass
+        finally:
+            comment_broker.init(None)
+            comment_broker._pubsub = None
+        assert response.status_code == 503
+        assert closed.value.code == 1011
+    assert not comment_broker.clients
@@ -0,0 +1,70 @@
+import pytest
+from fastapi import HTTPException
+
+from src.conf.config import config
+from src.database.models import Picture, User
+from src.repository.comments import CommentRepository
+from src.schemas.comments import CommentCreate
+
+
+async def seed_threads(db):
+    db.add(User(id=1, username="author", email="author@example.com", password="x"))
+    db.add_all([Picture(id=1, image_url="http://files/1.png", user_id=1),
+                Picture(id=2, image_url="http://files/2.png", user_id=1)])
+    await db.commit()
+
+    async def post(text, parent=None):
+        return await CommentRepository.create_comment(
+            db, CommentCreate(text=text, parent_id=parent.id if parent else None), 1, 1)
+
+    a = await post("a")
+    b = await post("b")
+    a1 = await post("a1", a)
+    a1a = await post("a1a", a1)
+    a2 = await post("a2", a)
+    await post("c")
+    return a
+
+
+def texts(comments):
+    return [comment.text for comment in comments]
+
+
+@pytest.mark.asyncio
+async def test_threads_are_read_in_display_order_and_paginated(db_session, monkeypatch):
+    db = db_session
+    a = await seed_threads(db)
+    first = await CommentRepository.get_threads(db, 1, limit=2)
+    second = await CommentRepository.get_threads(db, 1, limit=2, after=first[-1].path)
+    replies = await CommentRepository.get_replies(db, a)
+
+    monkeypatch.setattr(config, "COMMENT_THREAD_PAGE_MAX", 3)
+    truncated = await CommentRepository.get_threads(db, 1, limit=2)
+    rest = await CommentRepository.get_threads(db, 1, limit=2, after=truncated[-1].path)
+
+    assert texts(first) == ["a", "a1", "a1a", "a2", "b"]
+    assert [comment.depth for comment in first] == [0, 1, 2, 1, 0]
+    assert texts(second) == ["c"]
+    assert texts(replies) == ["a1", "a1a", "a2"]
+    assert texts(truncated) == ["a", "a1", "a1a"]
+    # The rest of the cut-off thread comes first and does not count against the limit
+    assert texts(rest) == ["a2", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_deleting_a_comment_removes_its_replies_and_validates_parents(db_session, monkeypatch):
+    db = db_session
+    a = await seed_threads(db)
+    with pytest.raises(HTTPException) as foreign:
+        await CommentRepository.create_comment(db, CommentCreate(text="x", parent_id=a.id), 1, 2)
+    monkeypatch.setattr(config, "COMMENT_MAX_DEPTH", 2)
+    with pytest.raises(HTTPException) as deep:
+        await CommentRepository.create_comment(db, CommentCreate(text="x", parent_id=a.id + 2), 1, 1)
+
+    await CommentRepository.delete_comment(db, a.id)
+    remaining = await CommentRepository.get_threads(db, 1)
+    picture = await db.get(Picture, 1, populate_existing=True)
+
+    assert (foreign.value.status_code, deep.value.status_code) == (404, 400)
+    assert texts(remaining) == ["b", "c"]
+    assert picture.comment_count == 2
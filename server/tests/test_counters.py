@@ -0,0 +1,99 @@
+import asyncio
+
+import fakeredis
+import pytest
+from redis.exceptions import ConnectionError
+
+from src.database.instrumentation import query_budget
+from src.database.models import Picture, User
+from src.services.counters import PictureCounters, picture_counters
+from tests.conftest import TestingSessionLocal
+
+
+class BrokenRedis:
+    async def hincrby(self, *args):
+        raise ConnectionError("down")
+
+    def pipeline(self, *args, **kwargs):
+        raise ConnectionError("down")
+
+
+@pytest.mark.asyncio
+async def test_deltas_are_merged_into_reads_and_flushed_in_one_statement(db_sessions):
+    sessions = db_sessions
+    async with sessions() as db:
+        db.add(User(id=1, username="author", email="author@example.com", password="x"))
+        db.add_all([Picture(id=n, image_url=f"http://files/{n}.png", user_id=1, view_count=10) for n in (1, 2)])
+        await db.commit()
+
+    counters = PictureCounters(fakeredis.FakeAsyncRedis(), sessions)
+    for _ in range(3):
+        await counters.incr("views", 1)
+    await counters.incr("likes", 2)
+    # Redis is down for a moment: the increment is kept in the worker
+    counters.redis, redis = BrokenRedis(), counters.redis
+    await counters.incr("views", 2)
+    counters.redis = redis
+
+    async with sessions() as db:
+        pictures = [await db.get(Picture, n) for n in (1, 2)]
+        await counters.merge(pictures)
+        merged = [(picture.view_count, picture.like_count) for picture in pictures]
+        dirty = bool(db.dirty)
+
+    with query_budget(1) as stats:
+        flushed = await counters.flush()
+    async with sessions() as db:
+        persisted = [(picture.view_count, picture.like_count)
+                     for picture in [await db.get(Picture, n) for n in (1, 2)]]
+    pending = await counters.pending([1, 2])
+
+    assert merged == [(13, 0), (11, 1)]
+    assert not dirty
+    assert (flushed, stats.count) == (2, 1)
+    assert persisted == [(13, 0), (11, 1)]
+    assert all(not deltas for deltas in pending.values())
+
+
+def test_failed_flush_keeps_the_deltas():
+    class FailingSession:
+        async def __aenter__(self):
+            raise ConnectionError("database down")
+
+        async def __aexit__(self, *args):
+            pass
+
+    async def scenario():
+        counters = PictureCounters(fakeredis.FakeAsyncRedis(), FailingSession)
+        await counters.incr("views", 5, 2)
+        with pytest.raises(ConnectionError):
+            await counters.flush()
+        return await counters.pending([5])
+
+    pending = asyncio.run(scenario())
+
+    assert pending["views"][5] == 2
+
+
+def test_views_and_likes_through_the_api(client, get_token, fake_redis):
+    async def seed():
+        async with TestingSessionLocal() as session:
+            session.add(Picture(id=70, image_url="http://files/70.png", user_id=1))
+            await session.commit()
+
+    asyncio.run(seed())
+    headers = {"Authorization": f"Bearer {get_token}"}
+    picture_counters.local.clear()
+
+    client.get("/api/photos/70", headers=headers)
+    viewed = client.get("/api/photos/70", headers=headers).json()
+    client.post("/api/photos/70/like", headers=headers)
+    liked = client.post("/api/photos/70/like", headers=headers).json()
+    unliked = client.delete("/api/photos/70/like", headers=headers).json()
+    missing = client.post("/api/photos/9999/like", headers=headers)
+    picture_counters.local.clear()
+
+    assert viewed["view_count"] == 2
+    assert liked["like_count"] == 1
+    assert unliked["like_count"] == 0
+    assert missing.status_code == 404
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import fakeredis
+
+from src.services.denylist import BloomFilter, TokenDenylist
+from tests.test_auth_sessions import login
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f"jti-{i}" for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_sync_picks_up_revocations_from_other_workers():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis()
+        worker_a = TokenDenylist(redis, max_ttl=900)
+        worker_b = TokenDenylist(redis, max_ttl=900)
+        await worker_b.sync()
+
+        await worker_a.revoke("abc", time.time() + 60)
+        assert not await worker_b.is_revoked("abc")
+
+        await worker_b.sync()
+        assert await worker_b.is_revoked("abc")
+        assert worker_b.stats["confirmed"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_expired_tokens_are_not_revoked():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis()
+        denylist = TokenDenylist(redis, max_ttl=900)
+        await denylist.revoke("old", time.time() - 1)
+        assert not await denylist.is_revoked("old")
+        assert await redis.zcard("denylist:log") == 0
+
+    asyncio.run(scenario())
+
+
+def test_logout_revokes_access_token(client, fake_redis):
+    tokens = login(client)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/api/auth/sessions", headers=headers).status_code == 200
+
+    assert client.post("/api/auth/logout", headers=headers).status_code == 200
+
+    assert client.get("/api/auth/sessions", headers=headers).status_code == 401
+    refreshed = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert refreshed.status_code == 401
@@ -0,0 +1,78 @@
+import pytest
+from fastapi import HTTPException
+
+from src.database.instrumentation import query_budget
+from src.database.models import Picture, Role, User
+from src.repository.comments import CommentRepository
+from src.repository.photos import PictureRepository
+from src.schemas.comments import CommentCreate, CommentUpdate
+from src.services.storage import storage
+
+
+async def seed(db):
+    users = [User(id=1, username="owner", email="owner@example.com", password="x", role=Role.user),
+             User(id=2, username="other", email="other@example.com", password="x", role=Role.user),
+             User(id=3, username="admin", email="admin@example.com", password="x", role=Role.admin)]
+    db.add_all(users)
+    db.add_all([Picture(id=n, image_url=f"http://files/{n}.png", user_id=1) for n in (1, 2, 3)])
+    await db.commit()
+    # Like the authenticated user of a request, the users are not part of the mutations' session
+    db.expunge_all()
+    return users
+
+
+async def attempt(budget, call):
+    """Run a mutation under a query budget; return its result or the HTTP status it raised."""
+    with query_budget(budget) as stats:
+        try:
+            outcome = await call
+        except HTTPException as err:
+            outcome = err.status_code
+    return outcome, stats.count
+
+
+@pytest.mark.asyncio
+async def test_comment_mutations_are_single_guarded_statements(db_session):
+    db = db_session
+    await seed(db)
+    comment_id = (await CommentRepository.create_comment(db, CommentCreate(text="first"), 1, 1)).id
+    await CommentRepository.create_comment(db, CommentCreate(text="reply", parent_id=comment_id), 2, 1)
+    update = CommentUpdate(text="edited")
+    (updated, update_queries), *failures = [
+        await attempt(1, CommentRepository.update_comment(db, comment_id, update, 1)),
+        await attempt(2, CommentRepository.update_comment(db, comment_id, update, 2)),
+        await attempt(2, CommentRepository.update_comment(db, 999, update, 1)),
+        await attempt(2, CommentRepository.delete_comment(db, comment_id)),
+        await attempt(1, CommentRepository.delete_comment(db, comment_id)),
+    ]
+    picture = await db.get(Picture, 1, populate_existing=True)
+
+    assert (updated.text, update_queries) == ("edited", 1)
+    assert failures == [(403, 2), (404, 2), (None, 2), (404, 1)]
+    assert picture.comment_count == 0
+
+
+@pytest.mark.asyncio
+async def test_picture_mutations_check_ownership_in_the_statement(db_session, monkeypatch):
+    async def upload(file, **options):
+        return {"secure_url": "http://files/qr.png"}
+
+    monkeypatch.setattr(storage, "upload", upload)
+    db = db_session
+    owner, other, admin = await seed(db)
+    qrcode, forbidden_qrcode, forbidden_delete, deleted, deleted_by_admin, missing = [
+        await attempt(2, PictureRepository.create_qrcode(1, db, owner)),
+        await attempt(1, PictureRepository.create_qrcode(1, db, other)),
+        await attempt(2, PictureRepository.delete_picture(1, db, other)),
+        await attempt(1, PictureRepository.delete_picture(1, db, owner)),
+        await attempt(1, PictureRepository.delete_picture(2, db, admin)),
+        await attempt(2, PictureRepository.delete_picture(1, db, owner)),
+    ]
+
+    assert (qrcode[0].qr_code_url, qrcode[1]) == ("http://files/qr.png", 2)
+    assert forbidden_qrcode == (403, 1)
+    assert forbidden_delete == (403, 2)
+    assert (deleted[0].id, deleted[1]) == (1, 1)
+    assert (deleted_by_admin[0].id, deleted_by_admin[1]) == (2, 1)
+    assert missing == (None, 2)
+    assert await db.get(Picture, 3) is not None
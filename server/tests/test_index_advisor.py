@@ -0,0 +1,27 @@
+from bench.explain import plan_scans
+
+
+def test_postgres_plan_scans():
+    plan = [{"Plan": {"Node Type": "Limit", "Plans": [
+        {"Node Type": "Nested Loop", "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "comments", "Alias": "comments"},
+            {"Node Type": "Index Scan", "Relation Name": "pictures", "Index Name": "pictures_pkey"},
+        ]},
+    ]}}]
+
+    assert plan_scans("postgresql", plan) == ["comments"]
+
+
+def test_sqlite_plan_scans():
+    plan = [
+        (2, 0, 0, "CO-ROUTINE anon_1"),
+        (12, 2, 0, "SCAN pictures"),
+        (20, 2, 0, "SCAN users USING INDEX ix_users_email"),
+        (33, 0, 0, "MATERIALIZE (join-2)"),
+        (37, 33, 0, "SCAN tags_pictures_1"),
+        (52, 0, 0, "SCAN anon_1"),
+        (60, 0, 0, "SCAN comments_1"),
+        (80, 0, 0, "USE TEMP B-TREE FOR ORDER BY"),
+    ]
+
+    assert plan_scans("sqlite", plan) == ["pictures", "comments"]
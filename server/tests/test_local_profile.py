@@ -0,0 +1,83 @@
+import asyncio
+import io
+
+import pytest
+from fastapi_mail import MessageSchema, MessageType
+from fastapi_mail.errors import ConnectionErrors
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.conf.config import config, FaultRule
+from src.database.cache import RedisManager
+from src.services.email import CapturingMailer
+from src.services.faults import FaultInjector
+from src.services.storage import FileSystemStorage, Storage
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+
+
+def test_filesystem_storage_mimics_upload_and_explicit(tmp_path):
+    storage = Storage(FileSystemStorage(str(tmp_path), "http://files/", FaultInjector("storage")))
+
+    async def scenario():
+        uploaded = await storage.upload(io.BytesIO(PNG))
+        explicit = await storage.explicit(uploaded["public_id"], type="upload", width=100, crop="fill")
+        avatar = await storage.upload(PNG, public_id="App id №user@example.com", overwrite=True)
+        return uploaded, explicit, avatar
+
+    uploaded, explicit, avatar = asyncio.run(scenario())
+
+    assert uploaded["secure_url"] == f"http://files/{uploaded['public_id']}.png"
+    assert (tmp_path / f"{uploaded['public_id']}.png").read_bytes() == PNG
+    assert uploaded["bytes"] == len(PNG)
+    assert explicit["secure_url"] == f"http://files/{uploaded['public_id']}.png?width=100&crop=fill"
+    assert storage.url("App id №user@example.com", width=250).startswith("http://files/App%20id%20")
+    assert avatar["format"] == "png"
+    with pytest.raises(Exception, match="Resource not found"):
+        asyncio.run(storage.explicit("missing"))
+
+
+def test_faults_add_latency_and_errors(monkeypatch):
+    monkeypatch.setattr(config, "LOCAL_FAULTS", {"storage": FaultRule(latency_ms=30, error_rate=1.0)})
+    faults = FaultInjector("storage")
+
+    async def scenario():
+        start = asyncio.get_running_loop().time()
+        with pytest.raises(ConnectionError, match="Injected storage failure"):
+            await faults.apply()
+        return asyncio.get_running_loop().time() - start
+
+    assert asyncio.run(scenario()) >= 0.03
+    assert faults.injected == 1
+    asyncio.run(FaultInjector("redis").apply())
+
+
+def test_local_redis_injects_faults(monkeypatch):
+    monkeypatch.setattr(config, "SERVICE_PROFILE", "local")
+    manager = RedisManager("redis://unused", max_connections=1, pool_timeout=1, socket_timeout=1,
+                           connect_timeout=1, health_check_interval=30, retries=0)
+
+    async def scenario():
+        client = await manager.connect()
+        await client.set("key", "value")
+        assert await client.get("key") == b"value"
+        assert manager.stats()["connected"]
+        monkeypatch.setattr(config, "LOCAL_FAULTS", {"redis": FaultRule(error_rate=1.0)})
+        with pytest.raises(RedisConnectionError):
+            await client.get("key")
+        await manager.close()
+
+    asyncio.run(scenario())
+
+
+def test_capturing_mailer_keeps_messages(monkeypatch):
+    mailer = CapturingMailer()
+    message = MessageSchema(subject="Confirm your email", recipients=["user@example.com"],
+                            template_body={"token": "abc"}, subtype=MessageType.html)
+
+    asyncio.run(mailer.send_message(message, template_name="verify_email.html"))
+
+    assert mailer.messages[0]["recipients"] == ["user@example.com"]
+    assert mailer.messages[0]["template_body"] == {"token": "abc"}
+    monkeypatch.setattr(config, "LOCAL_FAULTS", {"mail": FaultRule(error_rate=1.0)})
+    with pytest.raises(ConnectionErrors):
+        asyncio.run(mailer.send_message(message))
@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+import bcrypt
+import pytest
+
+from src.services.loop_monitor import BlockingCallError, LoopMonitor, forbid_blocking_calls
+from tests.test_auth_sessions import login
+
+
+def test_monitor_measures_lag_and_captures_blocking_stack():
+    async def scenario():
+        monitor = LoopMonitor(interval=0.01, threshold=0.05, debug=True)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.2)
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(scenario())
+
+    assert monitor.max_lag >= 0.1
+    assert len(monitor.blocks) == 1
+    assert any("time.sleep(0.2)" in line for line in monitor.blocks[0]["stack"])
+
+
+def test_strict_mode_rejects_blocking_calls_on_the_loop():
+    async def scenario():
+        with pytest.raises(BlockingCallError):
+            bcrypt.hashpw(b"secret", bcrypt.gensalt(4))
+        return await asyncio.to_thread(bcrypt.hashpw, b"secret", bcrypt.gensalt(4))
+
+    with forbid_blocking_calls():
+        assert asyncio.run(scenario())
+        assert bcrypt.hashpw(b"secret", bcrypt.gensalt(4))
+
+    assert not hasattr(bcrypt.hashpw, "__wrapped__")
+
+
+def test_login_does_not_block_the_loop(client, fake_redis):
+    with forbid_blocking_calls():
+        assert login(client)["access_token"]
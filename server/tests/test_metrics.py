@@ -0,0 +1,62 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.services import metrics
+from src.services.metrics import MetricsMiddleware, Registry
+
+
+def test_middleware_labels_requests_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/missing")
+
+    samples = metrics.http_request_duration.values
+    assert samples[("GET", "/items/{item_id}", "200")][2] >= 2
+    assert ("GET", "unmatched", "404") in samples
+    assert metrics.http_requests_in_flight.values[("GET",)] == 0
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    hits = registry.counter("cache_requests_total", "Cache lookups.", ("result",))
+    latency = registry.histogram("call_seconds", "Call latency.", buckets=(0.1, 1.0))
+    hits.inc("hit")
+    hits.inc("hit")
+    latency.observe(value=0.05)
+    latency.observe(value=0.5)
+    latency.observe(value=5)
+
+    text = registry.render()
+
+    assert "# TYPE cache_requests_total counter" in text
+    assert 'cache_requests_total{result="hit"} 2' in text
+    assert 'call_seconds_bucket{le="0.1"} 1' in text
+    assert 'call_seconds_bucket{le="1.0"} 2' in text
+    assert 'call_seconds_bucket{le="+Inf"} 3' in text
+    assert "call_seconds_count 3" in text
+
+
+def test_snapshots_of_workers_are_aggregated(tmp_path, monkeypatch):
+    workers = []
+    for pid in (101, 102):
+        registry = Registry(str(tmp_path))
+        registry.counter("requests_total", "Requests.").inc(amount=pid - 100)
+        registry.histogram("call_seconds", "Call latency.", buckets=(1.0,)).observe(value=0.5)
+        monkeypatch.setattr("os.getpid", lambda pid=pid: pid)
+        registry.flush()
+        workers.append(registry)
+
+    text = workers[-1].render()
+
+    assert "requests_total 3" in text
+    assert 'call_seconds_bucket{le="1.0"} 2' in text
+    assert "call_seconds_sum 1.0" in text
+    assert len(list(tmp_path.glob("metrics-*.json"))) == 2
@@ -0,0 +1,100 @@
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from src.database.instrumentation import query_budget
+from src.database.models import Picture, User
+from src.repository.comments import CommentRepository
+from src.repository.photos import PictureRepository
+from src.schemas.comments import CommentCreate, CommentUpdate
+from src.schemas.moderation import CommentModeration, PictureModeration
+from src.services.comment_stream import comment_broker
+
+
+async def seed(db):
+    db.add_all([User(id=1, username="author", email="author@example.com", password="x"),
+                User(id=2, username="spammer", email="spammer@example.com", password="x")])
+    db.add_all([Picture(id=1, image_url="http://files/1.png", description="Sunset", user_id=1),
+                Picture(id=2, image_url="http://files/2.png", description="Buy 100% CHEAP", user_id=2),
+                Picture(id=3, image_url="http://files/3.png", description="Beach", user_id=2)])
+    await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_bulk_comment_moderation_is_one_statement_per_batch(db_session, monkeypatch):
+    db = db_session
+    published = []
+
+    async def publish_many(events):
+        published.append(list(events))
+
+    monkeypatch.setattr(comment_broker, "publish_many", publish_many)
+    await seed(db)
+
+    async def post(text, user_id, picture_id, parent=None):
+        return await CommentRepository.create_comment(
+            db, CommentCreate(text=text, parent_id=parent.id if parent else None), user_id, picture_id)
+
+    spam = await post("spam", 2, 1)
+    await post("reply to spam", 1, 1, spam)
+    await post("spam again", 2, 2)
+    kept = await post("kept", 1, 1)
+    published.clear()
+
+    with query_budget(2) as stats:
+        hidden = await CommentRepository.moderate_comments(db, CommentModeration(action="hide", user_id=2))
+    visible = await CommentRepository.get_comments(db, 1)
+    # The author cannot edit, and so rebroadcast, a hidden comment
+    with pytest.raises(HTTPException) as edit:
+        await CommentRepository.update_comment(db, spam.id, CommentUpdate(text="still spam"), 2)
+    counts = [(await db.get(Picture, n, populate_existing=True)).comment_count for n in (1, 2)]
+    unhidden = await CommentRepository.moderate_comments(db, CommentModeration(action="unhide", ids=[spam.id]))
+    deleted = await CommentRepository.moderate_comments(
+        db, CommentModeration(action="delete", picture_id=1, text_contains="SPAM"))
+    remaining = await CommentRepository.get_comments(db, 1)
+
+    assert stats.count == 2
+    # The reply is hidden with the spam it answers
+    assert hidden == (3, 2)
+    assert [comment.text for comment in visible] == ["kept"]
+    assert edit.value.status_code == 404
+    assert counts == [1, 0]
+    assert unhidden == (2, 1)
+    assert deleted == (2, 1)
+    assert [comment.id for comment in remaining] == [kept.id]
+    # One publish per batch, one event per affected picture
+    assert len(published) == 3
+    assert sorted(event[0] for event in published[0]) == [1, 2]
+    assert published[0][0][1] == "comments.moderated"
+
+
+@pytest.mark.asyncio
+async def test_bulk_picture_moderation(db_session):
+    db = db_session
+    await seed(db)
+    with query_budget(1) as stats:
+        hidden = await PictureRepository.moderate_pictures(
+            db, PictureModeration(action="hide", description_contains="100%"))
+    hidden_again = await PictureRepository.moderate_pictures(db, PictureModeration(action="hide", ids=[2]))
+    found = sorted(picture.id for picture in await PictureRepository.search_pictures(db))
+    # Hidden is missing everywhere, not only in search
+    with pytest.raises(HTTPException) as comment:
+        await CommentRepository.create_comment(db, CommentCreate(text="hello"), 1, 2)
+    by_id = [await PictureRepository.get_picture(2, db), await PictureRepository.like_picture(2, 1, db),
+             await PictureRepository.get_tags(2, 2, db), await CommentRepository.get_comments(db, 2)]
+    deleted = await PictureRepository.moderate_pictures(db, PictureModeration(action="delete", user_id=2))
+    after_delete = await PictureRepository.search_pictures(db)
+
+    assert (stats.count, hidden, hidden_again) == (1, 1, 0)
+    assert found == [1, 3]
+    assert comment.value.status_code == 404
+    assert by_id == [None, None, None, []]
+    assert deleted == 2
+    assert [picture.id for picture in after_delete] == [1]
+
+
+def test_moderation_requires_a_selection():
+    with pytest.raises(ValidationError):
+        CommentModeration(action="delete")
+    with pytest.raises(ValidationError):
+        PictureModeration(action="hide", ids=[])
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from sqlalchemy import select
+
+from src.conf.config import config
+from src.database.models import Picture, Tag
+from src.repository.photos import PictureRepository
+from tests.conftest import TestingSessionLocal
+
+
+def seed_pictures():
+    async def seed():
+        async with TestingSessionLocal() as session:
+            sea = Tag(name="transfer-sea")
+            session.add_all([Picture(image_url=f"http://files/transfer-{n}.png", description=f"transfer {n}", user_id=1,
+                                     tags=[sea, Tag(name=f"transfer-{n}")] if n else [])
+                             for n in range(3)])
+            await session.commit()
+
+    asyncio.run(seed())
+
+
+def test_picture_metadata_round_trips_through_export_and_import(client, get_token, fake_redis, route_sessions,
+                                                                monkeypatch):
+    monkeypatch.setattr(config, "PICTURE_TRANSFER_BATCH_SIZE", 2)
+    seed_pictures()
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    export = client.get("/api/admin/pictures/export", headers=headers)
+    lines = [json.loads(line) for line in export.text.splitlines()]
+    exported = {line["image_url"]: line for line in lines if line["image_url"].startswith("http://files/transfer-")}
+    assert export.headers["content-type"] == "application/x-ndjson"
+    assert exported["http://files/transfer-0.png"]["tags"] == []
+    assert exported["http://files/transfer-2.png"]["tags"] == ["transfer-2", "transfer-sea"]
+    assert exported["http://files/transfer-1.png"]["comment_count"] == 0
+    assert route_sessions.pool_stats()["checked_out"] == 0
+
+    # Re-importing the export is a no-op; new lines are created and tags are resolved or created in bulk
+    imported = [dict(exported["http://files/transfer-1.png"], tags=["transfer-1", "transfer-new"]),
+                {"image_url": "http://files/imported-1.png", "user_id": 1, "tags": ["transfer-sea", "transfer-new"]},
+                {"image_url": "http://files/imported-2.png", "user_id": 1, "description": "imported"},
+                {"image_url": "http://files/imported-3.png", "user_id": 1, "hidden": True, "view_count": 7,
+                 "like_count": 2}]
+    body = "".join(json.dumps(line) + "\n" for line in lines + imported)
+    first = client.post("/api/admin/pictures/import", content=body.encode(), headers=headers)
+    again = client.post("/api/admin/pictures/import", content=body.encode(), headers=headers)
+    invalid = client.post("/api/admin/pictures/import", content=b'{"image_url": "x"}\n', headers=headers)
+    long_tag = client.post("/api/admin/pictures/import", headers=headers, content=(
+        '{"image_url": "http://files/ok.png", "user_id": 1}\n\n'
+        '{"image_url": "http://files/long.png", "user_id": 1, "tags": ["%s"]}\n' % ("x" * 51)).encode())
+    comma_tag = client.post("/api/admin/pictures/import", headers=headers,
+                            content=b'{"image_url": "http://files/comma.png", "user_id": 1, "tags": ["a,b"]}\n')
+    unknown_author = client.post("/api/admin/pictures/import", headers=headers, content=(
+        '{"image_url": "http://files/a.png", "user_id": 1}\n'
+        '{"image_url": "http://files/b.png", "user_id": 9999}\n').encode())
+
+    async def tags_of(image_url):
+        async with TestingSessionLocal() as session:
+            tags = await PictureRepository.get_tags(
+                (await session.execute(Picture.__table__.select().where(Picture.image_url == image_url))).first().id,
+                1, session)
+            return sorted(tags)
+
+    async def state(image_url):
+        async with TestingSessionLocal() as session:
+            return tuple((await session.execute(select(Picture.hidden, Picture.view_count, Picture.like_count)
+                                                .where(Picture.image_url == image_url))).one())
+
+    assert first.json() == {"records": len(lines) + 4, "created": 3}
+    assert again.json() == {"records": len(lines) + 4, "created": 0}
+    assert invalid.status_code == 400
+    assert invalid.json()["detail"].startswith("Line 1:")
+    assert (long_tag.status_code, long_tag.json()["detail"][:7]) == (400, "Line 3:")
+    assert (comma_tag.status_code, comma_tag.json()["detail"][:7]) == (400, "Line 1:")
+    assert unknown_author.status_code == 400
+    assert unknown_author.json()["detail"] == "Line 2: Unknown user_id 9999"
+    assert asyncio.run(tags_of("http://files/transfer-1.png")) == ["transfer-1", "transfer-new", "transfer-sea"]
+    assert asyncio.run(tags_of("http://files/imported-1.png")) == ["transfer-new", "transfer-sea"]
+    assert asyncio.run(tags_of("http://files/imported-2.png")) == []
+    # Moderation, views and likes survive a migration
+    assert asyncio.run(state("http://files/imported-3.png")) == (True, 7, 2)
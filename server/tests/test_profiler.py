@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+from src.conf.config import config
+from src.services import profiler
+from src.services.profiler import ProfileStore, SamplingProfiler, to_collapsed
+from tests.test_auth_sessions import login
+
+
+def test_profiler_samples_the_running_task():
+    async def busy():
+        sampler = SamplingProfiler(threading.get_ident(), asyncio.current_task(), 0.001)
+        sampler.start()
+        deadline = asyncio.get_running_loop().time() + 0.05
+        while asyncio.get_running_loop().time() < deadline:
+            sum(range(1000))
+        await asyncio.sleep(0.03)
+        sampler.stop()
+        return sampler.speedscope("busy")
+
+    document = asyncio.run(busy())
+
+    collapsed = to_collapsed(document)
+    assert "busy" in collapsed
+    assert profiler.WAITING_FRAME in collapsed
+    assert document["profiles"][0]["endValue"] >= 80
+
+
+def test_store_keeps_newest_profiles(tmp_path):
+    store = ProfileStore(str(tmp_path), max_profiles=2)
+    for n in range(3):
+        store.save(f"{n:032x}", {"n": n}, {"created_at": n})
+
+    assert [meta["id"] for meta in store.list()] == [f"{2:032x}", f"{1:032x}"]
+    assert store.load(f"{0:032x}") is None
+    assert store.load("../../etc/passwd") is None
+
+
+def test_admin_profiles_request_on_demand(client, fake_redis, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler.profile_store, "directory", str(tmp_path))
+    headers = {"Authorization": f"Bearer {login(client)['access_token']}"}
+    client.get("/api/users/me", headers=headers)
+
+    assert "X-Profile-Id" not in client.get("/api/users/me", headers=headers).headers
+    assert "X-Profile-Id" not in client.get("/api/users/me", headers={"X-Profile": "1"}).headers
+    response = client.get("/api/users/me", headers={**headers, "X-Profile": "1"})
+    profile_id = response.headers["X-Profile-Id"]
+
+    profiles = client.get("/api/admin/profiles", headers=headers).json()
+    assert profiles[0]["id"] == profile_id
+    assert profiles[0]["name"] == "GET /api/users/me"
+    document = client.get(f"/api/admin/profiles/{profile_id}", headers=headers).json()
+    assert document["profiles"][0]["type"] == "sampled"
+    assert client.get(f"/api/admin/profiles/{profile_id}?format=collapsed", headers=headers).status_code == 200
+    assert client.get(f"/api/admin/profiles/{'0' * 32}", headers=headers).status_code == 404
+
+
+def test_global_sampling_rate(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler.profile_store, "directory", str(tmp_path))
+    monkeypatch.setattr(config, "PROFILE_SAMPLE_RATE", 1.0)
+
+    assert "X-Profile-Id" in client.get("/").headers
+
+
+def test_failing_admin_check_runs_request_unprofiled(client, tmp_path, monkeypatch):
+    async def broken(token, db):
+        raise ConnectionError("Redis is down")
+
+    monkeypatch.setattr(profiler.profile_store, "directory", str(tmp_path))
+    monkeypatch.setattr(profiler.auth_service, "get_current_user", broken)
+
+    response = client.get("/", headers={"Authorization": "Bearer token", "X-Profile": "1"})
+
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from src.conf.config import config
+from src.database.instrumentation import QueryBudgetExceeded, QueryStats, fingerprint, query_budget
+from src.database.models import Tag
+from src.repository.photos import PictureRepository
+from tests.conftest import TestingSessionLocal
+
+
+def test_fingerprint_ignores_literals_and_in_lists():
+    assert fingerprint("SELECT * FROM t WHERE id = 1 AND x IN (1, 2)") == \
+        fingerprint("SELECT *  FROM t\nWHERE id = 42 AND x IN (7)")
+
+
+def test_repeated_statements_are_flagged_with_call_site(monkeypatch):
+    monkeypatch.setattr(config, "QUERY_REPEAT_THRESHOLD", 2)
+    stats = QueryStats()
+    for tag_id in range(3):
+        stats.record(f"SELECT * FROM tags WHERE id = {tag_id}", 0.001, True)
+
+    [(shape, count, site)] = stats.repeated(2)
+    assert shape == "SELECT * FROM tags WHERE id = ?"
+    assert count == 3
+    assert site == "unknown"
+
+
+def test_budget_reports_repository_call_site():
+    async def scenario():
+        async with TestingSessionLocal() as session:
+            with pytest.raises(QueryBudgetExceeded) as exc:
+                with query_budget(1):
+                    for name in ("a", "b"):
+                        await session.execute(select(Tag).filter(Tag.name == name))
+                    await PictureRepository.get_picture(1, session)
+            return str(exc.value)
+
+    message = asyncio.run(scenario())
+    assert "3 queries issued, budget is 1" in message
+    assert "src/repository/photos.py" in message
+
+
+def test_endpoint_query_budget(client):
+    with query_budget(1) as stats:
+        response = client.get("/api/photos/search", params={"search_term": "cat"})
+
+    assert response.status_code == 200
+    assert stats.count == 1
@@ -0,0 +1,82 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from src.conf.config import config, RateLimitRule
+from src.services.rate_limit import LocalRateLimiter, RateLimiter, rate_limiter
+from tests.conftest import test_user
+
+TOKEN_BUCKET = RateLimitRule(algorithm="token_bucket", limit=2, period=1, burst=3)
+SLIDING_WINDOW = RateLimitRule(limit=3, period=10)
+
+
+@pytest.fixture()
+def strict_login(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setitem(config.RATE_LIMITS, "login", RateLimitRule(limit=2, period=60))
+    rate_limiter.local.clear()
+    yield
+    rate_limiter.local.clear()
+
+
+def test_local_token_bucket_refills():
+    limiter = LocalRateLimiter()
+    results = [limiter.hit("k", TOKEN_BUCKET, now=100.0).allowed for _ in range(4)]
+    assert results == [True, True, True, False]
+    assert limiter.hit("k", TOKEN_BUCKET, now=100.5).allowed
+    assert not limiter.hit("k", TOKEN_BUCKET, now=100.5).allowed
+
+
+def test_local_sliding_window_weights_previous_window():
+    limiter = LocalRateLimiter()
+    assert all(limiter.hit("k", SLIDING_WINDOW, now=5.0).allowed for _ in range(3))
+    assert not limiter.hit("k", SLIDING_WINDOW, now=9.0).allowed
+    # Halfway through the next window the previous one still counts for 1.5 requests.
+    assert limiter.hit("k", SLIDING_WINDOW, now=15.0).allowed
+    assert not limiter.hit("k", SLIDING_WINDOW, now=15.0).allowed
+
+
+@pytest.mark.parametrize("rule", [TOKEN_BUCKET, SLIDING_WINDOW])
+def test_redis_scripts_match_local_limiter(rule):
+    async def scenario():
+        limiter = RateLimiter()
+        limiter.init(fakeredis.FakeAsyncRedis())
+        results = [(await limiter.hit("k", rule)).allowed for _ in range(4)]
+        assert results == [True, True, True, False]
+        assert limiter.stats["redis"] == 4
+
+    asyncio.run(scenario())
+
+
+def test_slow_redis_falls_back_to_local_limiter():
+    class SlowScript:
+        async def __call__(self, keys, args):
+            await asyncio.sleep(1)
+
+    class SlowRedis:
+        def register_script(self, script):
+            return SlowScript()
+
+    async def scenario():
+        limiter = RateLimiter()
+        limiter.init(SlowRedis())
+        assert (await limiter.hit("k", SLIDING_WINDOW)).allowed
+        assert (await limiter.hit("k", SLIDING_WINDOW)).allowed
+        assert limiter.stats == {"redis": 0, "local": 2, "fallbacks": 1, "denied": 0}
+
+    asyncio.run(scenario())
+
+
+def test_route_returns_headers_and_429(client, fake_redis, strict_login):
+    data = {"username": test_user["email"], "password": test_user["password"]}
+
+    first = client.post("/api/auth/login", data=data)
+    assert first.status_code == 200
+    assert first.headers["RateLimit-Limit"] == "2"
+    assert first.headers["RateLimit-Remaining"] == "1"
+
+    client.post("/api/auth/login", data=data)
+    blocked = client.post("/api/auth/login", data=data)
+    assert blocked.status_code == 429
+    assert int(blocked.headers["Retry-After"]) > 0
@@ -0,0 +1,68 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from sqlalchemy import select
+from starlette.requests import Request
+
+from src.database import db as db_module
+from src.database.db import DatabaseSessionManager, get_db, get_read_db
+from src.database.models import Base, Tag
+from src.services.auth import auth_service
+
+
+def make_request(token=None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request({"type": "http", "headers": headers})
+
+
+async def make_manager(tmp_path):
+    manager = DatabaseSessionManager(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}",
+                                     replica_urls=[f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"],
+                                     max_lag=1, sticky_window=60)
+    for engine, name in ((manager._engine, "primary"), (manager.replicas[0].engine, "replica")):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(Tag.__table__.insert().values(name=name))
+    return manager
+
+
+async def read_tag(session):
+    return (await session.execute(select(Tag.name))).scalar_one()
+
+
+def test_reads_go_to_healthy_replica_and_fail_over(tmp_path):
+    async def scenario():
+        manager = await make_manager(tmp_path)
+        async with manager.read_session() as session:
+            assert await read_tag(session) == "replica"
+        async with manager.read_session(primary=True) as session:
+            assert await read_tag(session) == "primary"
+
+        manager.replicas[0].lag_sql = "SELECT 5"
+        await manager.check_replicas()
+        assert not manager.replicas[0].healthy
+        async with manager.read_session() as session:
+            assert await read_tag(session) == "primary"
+        await manager.close()
+
+    asyncio.run(scenario())
+
+
+def test_writer_reads_own_writes_from_primary(tmp_path, monkeypatch):
+    async def scenario():
+        manager = await make_manager(tmp_path)
+        monkeypatch.setattr(db_module, "sessionmanager", manager)
+        token = await auth_service.create_access_token(data={"sub": "writer@example.com"})
+
+        async with asynccontextmanager(get_db)(make_request(token)) as session:
+            session.add(Tag(name="new"))
+            await session.commit()
+            # Marked by the commit, before the dependency is torn down and the response is sent
+            assert await manager.sticky.is_sticky("writer@example.com")
+
+        for request, expected in ((make_request(token), "primary"), (make_request(), "replica")):
+            async with asynccontextmanager(get_read_db)(request) as session:
+                assert (await session.execute(select(Tag.name).order_by(Tag.id))).scalars().first() == expected
+        await manager.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,28 @@
+import asyncio
+
+import fakeredis
+
+from src.database.cache import InstrumentedConnectionPool, RedisManager
+
+
+def test_pool_stats_track_checkouts_and_waits():
+    async def scenario():
+        manager = RedisManager("redis://localhost", max_connections=1, pool_timeout=1, socket_timeout=1,
+                               connect_timeout=1, health_check_interval=30, retries=0)
+        assert manager.stats() == {"connected": False}
+
+        client = fakeredis.FakeAsyncRedis(connection_pool_class=InstrumentedConnectionPool, max_connections=1)
+        manager._client, manager._pool = client, client.connection_pool
+
+        await asyncio.gather(*(client.set(f"k{i}", i) for i in range(5)))
+
+        stats = manager.stats()
+        assert stats["checkouts"] == 5
+        assert stats["in_use"] == 0
+        assert stats["idle"] == 1
+        assert stats["max_connections"] == 1
+        assert stats["wait_seconds_max"] >= 0
+        await manager.close()
+        assert manager.stats() == {"connected": False}
+
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.conf.config import config
+from src.database.instrumentation import QueryStatsMiddleware, current_query_stats
+
+
+def make_client(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'sql.db'}")
+    app = FastAPI()
+    app.add_middleware(QueryStatsMiddleware)
+
+    @app.get("/queries/{n}")
+    async def queries(n: int):
+        async with engine.connect() as conn:
+            for _ in range(n):
+                await conn.execute(text("SELECT 1"))
+        return {"count": current_query_stats().count}
+
+    return TestClient(app)
+
+
+def test_server_timing_reports_request_queries(tmp_path):
+    client = make_client(tmp_path)
+
+    response = client.get("/queries/3")
+
+    assert response.json() == {"count": 3}
+    assert 'desc="3 queries"' in response.headers["Server-Timing"]
+    assert 'desc="0 queries"' in client.get("/queries/0").headers["Server-Timing"]
+
+
+def test_slow_queries_are_logged(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(config, "SLOW_QUERY_MS", 0)
+    client = make_client(tmp_path)
+
+    with caplog.at_level(logging.WARNING, logger="src.database.sql"):
+        client.get("/queries/1")
+
+    assert any('"event": "slow_query"' in record.message and "SELECT 1" in record.message
+               for record in caplog.records)